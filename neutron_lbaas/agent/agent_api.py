@@ -22,6 +22,8 @@ class LbaasAgentApi(object):
 
     # history
     #   1.0 Initial version
+    #   1.1 Add get_loadbalancers
+    #   1.2 Add get_loadbalancer_revisions
 
     def __init__(self, topic, context, host):
         self.context = context
@@ -33,11 +35,21 @@ class LbaasAgentApi(object):
         cctxt = self.client.prepare()
         return cctxt.call(self.context, 'get_ready_devices', host=self.host)
 
+    def get_loadbalancer_revisions(self):
+        cctxt = self.client.prepare(version='1.2')
+        return cctxt.call(self.context, 'get_loadbalancer_revisions',
+                          host=self.host)
+
     def get_loadbalancer(self, loadbalancer_id):
         cctxt = self.client.prepare()
         return cctxt.call(self.context, 'get_loadbalancer',
                           loadbalancer_id=loadbalancer_id)
 
+    def get_loadbalancers(self, loadbalancer_ids):
+        cctxt = self.client.prepare(version='1.1')
+        return cctxt.call(self.context, 'get_loadbalancers',
+                          loadbalancer_ids=loadbalancer_ids)
+
     def loadbalancer_deployed(self, loadbalancer_id):
         cctxt = self.client.prepare()
         return cctxt.call(self.context, 'loadbalancer_deployed',
@@ -70,3 +82,8 @@ class LbaasAgentApi(object):
         cctxt = self.client.prepare()
         return cctxt.call(self.context, 'update_loadbalancer_stats',
                           loadbalancer_id=loadbalancer_id, stats=stats)
+
+    def update_loadbalancers_stats(self, stats):
+        cctxt = self.client.prepare(version='1.3')
+        return cctxt.call(self.context, 'update_loadbalancers_stats',
+                          stats=stats)
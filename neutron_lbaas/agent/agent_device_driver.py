@@ -65,6 +65,10 @@ class AgentDeviceDriver(object):
         # Not all drivers will support this
         raise NotImplementedError()
 
+    def get_metrics(self):
+        """Returns driver counters reported along with the agent state."""
+        return {}
+
 
 @six.add_metaclass(abc.ABCMeta)
 class BaseManager(object):
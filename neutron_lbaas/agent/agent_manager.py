@@ -13,10 +13,14 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import collections
+import time
+
+import eventlet
 from neutron.agent import rpc as agent_rpc
 from neutron.common import exceptions as n_exc
 from neutron import context as ncontext
-from neutron.i18n import _LE, _LI
+from neutron.i18n import _LE, _LI, _LW
 from neutron.openstack.common import loopingcall
 from neutron.openstack.common import periodic_task
 from neutron.plugins.common import constants
@@ -25,8 +29,10 @@ from oslo_config import cfg
 from oslo_log import log as logging
 import oslo_messaging
 from oslo_utils import importutils
+import six
 
 from neutron_lbaas.agent import agent_api
+from neutron_lbaas.agent import stats_reporter
 from neutron_lbaas.drivers.common import agent_driver_base
 from neutron_lbaas.services.loadbalancer import constants as lb_const
 from neutron_lbaas.services.loadbalancer import data_models
@@ -42,6 +48,65 @@ OPTS = [
                  'namespace_driver.HaproxyNSDriver'],
         help=_('Drivers used to manage loadbalancing devices'),
     ),
+    cfg.IntOpt(
+        'resync_workers',
+        default=8,
+        help=_('Number of loadbalancers reloaded concurrently when the '
+               'agent resyncs its state with the server'),
+    ),
+    cfg.IntOpt(
+        'resync_chunk_size',
+        default=50,
+        help=_('Number of loadbalancers fetched from the server in a single '
+               'call when the agent resyncs its state'),
+    ),
+    cfg.FloatOpt(
+        'update_coalesce_window',
+        default=0.5,
+        help=_('Seconds during which changes to the listeners, pools, '
+               'members and health monitors of a loadbalancer are collected '
+               'before being deployed together in a single update. 0 '
+               'deploys every change as soon as it arrives'),
+    ),
+    cfg.IntOpt(
+        'stats_interval',
+        default=6,
+        help=_('Seconds between two collections of loadbalancer statistics. '
+               'The interval grows, up to stats_max_interval, while '
+               'collections take longer than it. 0 disables statistics'),
+    ),
+    cfg.IntOpt(
+        'stats_max_interval',
+        default=60,
+        help=_('Maximum number of seconds between two collections of '
+               'loadbalancer statistics'),
+    ),
+    cfg.IntOpt(
+        'stats_workers',
+        default=8,
+        help=_('Number of loadbalancers whose statistics are collected '
+               'concurrently'),
+    ),
+    cfg.IntOpt(
+        'stats_poll_timeout',
+        default=5,
+        help=_('Seconds to wait for the statistics of a single '
+               'loadbalancer before skipping it'),
+    ),
+    cfg.FloatOpt(
+        'stats_change_threshold',
+        default=0,
+        help=_('Minimum change, in percent of the last reported value, of '
+               'any statistic of a loadbalancer for its statistics to be '
+               'reported again. 0 reports every change'),
+    ),
+    cfg.IntOpt(
+        'stats_full_report_interval',
+        default=10,
+        help=_('Number of statistics collections after which the '
+               'statistics of all loadbalancers are reported, changed or '
+               'not'),
+    ),
 ]
 
 
@@ -53,7 +118,8 @@ class LbaasAgentManager(periodic_task.PeriodicTasks):
 
     # history
     #   1.0 Initial version
-    target = oslo_messaging.Target(version='1.0')
+    #   1.1 Added batch_members
+    target = oslo_messaging.Target(version='1.1')
 
     def __init__(self, conf):
         super(LbaasAgentManager, self).__init__()
@@ -80,6 +146,16 @@ class LbaasAgentManager(periodic_task.PeriodicTasks):
         self.needs_resync = False
         # pool_id->device_driver_name mapping used to store known instances
         self.instance_mapping = {}
+        # loadbalancer_id->revision of the graph deployed by the last resync
+        self.deployed_revisions = {}
+        # loadbalancer_id->driver calls waiting for the coalesce window
+        self.pending_calls = {}
+        # loadbalancers whose coalesced driver calls are being deployed
+        self.flushing_loadbalancers = set()
+        self.stats_reporter = stats_reporter.StatsReporter(
+            threshold=self.conf.stats_change_threshold,
+            full_report_interval=self.conf.stats_full_report_interval)
+        self._setup_stats_collection()
 
     def _load_drivers(self):
         self.device_drivers = {}
@@ -112,10 +188,31 @@ class LbaasAgentManager(periodic_task.PeriodicTasks):
                 self._report_state)
             heartbeat.start(interval=report_interval)
 
+    def _setup_stats_collection(self):
+        self.stats_scheduler = stats_reporter.StatsScheduler(
+            self.conf.stats_interval, self.conf.stats_max_interval)
+        if self.conf.stats_interval:
+            collector = loopingcall.DynamicLoopingCall(
+                self._collect_stats_tick)
+            collector.start(initial_delay=self.conf.stats_interval)
+
+    def _collect_stats_tick(self):
+        start = time.time()
+        try:
+            self.collect_stats(self.context)
+        except Exception:
+            LOG.exception(_LE('Failed collecting loadbalancer statistics'))
+        return self.stats_scheduler.tick_done(time.time() - start)
+
     def _report_state(self):
         try:
             instance_count = len(self.instance_mapping)
             self.agent_state['configurations']['instances'] = instance_count
+            self.agent_state['configurations']['driver_metrics'] = dict(
+                (name, driver.get_metrics())
+                for name, driver in self.device_drivers.items())
+            self.agent_state['configurations']['stats_metrics'] = (
+                self.stats_scheduler.get_metrics())
             self.state_rpc.report_state(self.context, self.agent_state)
             self.agent_state.pop('start_flag', None)
         except Exception:
@@ -130,31 +227,65 @@ class LbaasAgentManager(periodic_task.PeriodicTasks):
             self.needs_resync = False
             self.sync_state()
 
-    @periodic_task.periodic_task(spacing=6)
     def collect_stats(self, context):
-        for loadbalancer_id, driver_name in self.instance_mapping.items():
-            driver = self.device_drivers[driver_name]
-            try:
-                stats = driver.loadbalancer.get_stats(loadbalancer_id)
-                if stats:
-                    self.plugin_rpc.update_loadbalancer_stats(
-                        loadbalancer_id, stats)
-            except Exception:
-                LOG.exception(_LE('Error updating statistics on loadbalancer'
-                                  ' %s'),
-                              loadbalancer_id)
-                self.needs_resync = True
+        # a stuck haproxy socket only holds up its own green thread
+        pool = eventlet.GreenPool(max(1, self.conf.stats_workers))
+        all_stats = dict(
+            (loadbalancer_id, stats) for loadbalancer_id, stats in pool.imap(
+                self._get_loadbalancer_stats, list(self.instance_mapping))
+            if stats)
+
+        changed_stats = self.stats_reporter.get_changed(all_stats)
+        if not changed_stats:
+            return
+        try:
+            # report every loadbalancer's statistics in a single message
+            self.plugin_rpc.update_loadbalancers_stats(changed_stats)
+            self.stats_reporter.reported(changed_stats)
+        except Exception:
+            LOG.exception(_LE('Error reporting statistics of %d '
+                              'loadbalancers'), len(changed_stats))
+
+    def _get_loadbalancer_stats(self, loadbalancer_id):
+        driver_name = self.instance_mapping.get(loadbalancer_id)
+        if not driver_name:
+            return loadbalancer_id, None
+        driver = self.device_drivers[driver_name]
+        try:
+            with eventlet.Timeout(self.conf.stats_poll_timeout or None):
+                return (loadbalancer_id,
+                        driver.loadbalancer.get_stats(loadbalancer_id))
+        except eventlet.Timeout:
+            LOG.warning(_LW('Timed out collecting statistics of '
+                            'loadbalancer %s'), loadbalancer_id)
+        except Exception:
+            LOG.exception(_LE('Error updating statistics on loadbalancer %s'),
+                          loadbalancer_id)
+            # make sure the next resync redeploys it
+            self.deployed_revisions.pop(loadbalancer_id, None)
+            self.needs_resync = True
+        return loadbalancer_id, None
 
     def sync_state(self):
         known_instances = set(self.instance_mapping.keys())
         try:
-            ready_instances = set(self.plugin_rpc.get_ready_devices())
+            revisions = self.plugin_rpc.get_loadbalancer_revisions()
+            ready_instances = set(revisions)
 
             for deleted_id in known_instances - ready_instances:
                 self._destroy_loadbalancer(deleted_id)
 
-            for loadbalancer_id in ready_instances:
-                self._reload_loadbalancer(loadbalancer_id)
+            # only reload the loadbalancers whose graph moved since they were
+            # last deployed
+            stale_instances = set(
+                lb_id for lb_id in ready_instances
+                if lb_id not in self.instance_mapping or
+                self.deployed_revisions.get(lb_id) != revisions[lb_id])
+            LOG.debug('%(unchanged)d of %(ready)d loadbalancers are '
+                      'unchanged since their last deploy',
+                      {'unchanged': len(ready_instances - stale_instances),
+                       'ready': len(ready_instances)})
+            self._reload_loadbalancers(stale_instances, revisions)
 
         except Exception:
             LOG.exception(_LE('Unable to retrieve ready devices'))
@@ -169,10 +300,63 @@ class LbaasAgentManager(periodic_task.PeriodicTasks):
         driver_name = self.instance_mapping[loadbalancer_id]
         return self.device_drivers[driver_name]
 
-    def _reload_loadbalancer(self, loadbalancer_id):
+    def _reload_loadbalancers(self, loadbalancer_ids, revisions=None):
+        """Reloads loadbalancers on a bounded pool of green threads.
+
+        Loadbalancers are fetched from the server in chunks; while a chunk is
+        being fetched the loadbalancers of the previous chunks are deployed.
+        Each deploy is isolated: a failure only flags the agent for another
+        resync and does not stop the remaining loadbalancers from loading.
+        The revision of every successfully deployed loadbalancer is
+        remembered so later resyncs can skip it while it stays unchanged.
+        """
+        if not loadbalancer_ids:
+            return
+
+        results = []
+
+        def _timed_deploy(loadbalancer_dict):
+            loadbalancer_id = loadbalancer_dict['id']
+            start = time.time()
+            deployed = self._deploy_loadbalancer(loadbalancer_dict)
+            results.append((deployed, time.time() - start))
+            if deployed and revisions:
+                self.deployed_revisions[loadbalancer_id] = revisions.get(
+                    loadbalancer_id)
+
+        loadbalancer_ids = list(loadbalancer_ids)
+        chunk_size = max(1, self.conf.resync_chunk_size)
+        workers = max(1, self.conf.resync_workers)
+        pool = eventlet.GreenPool(workers)
+        start = time.time()
+        for i in six.moves.xrange(0, len(loadbalancer_ids), chunk_size):
+            chunk = loadbalancer_ids[i:i + chunk_size]
+            try:
+                loadbalancer_dicts = self.plugin_rpc.get_loadbalancers(chunk)
+            except Exception:
+                LOG.exception(_LE('Unable to retrieve loadbalancers: %s'),
+                              ', '.join(chunk))
+                self.needs_resync = True
+                continue
+            for loadbalancer_dict in loadbalancer_dicts:
+                pool.spawn_n(_timed_deploy, loadbalancer_dict)
+        pool.waitall()
+        elapsed = time.time() - start
+
+        latencies = [latency for deployed, latency in results] or [0]
+        LOG.info(_LI('Reloaded %(deployed)d of %(total)d loadbalancers in '
+                     '%(elapsed).2fs using %(workers)d workers (average '
+                     '%(avg).2fs, max %(max).2fs per loadbalancer)'),
+                 {'deployed': len([r for r in results if r[0]]),
+                  'total': len(loadbalancer_ids),
+                  'elapsed': elapsed,
+                  'workers': workers,
+                  'avg': sum(latencies) / len(latencies),
+                  'max': max(latencies)})
+
+    def _deploy_loadbalancer(self, loadbalancer_dict):
+        loadbalancer_id = loadbalancer_dict['id']
         try:
-            loadbalancer_dict = self.plugin_rpc.get_loadbalancer(
-                loadbalancer_id)
             loadbalancer = data_models.LoadBalancer.from_dict(
                 loadbalancer_dict)
             driver_name = loadbalancer.provider.device_driver
@@ -180,22 +364,25 @@ class LbaasAgentManager(periodic_task.PeriodicTasks):
                 LOG.error(_LE('No device driver on agent: %s.'), driver_name)
                 self.plugin_rpc.update_status(
                     'loadbalancer', loadbalancer_id, constants.ERROR)
-                return
+                return False
 
             self.device_drivers[driver_name].deploy_instance(loadbalancer)
             self.instance_mapping[loadbalancer_id] = driver_name
             self.plugin_rpc.loadbalancer_deployed(loadbalancer_id)
+            return True
         except Exception:
             LOG.exception(_LE('Unable to deploy instance for '
                               'loadbalancer: %s'),
                           loadbalancer_id)
             self.needs_resync = True
+            return False
 
     def _destroy_loadbalancer(self, lb_id):
         driver = self._get_driver(lb_id)
         try:
             driver.undeploy_instance(lb_id, delete_namespace=True)
             del self.instance_mapping[lb_id]
+            self.deployed_revisions.pop(lb_id, None)
             self.plugin_rpc.loadbalancer_destroyed(lb_id)
         except Exception:
             LOG.exception(_LE('Unable to destroy device for loadbalancer: %s'),
@@ -217,6 +404,7 @@ class LbaasAgentManager(periodic_task.PeriodicTasks):
                           'driver %(driver)s'),
                       {'operation': operation.capitalize(), 'obj': obj_type,
                        'id': obj.id, 'driver': driver})
+        self.deployed_revisions.pop(obj.root_loadbalancer.id, None)
         self._update_statuses(obj, error=True)
 
     def agent_updated(self, context, payload):
@@ -232,7 +420,98 @@ class LbaasAgentManager(periodic_task.PeriodicTasks):
                     self._destroy_loadbalancer(loadbalancer_id)
             LOG.info(_LI("Agent_updated by server side %s!"), payload)
 
-    def _update_statuses(self, obj, error=False):
+    def _queue_driver_call(self, driver, operation, obj, old_obj=None):
+        """Runs or queues a driver call on a child of a loadbalancer.
+
+        When update_coalesce_window is set, the calls for a loadbalancer are
+        held for that long after the first one arrives and are then flushed
+        together by _flush_driver_calls.
+        """
+        window = self.conf.update_coalesce_window
+        if not window:
+            self._call_driver(driver, operation, obj, old_obj)
+            return
+        loadbalancer_id = obj.root_loadbalancer.id
+        pending = self.pending_calls.setdefault(loadbalancer_id, [])
+        pending.append((driver, operation, obj, old_obj))
+        if len(pending) == 1:
+            eventlet.spawn_after(window, self._flush_driver_calls,
+                                 loadbalancer_id)
+
+    def _call_driver(self, driver, operation, obj, old_obj=None):
+        manager = getattr(driver, obj.__class__.__name__.lower())
+        if operation == 'delete':
+            manager.delete(obj)
+            return
+        try:
+            if operation == 'update':
+                manager.update(old_obj, obj)
+            else:
+                manager.create(obj)
+        except Exception:
+            self._handle_failed_driver_call(operation, obj, driver.get_name())
+        else:
+            self._update_statuses(obj)
+
+    def _flush_driver_calls(self, loadbalancer_id):
+        if loadbalancer_id in self.flushing_loadbalancers:
+            # let the previous changes finish deploying first
+            eventlet.spawn_after(self.conf.update_coalesce_window,
+                                 self._flush_driver_calls, loadbalancer_id)
+            return
+        calls = self.pending_calls.pop(loadbalancer_id, None)
+        if not calls or loadbalancer_id not in self.instance_mapping:
+            return
+        self.flushing_loadbalancers.add(loadbalancer_id)
+        try:
+            if len(calls) == 1:
+                self._call_driver(*calls[0])
+            else:
+                self._call_driver_coalesced(loadbalancer_id, calls)
+        except Exception:
+            LOG.exception(_LE('Unable to apply changes to loadbalancer %s'),
+                          loadbalancer_id)
+            self.deployed_revisions.pop(loadbalancer_id, None)
+            self.needs_resync = True
+        finally:
+            self.flushing_loadbalancers.discard(loadbalancer_id)
+
+    def _call_driver_coalesced(self, loadbalancer_id, calls):
+        """Deploys several changes of a loadbalancer with a single update.
+
+        The driver is given the most recent graph of the loadbalancer, and
+        the status of every object created or updated by the calls, and
+        not deleted by a later one, is reported afterwards.
+        """
+        driver = self._get_driver(loadbalancer_id)
+        loadbalancer = calls[-1][2].root_loadbalancer
+        error = False
+        try:
+            driver.loadbalancer.update(loadbalancer, loadbalancer)
+        except Exception:
+            LOG.exception(_LE('Update of %(count)d objects of loadbalancer '
+                              '%(id)s failed on device driver %(driver)s'),
+                          {'count': len(calls), 'id': loadbalancer_id,
+                           'driver': driver.get_name()})
+            self.deployed_revisions.pop(loadbalancer_id, None)
+            error = True
+
+        changed = collections.OrderedDict()
+        for _driver, operation, obj, _old_obj in calls:
+            key = (obj.__class__, obj.id)
+            if operation == 'delete':
+                changed.pop(key, None)
+            else:
+                changed[key] = obj
+        if not changed:
+            return
+        for obj in changed.values():
+            self._update_statuses(obj, error=error, update_loadbalancer=False)
+        self.plugin_rpc.update_status('loadbalancer', loadbalancer_id,
+                                      provisioning_status=constants.ACTIVE,
+                                      operating_status=None)
+
+    def _update_statuses(self, obj, error=False, update_loadbalancer=True):
         lb_p_status = constants.ACTIVE
         lb_o_status = None
         obj_type = obj.__class__.__name__.lower()
@@ -254,6 +533,8 @@ class LbaasAgentManager(periodic_task.PeriodicTasks):
             self.plugin_rpc.update_status(obj_type, obj.id,
                                           provisioning_status=obj_p_status,
                                           operating_status=obj_o_status)
+        if not update_loadbalancer:
+            return
         self.plugin_rpc.update_status('loadbalancer', lb.id,
                                       provisioning_status=lb_p_status,
                                       operating_status=lb_o_status)
@@ -292,99 +573,82 @@ class LbaasAgentManager(periodic_task.PeriodicTasks):
         driver = self._get_driver(loadbalancer.id)
         driver.loadbalancer.delete(loadbalancer)
         del self.instance_mapping[loadbalancer.id]
+        self.deployed_revisions.pop(loadbalancer.id, None)
+        self.pending_calls.pop(loadbalancer.id, None)
 
     def create_listener(self, context, listener):
         listener = data_models.Listener.from_dict(listener)
         driver = self._get_driver(listener.loadbalancer.id)
-        try:
-            driver.listener.create(listener)
-        except Exception:
-            self._handle_failed_driver_call('create', listener,
-                                            driver.get_name())
-        else:
-            self._update_statuses(listener)
+        self._queue_driver_call(driver, 'create', listener)
 
     def update_listener(self, context, old_listener, listener):
         listener = data_models.Listener.from_dict(listener)
         old_listener = data_models.Listener.from_dict(old_listener)
         driver = self._get_driver(listener.loadbalancer.id)
-        try:
-            driver.listener.update(old_listener, listener)
-        except Exception:
-            self._handle_failed_driver_call('update', listener,
-                                            driver.get_name())
-        else:
-            self._update_statuses(listener)
+        self._queue_driver_call(driver, 'update', listener, old_listener)
 
     def delete_listener(self, context, listener):
         listener = data_models.Listener.from_dict(listener)
         driver = self._get_driver(listener.loadbalancer.id)
-        driver.listener.delete(listener)
+        self._queue_driver_call(driver, 'delete', listener)
 
     def create_pool(self, context, pool):
         pool = data_models.Pool.from_dict(pool)
         driver = self._get_driver(pool.listener.loadbalancer.id)
-        try:
-            driver.pool.create(pool)
-        except Exception:
-            self._handle_failed_driver_call('create', pool, driver.get_name())
-        else:
-            self._update_statuses(pool)
+        self._queue_driver_call(driver, 'create', pool)
 
     def update_pool(self, context, old_pool, pool):
         pool = data_models.Pool.from_dict(pool)
         old_pool = data_models.Pool.from_dict(old_pool)
         driver = self._get_driver(pool.listener.loadbalancer.id)
-        try:
-            driver.pool.update(old_pool, pool)
-        except Exception:
-            self._handle_failed_driver_call('create', pool, driver.get_name())
-        else:
-            self._update_statuses(pool)
+        self._queue_driver_call(driver, 'update', pool, old_pool)
 
     def delete_pool(self, context, pool):
         pool = data_models.Pool.from_dict(pool)
         driver = self._get_driver(pool.listener.loadbalancer.id)
-        driver.pool.delete(pool)
+        self._queue_driver_call(driver, 'delete', pool)
 
     def create_member(self, context, member):
         member = data_models.Member.from_dict(member)
         driver = self._get_driver(member.pool.listener.loadbalancer.id)
-        try:
-            driver.member.create(member)
-        except Exception:
-            self._handle_failed_driver_call('create', member,
-                                            driver.get_name())
-        else:
-            self._update_statuses(member)
+        self._queue_driver_call(driver, 'create', member)
 
     def update_member(self, context, old_member, member):
         member = data_models.Member.from_dict(member)
         old_member = data_models.Member.from_dict(old_member)
         driver = self._get_driver(member.pool.listener.loadbalancer.id)
-        try:
-            driver.member.update(old_member, member)
-        except Exception:
-            self._handle_failed_driver_call('create', member,
-                                            driver.get_name())
-        else:
-            self._update_statuses(member)
+        self._queue_driver_call(driver, 'update', member, old_member)
 
     def delete_member(self, context, member):
         member = data_models.Member.from_dict(member)
         driver = self._get_driver(member.pool.listener.loadbalancer.id)
-        driver.member.delete(member)
+        self._queue_driver_call(driver, 'delete', member)
+
+    def batch_members(self, context, pool, member_ids):
+        """Deploys the members created or updated by a batch at once."""
+        pool = data_models.Pool.from_dict(pool)
+        loadbalancer = pool.listener.loadbalancer
+        driver = self._get_driver(loadbalancer.id)
+        member_ids = set(member_ids)
+        calls = []
+        for member in pool.members:
+            if member.id in member_ids:
+                member.pool = pool
+                calls.append((driver, 'update', member, None))
+        if calls:
+            self._call_driver_coalesced(loadbalancer.id, calls)
+            return
+        # only deletions, the loadbalancer status was reset by the plugin
+        try:
+            driver.loadbalancer.update(loadbalancer, loadbalancer)
+        except Exception:
+            LOG.exception(_LE('Unable to remove members of pool %s'), pool.id)
+            self.deployed_revisions.pop(loadbalancer.id, None)
 
     def create_healthmonitor(self, context, healthmonitor):
         healthmonitor = data_models.HealthMonitor.from_dict(healthmonitor)
         driver = self._get_driver(healthmonitor.pool.listener.loadbalancer.id)
-        try:
-            driver.healthmonitor.create(healthmonitor)
-        except Exception:
-            self._handle_failed_driver_call('create', healthmonitor,
-                                            driver.get_name())
-        else:
-            self._update_statuses(healthmonitor)
+        self._queue_driver_call(driver, 'create', healthmonitor)
 
     def update_healthmonitor(self, context, old_healthmonitor,
                              healthmonitor):
@@ -392,15 +656,10 @@ class LbaasAgentManager(periodic_task.PeriodicTasks):
         old_healthmonitor = data_models.HealthMonitor.from_dict(
             old_healthmonitor)
         driver = self._get_driver(healthmonitor.pool.listener.loadbalancer.id)
-        try:
-            driver.healthmonitor.update(old_healthmonitor, healthmonitor)
-        except Exception:
-            self._handle_failed_driver_call('create', healthmonitor,
-                                            driver.get_name())
-        else:
-            self._update_statuses(healthmonitor)
+        self._queue_driver_call(driver, 'update', healthmonitor,
+                                old_healthmonitor)
 
     def delete_healthmonitor(self, context, healthmonitor):
         healthmonitor = data_models.HealthMonitor.from_dict(healthmonitor)
         driver = self._get_driver(healthmonitor.pool.listener.loadbalancer.id)
-        driver.healthmonitor.delete(healthmonitor)
+        self._queue_driver_call(driver, 'delete', healthmonitor)
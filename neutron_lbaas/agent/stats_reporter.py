@@ -0,0 +1,114 @@
+# Copyright 2015 OpenStack Foundation
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import bisect
+
+import six
+
+# upper bounds, in seconds, of the statistics collection tick histogram
+TICK_BUCKETS = (0.1, 0.5, 1, 2, 5, 10, 30, 60)
+
+
+class StatsReporter(object):
+    """Decides which load balancers' statistics are worth reporting.
+
+    The counters last sent for each load balancer and its members are
+    remembered, and only load balancers with a value that moved by more
+    than threshold percent since then are reported. Every
+    full_report_interval ticks all of them are reported regardless.
+    """
+
+    def __init__(self, threshold=0, full_report_interval=1):
+        self.threshold = threshold
+        self.full_report_interval = full_report_interval
+        self.last_reported = {}
+        self.ticks = 0
+
+    def get_changed(self, all_stats):
+        """Returns the subset of all_stats to report for this tick.
+
+        :param all_stats: mapping of load balancer ids to their statistics
+        """
+        # forget load balancers which are not deployed anymore
+        for lb_id in set(self.last_reported) - set(all_stats):
+            del self.last_reported[lb_id]
+
+        self.ticks += 1
+        if self.ticks >= self.full_report_interval:
+            self.ticks = 0
+            return dict(all_stats)
+        return dict((lb_id, stats) for lb_id, stats in all_stats.items()
+                    if self._changed(self.last_reported.get(lb_id), stats))
+
+    def reported(self, stats):
+        """Records statistics that were successfully sent to the server."""
+        self.last_reported.update(stats)
+
+    def _changed(self, old, new):
+        if old is None or set(old) != set(new):
+            return True
+        for key, value in six.iteritems(new):
+            if isinstance(value, dict):
+                if (not isinstance(old[key], dict) or
+                        self._changed(old[key], value)):
+                    return True
+            elif self._value_changed(old[key], value):
+                return True
+        return False
+
+    def _value_changed(self, old, new):
+        if old == new:
+            return False
+        try:
+            old, new = float(old), float(new)
+        except (TypeError, ValueError):
+            return True
+        return abs(new - old) > abs(old) * self.threshold / 100.0
+
+
+class StatsScheduler(object):
+    """Adapts the statistics collection interval to the agent's load.
+
+    When a collection tick overruns the current interval the interval is
+    doubled, up to max_interval, and it is halved back towards
+    base_interval once ticks take less than half of it again. Tick
+    durations are counted in a histogram bucketed by TICK_BUCKETS.
+    """
+
+    def __init__(self, base_interval, max_interval):
+        self.base_interval = base_interval
+        self.max_interval = max(base_interval, max_interval)
+        self.interval = base_interval
+        self.overruns = 0
+        self.histogram = [0] * (len(TICK_BUCKETS) + 1)
+
+    def tick_done(self, elapsed):
+        """Records a tick duration.
+
+        :return: seconds to wait before the next tick starts
+        """
+        self.histogram[bisect.bisect_left(TICK_BUCKETS, elapsed)] += 1
+        if elapsed > self.interval:
+            self.overruns += 1
+            self.interval = min(self.interval * 2, self.max_interval)
+            return self.interval
+        if elapsed < self.interval / 2.0:
+            self.interval = max(self.interval / 2.0, self.base_interval)
+        return max(self.interval - elapsed, 0)
+
+    def get_metrics(self):
+        buckets = ['%gs' % bucket for bucket in TICK_BUCKETS] + ['+inf']
+        return {'interval': self.interval,
+                'overruns': self.overruns,
+                'tick_histogram': dict(zip(buckets, self.histogram))}
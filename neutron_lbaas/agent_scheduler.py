@@ -13,17 +13,21 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import collections
 import random
+import time
 
 from neutron.db import agents_db
 from neutron.db import agentschedulers_db
 from neutron.db import model_base
 from neutron.i18n import _LW
+from oslo_config import cfg
 from oslo_log import log as logging
 import sqlalchemy as sa
 from sqlalchemy import orm
 from sqlalchemy.orm import joinedload
 
+from neutron_lbaas.db.loadbalancer import models
 from neutron_lbaas.extensions import lbaas_agentschedulerv2
 from neutron_lbaas.services.loadbalancer import constants as lb_const
 
@@ -52,6 +56,28 @@ class LbaasAgentSchedulerDbMixin(agentschedulers_db.AgentSchedulerDbMixin,
 
     agent_notifiers = {}
 
+    # device driver -> hosts of the lbaas agents supporting it; rebuilt when
+    # an agent reports a new set of device drivers, and every agent_down_time
+    # seconds to catch up with agents which reported to other servers
+    _candidate_hosts = None
+    _candidate_hosts_expiry = 0
+    # host -> device drivers of the agent, as of the last index rebuild
+    _agent_device_drivers = None
+    # agent id -> (configurations json, device drivers parsed from it), only
+    # holding the agents found by the last index rebuild
+    _device_drivers_cache = None
+
+    def create_or_update_agent(self, context, agent_state):
+        if agent_state.get('agent_type') == lb_const.AGENT_TYPE_LOADBALANCERV2:
+            device_drivers = frozenset(agent_state.get(
+                'configurations', {}).get('device_drivers', []))
+            agent_device_drivers = self._agent_device_drivers or {}
+            if (agent_device_drivers.get(agent_state.get('host')) !=
+                    device_drivers):
+                self._candidate_hosts = None
+        return super(LbaasAgentSchedulerDbMixin, self).create_or_update_agent(
+            context, agent_state)
+
     def get_agent_hosting_loadbalancer(self, context,
                                        loadbalancer_id, active=None):
         query = context.session.query(LoadbalancerAgentBinding)
@@ -88,13 +114,127 @@ class LbaasAgentSchedulerDbMixin(agentschedulers_db.AgentSchedulerDbMixin,
             return lbs
         return []
 
+    def get_lbaas_agent_loads(self, context, agent_ids):
+        """Returns how much each of the given agents hosts.
+
+        All agents are counted with a single aggregate query.
+
+        :return: mapping of agent ids to (load balancer count, member count)
+                 tuples; agents hosting nothing map to (0, 0)
+        """
+        loads = dict((agent_id, (0, 0)) for agent_id in agent_ids)
+        if not loads:
+            return loads
+        query = context.session.query(
+            LoadbalancerAgentBinding.agent_id,
+            sa.func.count(sa.distinct(
+                LoadbalancerAgentBinding.loadbalancer_id)),
+            sa.func.count(models.MemberV2.id))
+        query = query.outerjoin(
+            models.Listener,
+            models.Listener.loadbalancer_id ==
+            LoadbalancerAgentBinding.loadbalancer_id)
+        query = query.outerjoin(
+            models.MemberV2,
+            models.MemberV2.pool_id == models.Listener.default_pool_id)
+        query = query.filter(LoadbalancerAgentBinding.agent_id.in_(
+            list(loads)))
+        query = query.group_by(LoadbalancerAgentBinding.agent_id)
+        for agent_id, loadbalancer_count, member_count in query:
+            loads[agent_id] = (loadbalancer_count, member_count)
+        return loads
+
+    def get_loadbalancer_loads_on_lbaas_agent(self, context, agent_id):
+        """Returns the member count of each load balancer on an agent."""
+        query = context.session.query(
+            LoadbalancerAgentBinding.loadbalancer_id,
+            sa.func.count(models.MemberV2.id))
+        query = query.outerjoin(
+            models.Listener,
+            models.Listener.loadbalancer_id ==
+            LoadbalancerAgentBinding.loadbalancer_id)
+        query = query.outerjoin(
+            models.MemberV2,
+            models.MemberV2.pool_id == models.Listener.default_pool_id)
+        query = query.filter(LoadbalancerAgentBinding.agent_id == agent_id)
+        query = query.group_by(LoadbalancerAgentBinding.loadbalancer_id)
+        return dict(query)
+
+    def rebind_loadbalancer(self, context, loadbalancer_id,
+                            old_agent_id, new_agent_id):
+        """Moves a load balancer from one agent to another.
+
+        :return: False if the load balancer was not bound to old_agent_id
+                 anymore, e.g. because it was deleted in the meantime
+        """
+        with context.session.begin(subtransactions=True):
+            query = context.session.query(LoadbalancerAgentBinding)
+            query = query.filter_by(loadbalancer_id=loadbalancer_id,
+                                    agent_id=old_agent_id)
+            moved = query.update({'agent_id': new_agent_id},
+                                 synchronize_session=False)
+        context.session.expire_all()
+        return bool(moved)
+
     def get_lbaas_agent_candidates(self, device_driver, active_agents):
-        candidates = []
-        for agent in active_agents:
+        return [agent for agent in active_agents
+                if device_driver in self._get_agent_device_drivers(agent)]
+
+    def get_active_lbaas_agent_candidates(self, context, device_driver):
+        """Returns the active agents supporting a device driver.
+
+        Only the agents found in the candidate index are loaded, so the
+        cost does not grow with the number of agents supporting other
+        device drivers. An index without any agent for the device driver
+        is rebuilt first, agents may have registered with other servers.
+        """
+        cached = self._candidate_hosts
+        candidate_hosts = self._get_candidate_hosts(context)
+        hosts = candidate_hosts.get(device_driver)
+        if not hosts and candidate_hosts is cached:
+            self._candidate_hosts = None
+            hosts = self._get_candidate_hosts(context).get(device_driver)
+        if not hosts:
+            return []
+        return self.get_lbaas_agents(context, active=True,
+                                     filters={'host': list(hosts)})
+
+    def _get_agent_device_drivers(self, agent):
+        if self._device_drivers_cache is None:
+            self._device_drivers_cache = {}
+        cached = self._device_drivers_cache.get(agent.id)
+        if cached is None or cached[0] != agent.configurations:
             agent_conf = self.get_configuration_dict(agent)
-            if device_driver in agent_conf['device_drivers']:
-                candidates.append(agent)
-        return candidates
+            cached = (agent.configurations,
+                      frozenset(agent_conf.get('device_drivers', [])))
+            self._device_drivers_cache[agent.id] = cached
+        return cached[1]
+
+    def _get_candidate_hosts(self, context):
+        now = time.time()
+        if (self._candidate_hosts is not None and
+                now < self._candidate_hosts_expiry):
+            return self._candidate_hosts
+        query = context.session.query(agents_db.Agent.id,
+                                      agents_db.Agent.host,
+                                      agents_db.Agent.configurations)
+        query = query.filter_by(agent_type=lb_const.AGENT_TYPE_LOADBALANCERV2)
+        candidate_hosts = collections.defaultdict(set)
+        agent_device_drivers = {}
+        agent_ids = set()
+        for agent in query:
+            agent_ids.add(agent.id)
+            device_drivers = self._get_agent_device_drivers(agent)
+            agent_device_drivers[agent.host] = device_drivers
+            for device_driver in device_drivers:
+                candidate_hosts[device_driver].add(agent.host)
+        # forget the device drivers of the agents which are gone
+        for agent_id in set(self._device_drivers_cache or ()) - agent_ids:
+            self._device_drivers_cache.pop(agent_id, None)
+        self._agent_device_drivers = agent_device_drivers
+        self._candidate_hosts = dict(candidate_hosts)
+        self._candidate_hosts_expiry = now + cfg.CONF.agent_down_time
+        return self._candidate_hosts
 
 
 class ChanceScheduler(object):
@@ -115,21 +255,17 @@ class ChanceScheduler(object):
                            'agent_id': lbaas_agent['id']})
                 return
 
-            active_agents = plugin.db.get_lbaas_agents(context, active=True)
-            if not active_agents:
-                LOG.warn(
-                    _LW('No active lbaas agents for load balancer %s'),
-                    loadbalancer.id)
-                return
-
-            candidates = plugin.db.get_lbaas_agent_candidates(device_driver,
-                                                              active_agents)
+            candidates = plugin.db.get_active_lbaas_agent_candidates(
+                context, device_driver)
             if not candidates:
-                LOG.warn(_LW('No lbaas agent supporting device driver %s'),
-                         device_driver)
+                LOG.warn(_LW('No active lbaas agent supporting device driver '
+                             '%(device_driver)s for load balancer '
+                             '%(loadbalancer_id)s'),
+                         {'device_driver': device_driver,
+                          'loadbalancer_id': loadbalancer.id})
                 return
 
-            chosen_agent = random.choice(candidates)
+            chosen_agent = self._choose_agent(plugin, context, candidates)
             binding = LoadbalancerAgentBinding()
             binding.agent = chosen_agent
             binding.loadbalancer_id = loadbalancer.id
@@ -141,3 +277,23 @@ class ChanceScheduler(object):
                     'agent_id': chosen_agent['id']}
             )
             return chosen_agent
+
+    def _choose_agent(self, plugin, context, candidates):
+        return random.choice(candidates)
+
+
+class LeastLoadedScheduler(ChanceScheduler):
+    """Allocate a loadbalancer agent for a vip to the least loaded agent.
+
+    The load of an agent is the number of load balancers bound to it plus
+    the number of members of their pools; ties are broken randomly.
+    """
+
+    def _choose_agent(self, plugin, context, candidates):
+        loads = plugin.db.get_lbaas_agent_loads(
+            context, [agent['id'] for agent in candidates])
+        weights = dict((agent_id, sum(load))
+                       for agent_id, load in loads.items())
+        lightest = min(weights.values())
+        return random.choice([agent for agent in candidates
+                              if weights[agent['id']] == lightest])
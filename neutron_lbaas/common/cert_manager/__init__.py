@@ -25,7 +25,12 @@ cert_manager_opts = [
     cfg.StrOpt('cert_manager_class',
                default=CERT_MANAGER_DEFAULT,
                help='Certificate Manager plugin. '
-                    'Defaults to {0}.'.format(CERT_MANAGER_DEFAULT))
+                    'Defaults to {0}.'.format(CERT_MANAGER_DEFAULT)),
+    cfg.IntOpt('tls_validation_workers',
+               default=8,
+               help=_('Number of TLS containers of a listener retrieved '
+                      'and validated concurrently when the listener is '
+                      'created or updated.'))
 ]
 
 CONF.register_opts(cert_manager_opts, group='certificates')
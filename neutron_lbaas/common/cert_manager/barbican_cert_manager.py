@@ -12,6 +12,8 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import threading
+
 from barbicanclient import client as barbican_client
 from keystoneclient import session
 from keystoneclient.v2_0 import client as v2_client
@@ -20,6 +22,7 @@ from neutron.i18n import _LI, _LW, _LE
 from oslo_config import cfg
 from oslo_log import log as logging
 from oslo_utils import excutils
+import requests
 
 from neutron_lbaas.common.cert_manager import cert_manager
 
@@ -28,6 +31,16 @@ LOG = logging.getLogger(__name__)
 CONF = cfg.CONF
 cfg.CONF.import_group('keystone_authtoken', 'keystonemiddleware.auth_token')
 
+barbican_opts = [
+    cfg.IntOpt('barbican_pool_size',
+               default=10,
+               help=_('Maximum number of kept alive connections to '
+                      'Barbican and Keystone shared by all the requests of '
+                      'the process.'))
+]
+
+CONF.register_opts(barbican_opts, group='certificates')
+
 
 class Cert(cert_manager.Cert):
     """Representation of a Cert based on the Barbican CertificateContainer."""
@@ -60,8 +73,29 @@ class Cert(cert_manager.Cert):
 
 
 class BarbicanKeystoneAuth(object):
+    """Keystone session and Barbican client shared by the process.
+
+    Both are created once, the session keeps its connections alive and
+    reuses its token until it is about to expire.
+    """
     _keystone_session = None
     _barbican_client = None
+    _lock = threading.Lock()
+
+    @staticmethod
+    def _get_requests_session():
+        """Creates the HTTP session behind the Keystone session.
+
+        :return: a requests Session pooling up to barbican_pool_size
+                 connections per host
+        """
+        pool_size = max(1, CONF.certificates.barbican_pool_size)
+        adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size,
+                                                pool_maxsize=pool_size)
+        requests_session = requests.Session()
+        requests_session.mount('http://', adapter)
+        requests_session.mount('https://', adapter)
+        return requests_session
 
     @classmethod
     def _get_keystone_session(cls):
@@ -70,7 +104,11 @@ class BarbicanKeystoneAuth(object):
         :return: a Keystone Session object
         :raises Exception: if the session cannot be established
         """
-        if not cls._keystone_session:
+        if cls._keystone_session:
+            return cls._keystone_session
+        with cls._lock:
+            if cls._keystone_session:
+                return cls._keystone_session
             try:
                 if CONF.keystone_authtoken.auth_version.lower() == 'v2':
                     kc = v2_client.Client(
@@ -88,7 +126,8 @@ class BarbicanKeystoneAuth(object):
                     )
                 else:
                     raise Exception('Unknown authentication version')
-                cls._keystone_session = session.Session(auth=kc)
+                cls._keystone_session = session.Session(
+                    auth=kc, session=cls._get_requests_session())
             except Exception:
                 # Keystone sometimes masks exceptions strangely -- this will
                 #  reraise the original exception, while also providing useful
@@ -104,10 +143,15 @@ class BarbicanKeystoneAuth(object):
         :return: a Barbican Client object
         :raises Exception: if the client cannot be created
         """
-        if not cls._barbican_client:
+        if cls._barbican_client:
+            return cls._barbican_client
+        keystone_session = cls._get_keystone_session()
+        with cls._lock:
+            if cls._barbican_client:
+                return cls._barbican_client
             try:
                 cls._barbican_client = barbican_client.Client(
-                    session=cls._get_keystone_session()
+                    session=keystone_session
                 )
             except Exception:
                 # Barbican (because of Keystone-middleware) sometimes masks
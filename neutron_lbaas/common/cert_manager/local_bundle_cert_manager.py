@@ -0,0 +1,185 @@
+# Copyright 2015 OpenStack Foundation.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Local certificate manager storing every cert in a single bundle file
+
+Bundles are written once and never modified, so retrieved certs are kept
+in memory for as long as their bundle exists. Certs stored by
+local_cert_manager are still read from their separate files.
+"""
+import collections
+import os
+import tempfile
+import threading
+import uuid
+
+from neutron.i18n import _LI, _LE
+from oslo_config import cfg
+from oslo_log import log as logging
+from oslo_serialization import jsonutils
+import six
+
+from neutron_lbaas.common.cert_manager import local_cert_manager
+from neutron_lbaas.common import exceptions
+
+LOG = logging.getLogger(__name__)
+
+CONF = cfg.CONF
+
+local_bundle_cert_manager_opts = [
+    cfg.IntOpt('local_cache_size',
+               default=128,
+               help=_('Maximum number of certificates of the local bundle '
+                      'certificate manager kept in memory.'))
+]
+
+CONF.register_opts(local_bundle_cert_manager_opts, group='certificates')
+
+Cert = local_cert_manager.Cert
+
+BUNDLE_FIELDS = ('certificate', 'private_key', 'intermediates',
+                 'private_key_passphrase')
+
+
+class CertManager(local_cert_manager.CertManager):
+    """Cert Manager that stores each cert locally in one bundle file."""
+
+    # cert_ref -> Cert of the most recently retrieved bundles
+    _cache = collections.OrderedDict()
+    _lock = threading.Lock()
+
+    @staticmethod
+    def _get_bundle_path(cert_ref):
+        return os.path.join(CONF.certificates.storage_path,
+                            '{0}.bundle'.format(cert_ref))
+
+    @classmethod
+    def _cache_cert(cls, cert_ref, cert):
+        with cls._lock:
+            cls._cache.pop(cert_ref, None)
+            cls._cache[cert_ref] = cert
+            while len(cls._cache) > max(0, CONF.certificates.local_cache_size):
+                cls._cache.popitem(last=False)
+
+    @classmethod
+    def store_cert(cls, certificate, private_key, intermediates=None,
+                   private_key_passphrase=None, **kwargs):
+        """Stores (i.e., registers) a cert with the cert manager.
+
+        The cert is written to a single bundle file.
+
+        :param certificate: PEM encoded TLS certificate
+        :param private_key: private key for the supplied certificate
+        :param intermediates: ordered and concatenated intermediate certs
+        :param private_key_passphrase: optional passphrase for the supplied key
+
+        :returns: the UUID identifying the stored cert
+        :raises CertificateStorageException: if certificate storage fails
+        """
+        cert_data = dict(certificate=certificate, private_key=private_key,
+                         intermediates=intermediates,
+                         private_key_passphrase=private_key_passphrase)
+        bundle = jsonutils.dumps(cert_data, sort_keys=True)
+        if isinstance(bundle, six.text_type):
+            bundle = bundle.encode('utf-8')
+        cert_ref = str(uuid.uuid4())
+
+        LOG.info(_LI(
+            "Storing certificate bundle {0} on the local filesystem."
+        ).format(cert_ref))
+        try:
+            # the bundle is renamed into place once complete, readers never
+            # see a partially written one
+            fd, tmp_path = tempfile.mkstemp(
+                dir=CONF.certificates.storage_path,
+                prefix='.{0}'.format(cert_ref))
+            with os.fdopen(fd, 'wb') as bundle_file:
+                bundle_file.write(bundle)
+            os.rename(tmp_path, cls._get_bundle_path(cert_ref))
+        except (IOError, OSError) as e:
+            LOG.error(_LE("Failed to store certificate."))
+            raise exceptions.CertificateStorageException(msg=str(e))
+
+        cls._cache_cert(cert_ref, Cert(**cert_data))
+        return cert_ref
+
+    @classmethod
+    def get_cert(cls, cert_ref, **kwargs):
+        """Retrieves the specified cert.
+
+        :param cert_ref: the reference of the cert to retrieve
+
+        :return: neutron_lbaas.common.cert_manager.cert_manager.Cert
+                 representation of the certificate data
+        :raises CertificateStorageException: if certificate retrieval fails
+        """
+        bundle_path = cls._get_bundle_path(cert_ref)
+        with cls._lock:
+            cert = cls._cache.pop(cert_ref, None)
+        # the bundle may have been deleted by another process
+        if cert is not None and os.path.exists(bundle_path):
+            cls._cache_cert(cert_ref, cert)
+            return cert
+
+        LOG.info(_LI(
+            "Loading certificate bundle {0} from the local filesystem."
+        ).format(cert_ref))
+        try:
+            with open(bundle_path, 'rb') as bundle_file:
+                bundle = bundle_file.read()
+        except IOError:
+            # stored by local_cert_manager, in separate files which may be
+            # modified, so not cached
+            return super(CertManager, cls).get_cert(cert_ref, **kwargs)
+        try:
+            cert_data = jsonutils.loads(bundle)
+            cert = Cert(**dict((field, cert_data.get(field))
+                               for field in BUNDLE_FIELDS))
+        except (ValueError, TypeError):
+            LOG.error(_LE(
+                "Failed to read certificate bundle {0}."
+            ).format(cert_ref))
+            raise exceptions.CertificateStorageException(
+                msg="Certificate bundle could not be read."
+            )
+        cls._cache_cert(cert_ref, cert)
+        return cert
+
+    @classmethod
+    def delete_cert(cls, cert_ref, **kwargs):
+        """Deletes the specified cert.
+
+        :param cert_ref: the reference of the cert to delete
+
+        :raises CertificateStorageException: if certificate deletion fails
+        """
+        with cls._lock:
+            cls._cache.pop(cert_ref, None)
+
+        bundle_path = cls._get_bundle_path(cert_ref)
+        if not os.path.exists(bundle_path):
+            super(CertManager, cls).delete_cert(cert_ref, **kwargs)
+            return
+
+        LOG.info(_LI(
+            "Deleting certificate bundle {0} from the local filesystem."
+        ).format(cert_ref))
+        try:
+            os.remove(bundle_path)
+        except OSError as e:
+            LOG.error(_LE(
+                "Failed to delete certificate {0}."
+            ).format(cert_ref))
+            raise exceptions.CertificateStorageException(msg=str(e))
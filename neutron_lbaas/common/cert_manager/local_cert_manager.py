@@ -191,10 +191,14 @@ class CertManager(cert_manager.CertManager):
         try:
             os.remove(filename_certificate)
             os.remove(filename_private_key)
-            os.remove(filename_intermediates)
-            os.remove(filename_pkp)
-        except IOError as ioe:
+        except (IOError, OSError) as e:
             LOG.error(_LE(
                 "Failed to delete certificate {0}."
             ).format(cert_ref))
-            raise exceptions.CertificateStorageException(message=ioe.message)
+            raise exceptions.CertificateStorageException(msg=str(e))
+        # intermediates and passphrase are only stored when provided
+        for filename in (filename_intermediates, filename_pkp):
+            try:
+                os.remove(filename)
+            except OSError:
+                pass
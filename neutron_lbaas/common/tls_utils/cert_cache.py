@@ -0,0 +1,140 @@
+#
+# Copyright 2015 OpenStack Foundation.  All rights reserved
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+In-process cache of the TLS material parsed out of certificate containers
+"""
+import collections
+import hashlib
+import threading
+import time
+
+from oslo_config import cfg
+import six
+
+tls_cache_opts = [
+    cfg.IntOpt('tls_cache_size',
+               default=256,
+               help=_('Maximum number of parsed TLS containers kept in '
+                      'memory, the least recently used ones are evicted '
+                      'first.')),
+    cfg.IntOpt('tls_cache_ttl',
+               default=300,
+               help=_('Seconds a parsed TLS container is used without '
+                      'fetching the container again. Once expired the '
+                      'container is fetched, but only parsed again if its '
+                      'contents changed. 0 disables the cache.'))
+]
+
+cfg.CONF.register_opts(tls_cache_opts, group='certificates')
+
+_Entry = collections.namedtuple('_Entry', 'digest, expires, material')
+
+
+def get_cert_digest(cert):
+    """Returns a digest of the contents of a certificate container.
+
+    :param cert: a cert_manager.Cert
+    :return: hex SHA-256 digest of the certificate, the intermediates, the
+             private key and its passphrase
+    """
+    intermediates = cert.get_intermediates()
+    if isinstance(intermediates, (list, tuple)):
+        intermediates = '\n'.join(intermediates)
+    digest = hashlib.sha256()
+    for part in (cert.get_certificate(), intermediates,
+                 cert.get_private_key(), cert.get_private_key_passphrase()):
+        if part is None:
+            part = ''
+        if isinstance(part, six.text_type):
+            part = part.encode('utf-8')
+        # the length keeps the boundaries between the parts unambiguous
+        digest.update(six.b('%d:' % len(part)))
+        digest.update(part)
+    return digest.hexdigest()
+
+
+class TLSMaterialCache(object):
+    """LRU cache of parsed TLS material with a time to live.
+
+    Entries are keyed by container reference. While an entry is fresh it is
+    returned without fetching the container. Once it expired the container
+    is fetched again and its digest compared with the one of the cached
+    entry, the material is only parsed again when the contents changed.
+    """
+
+    def __init__(self, size=None, ttl=None, clock=time.time):
+        self._size = size
+        self._ttl = ttl
+        self._clock = clock
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def size(self):
+        if self._size is None:
+            return cfg.CONF.certificates.tls_cache_size
+        return self._size
+
+    @property
+    def ttl(self):
+        if self._ttl is None:
+            return cfg.CONF.certificates.tls_cache_ttl
+        return self._ttl
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, cert_ref, fetch, parse):
+        """Returns the parsed material of a certificate container.
+
+        :param cert_ref: reference of the certificate container
+        :param fetch: callable retrieving the cert_manager.Cert of a
+                      reference
+        :param parse: callable turning a cert_manager.Cert into the
+                      material to cache
+        :return: the material parse returned for the current contents of
+                 the container
+        """
+        ttl = self.ttl
+        if ttl <= 0 or self.size <= 0:
+            return parse(fetch(cert_ref))
+        now = self._clock()
+        with self._lock:
+            entry = self._entries.pop(cert_ref, None)
+            if entry and entry.expires > now:
+                self._entries[cert_ref] = entry
+                return entry.material
+
+        cert = fetch(cert_ref)
+        digest = get_cert_digest(cert)
+        if entry and entry.digest == digest:
+            material = entry.material
+        else:
+            material = parse(cert)
+        with self._lock:
+            self._entries.pop(cert_ref, None)
+            self._entries[cert_ref] = _Entry(digest, now + ttl, material)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+        return material
+
+    def invalidate(self, cert_ref=None):
+        """Drops the entry of a container, or all of them."""
+        with self._lock:
+            if cert_ref is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(cert_ref, None)
@@ -13,6 +13,8 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import collections
+
 from neutron.api.v2 import attributes
 from neutron.db import common_db_mixin as base_db
 from neutron import manager
@@ -21,7 +23,9 @@ from oslo_db import exception
 from oslo_log import log as logging
 from oslo_utils import excutils
 from oslo_utils import uuidutils
+import sqlalchemy as sa
 from sqlalchemy import orm
+from sqlalchemy.orm import attributes as orm_attributes
 from sqlalchemy.orm import exc
 
 from neutron_lbaas import agent_scheduler
@@ -170,6 +174,9 @@ class LoadBalancerPluginDbv2(base_db.CommonDbMixin,
                 db_lb_child.provisioning_status = status
             else:
                 db_lb.provisioning_status = status
+            # every modification goes through here, so this is where the
+            # load balancer graph moves to a new revision
+            db_lb.revision = models.LoadBalancer.revision + 1
 
     def update_loadbalancer_provisioning_status(self, context, lb_id,
                                                 status=constants.ACTIVE):
@@ -197,6 +204,84 @@ class LoadBalancerPluginDbv2(base_db.CommonDbMixin,
                     model_db.operating_status != operating_status):
                 model_db.operating_status = operating_status
 
+    def activate_loadbalancer_graph(self, context, loadbalancer_id):
+        """Marks a deployed load balancer and its children ACTIVE.
+
+        The load balancer, its listeners and their default pools that are
+        pending become ACTIVE, as do the pending members and health
+        monitors of pools that are not in an error or deleting state. Each
+        kind of object is promoted with a single set based UPDATE rather
+        than by walking the ORM graph.
+        """
+        pending = [status for status in constants.ACTIVE_PENDING_STATUSES
+                   if status != constants.ACTIVE]
+        active = {'provisioning_status': constants.ACTIVE}
+        session = context.session
+        with session.begin(subtransactions=True):
+            session.query(models.LoadBalancer).filter(
+                models.LoadBalancer.id == loadbalancer_id,
+                models.LoadBalancer.provisioning_status.in_(pending)).update(
+                    active, synchronize_session=False)
+            session.query(models.Listener).filter(
+                models.Listener.loadbalancer_id == loadbalancer_id,
+                models.Listener.provisioning_status.in_(pending)).update(
+                    active, synchronize_session=False)
+
+            pool_ids = session.query(models.Listener.default_pool_id).filter(
+                models.Listener.loadbalancer_id == loadbalancer_id)
+            session.query(models.PoolV2).filter(
+                models.PoolV2.id.in_(pool_ids.subquery()),
+                models.PoolV2.provisioning_status.in_(pending)).update(
+                    active, synchronize_session=False)
+
+            active_pools = session.query(models.PoolV2).filter(
+                models.PoolV2.id.in_(pool_ids.subquery()),
+                models.PoolV2.provisioning_status.in_(
+                    constants.ACTIVE_PENDING_STATUSES))
+            session.query(models.MemberV2).filter(
+                models.MemberV2.pool_id.in_(active_pools.with_entities(
+                    models.PoolV2.id).subquery()),
+                models.MemberV2.provisioning_status.in_(pending)).update(
+                    active, synchronize_session=False)
+            session.query(models.HealthMonitorV2).filter(
+                models.HealthMonitorV2.id.in_(active_pools.with_entities(
+                    models.PoolV2.healthmonitor_id).subquery()),
+                models.HealthMonitorV2.provisioning_status.in_(
+                    pending)).update(active, synchronize_session=False)
+            # objects already loaded in the session are now stale
+            session.expire_all()
+
+    def update_members_operating_status(self, context, operating_statuses):
+        """Applies member operating status transitions in bulk.
+
+        Only members whose stored status differs are written, with a single
+        UPDATE for each target status.
+
+        :param operating_statuses: mapping of member ids to operating status
+        :return: mapping of the member ids that changed to their new status
+        """
+        if not operating_statuses:
+            return {}
+        transitions = collections.defaultdict(list)
+        with context.session.begin(subtransactions=True):
+            qry = context.session.query(models.MemberV2.id,
+                                        models.MemberV2.operating_status)
+            qry = qry.filter(models.MemberV2.id.in_(list(operating_statuses)))
+            for member_id, operating_status in qry:
+                if operating_statuses[member_id] != operating_status:
+                    transitions[operating_statuses[member_id]].append(
+                        member_id)
+            for operating_status, member_ids in transitions.items():
+                context.session.query(models.MemberV2).filter(
+                    models.MemberV2.id.in_(member_ids)).update(
+                        {'operating_status': operating_status},
+                        synchronize_session=False)
+            if transitions:
+                context.session.expire_all()
+        return dict((member_id, operating_status)
+                    for operating_status, member_ids in transitions.items()
+                    for member_id in member_ids)
+
     def create_loadbalancer(self, context, loadbalancer):
         with context.session.begin(subtransactions=True):
             self._load_id_and_tenant_id(context, loadbalancer)
@@ -233,15 +318,59 @@ class LoadBalancerPluginDbv2(base_db.CommonDbMixin,
         if lb_db.vip_port:
             self._core_plugin.delete_port(context, lb_db.vip_port_id)
 
+    def _get_loadbalancer_graphs(self, context, filters=None):
+        """Loads load balancers along with everything hanging off them.
+
+        Whatever the size of the graphs, this takes two queries: one for
+        the load balancers with their VIP ports and fixed IPs, and one for
+        all their listeners with the SNI containers, pools, members, health
+        monitors and session persistences. Like _get_resource, rows already
+        in the session are overwritten with what is in the database.
+        """
+        query = self._get_collection_query(context, models.LoadBalancer,
+                                           filters=filters)
+        query = query.options(
+            orm.joinedload('vip_port').joinedload('fixed_ips'),
+            orm.subqueryload('listeners').lazyload('loadbalancer'))
+        lb_dbs = query.populate_existing().all()
+        for lb_db in lb_dbs:
+            self._set_loadbalancer_graph_backrefs(lb_db)
+        return lb_dbs
+
+    @staticmethod
+    def _set_loadbalancer_graph_backrefs(lb_db):
+        # the other sides of the relationships loaded with the graph would
+        # otherwise be lazily loaded, some with a query each, once the graph
+        # is converted into data models
+        set_value = orm_attributes.set_committed_value
+        if lb_db.stats:
+            set_value(lb_db.stats, 'loadbalancer', lb_db)
+        for listener_db in lb_db.listeners:
+            set_value(listener_db, 'loadbalancer', lb_db)
+            for sni_db in listener_db.sni_containers:
+                set_value(sni_db, 'listener', listener_db)
+            pool_db = listener_db.default_pool
+            if not pool_db:
+                continue
+            set_value(pool_db, 'listener', listener_db)
+            for member_db in pool_db.members:
+                set_value(member_db, 'pool', pool_db)
+            if pool_db.healthmonitor:
+                set_value(pool_db.healthmonitor, 'pool', pool_db)
+            if pool_db.sessionpersistence:
+                set_value(pool_db.sessionpersistence, 'pool', pool_db)
+
     def get_loadbalancers(self, context, filters=None):
-        lb_dbs = self._get_resources(context, models.LoadBalancer,
-                                     filters=filters)
+        lb_dbs = self._get_loadbalancer_graphs(context, filters=filters)
         return [data_models.LoadBalancer.from_sqlalchemy_model(lb_db)
                 for lb_db in lb_dbs]
 
     def get_loadbalancer(self, context, id):
-        lb_db = self._get_resource(context, models.LoadBalancer, id)
-        return data_models.LoadBalancer.from_sqlalchemy_model(lb_db)
+        lb_dbs = self._get_loadbalancer_graphs(context, filters={'id': [id]})
+        if not lb_dbs:
+            raise loadbalancerv2.EntityNotFound(
+                name=models.LoadBalancer.NAME, id=id)
+        return data_models.LoadBalancer.from_sqlalchemy_model(lb_dbs[0])
 
     def _validate_listener_data(self, context, listener):
         pool_id = listener.get('default_pool_id')
@@ -464,6 +593,90 @@ class LoadBalancerPluginDbv2(base_db.CommonDbMixin,
         context.session.refresh(member_db)
         return data_models.Member.from_sqlalchemy_model(member_db)
 
+    def batch_pool_members(self, context, pool_id, created, updated,
+                           deleted_ids):
+        """Applies several member changes to a pool in one transaction.
+
+        New members are added PENDING_CREATE, updated ones are moved to
+        PENDING_UPDATE and deleted ones to PENDING_DELETE; the latter are
+        removed from the database by the driver.
+
+        :param created: dicts of the members to create
+        :param updated: mapping of member ids to the attributes to update
+        :param deleted_ids: ids of the members to delete
+        :return: data_models.MemberBatch of the changes
+        """
+        self._get_resource(context, models.PoolV2, pool_id)
+        old_members = self._get_shallow_pool_members(context, pool_id)
+        missing = (set(updated) | set(deleted_ids)) - set(old_members)
+        if missing:
+            raise loadbalancerv2.MemberNotFoundForPool(
+                member_id=sorted(missing)[0], pool_id=pool_id)
+        endpoints = set((member.address, member.protocol_port)
+                        for member in old_members.values())
+        for member in created:
+            endpoint = (member['address'], member['protocol_port'])
+            if endpoint in endpoints:
+                raise loadbalancerv2.MemberExists(
+                    address=member['address'], port=member['protocol_port'],
+                    pool=pool_id)
+            endpoints.add(endpoint)
+
+        changed_ids = list(updated) + list(deleted_ids)
+        try:
+            with context.session.begin(subtransactions=True):
+                for member in created:
+                    self._load_id_and_tenant_id(context, member)
+                    member['pool_id'] = pool_id
+                    member['provisioning_status'] = constants.PENDING_CREATE
+                    member['operating_status'] = lb_const.OFFLINE
+                context.session.add_all(
+                    [models.MemberV2(**member) for member in created])
+                if changed_ids:
+                    query = self._model_query(context, models.MemberV2)
+                    query = query.filter(models.MemberV2.id.in_(changed_ids))
+                    for member_db in query:
+                        if member_db.id in updated:
+                            member_db.update(updated[member_db.id])
+                            member_db.provisioning_status = (
+                                constants.PENDING_UPDATE)
+                        else:
+                            member_db.provisioning_status = (
+                                constants.PENDING_DELETE)
+        except exception.DBDuplicateEntry:
+            raise loadbalancerv2.MemberExists(
+                address=created[0]['address'],
+                port=created[0]['protocol_port'], pool=pool_id)
+
+        context.session.expire_all()
+        # the pool graph is built once and shared by the members of the
+        # batch, which are separate from the members of the pool so that
+        # the graph is free of cycles when drivers serialize it
+        pool = self.get_pool(context, pool_id)
+        members = self._get_shallow_pool_members(context, pool_id)
+        for member in members.values():
+            member.pool = pool
+        for member_id in updated:
+            old_members[member_id].pool = pool
+        return data_models.MemberBatch(
+            pool,
+            created=[members[member['id']] for member in created],
+            updated=[(old_members[member_id], members[member_id])
+                     for member_id in updated],
+            deleted=[members[member_id] for member_id in deleted_ids])
+
+    def _get_shallow_pool_members(self, context, pool_id):
+        """Returns the members of a pool, without their relationships.
+
+        :return: mapping of member ids to data_models.Member
+        """
+        columns = [getattr(models.MemberV2, column.name)
+                   for column in models.MemberV2.__table__.columns]
+        query = context.session.query(*columns)
+        query = query.filter(models.MemberV2.pool_id == pool_id)
+        return dict((row.id, data_models.Member.from_sqlalchemy_row(row))
+                    for row in query)
+
     def delete_pool_member(self, context, id):
         with context.session.begin(subtransactions=True):
             member_db = self._get_resource(context, models.MemberV2, id)
@@ -476,6 +689,10 @@ class LoadBalancerPluginDbv2(base_db.CommonDbMixin,
         return [data_models.Member.from_sqlalchemy_model(member_db)
                 for member_db in member_dbs]
 
+    def get_pool_members_count(self, context, filters=None):
+        return self._get_collection_count(context, models.MemberV2,
+                                          filters=filters)
+
     def get_pool_member(self, context, id):
         member_db = self._get_resource(context, models.MemberV2, id)
         return data_models.Member.from_sqlalchemy_model(member_db)
@@ -544,6 +761,58 @@ class LoadBalancerPluginDbv2(base_db.CommonDbMixin,
                                                           loadbalancer_id,
                                                           data=stats_data)
 
+    def update_loadbalancers_stats(self, context, stats_data):
+        """Stores the statistics of several load balancers at once.
+
+        Existing rows are updated and missing ones inserted with a single
+        statement each; load balancers that no longer exist are skipped.
+
+        :param stats_data: mapping of load balancer ids to their statistics
+        """
+        if not stats_data:
+            return
+        lb_ids = list(stats_data)
+        stats_table = models.LoadBalancerStatistics.__table__
+        with context.session.begin(subtransactions=True):
+            known_ids = set(
+                lb_id for lb_id, in context.session.query(
+                    models.LoadBalancer.id).filter(
+                        models.LoadBalancer.id.in_(lb_ids)))
+            stored_ids = set(
+                lb_id for lb_id, in context.session.query(
+                    models.LoadBalancerStatistics.loadbalancer_id).filter(
+                        models.LoadBalancerStatistics.loadbalancer_id.in_(
+                            lb_ids)))
+            updates = []
+            inserts = []
+            for lb_id in known_ids:
+                values = self._get_loadbalancer_stats_values(
+                    stats_data[lb_id])
+                if lb_id in stored_ids:
+                    values['lb_id'] = lb_id
+                    updates.append(values)
+                else:
+                    values['loadbalancer_id'] = lb_id
+                    inserts.append(values)
+            if updates:
+                context.session.execute(
+                    stats_table.update().where(
+                        stats_table.c.loadbalancer_id ==
+                        sa.bindparam('lb_id')),
+                    updates)
+            if inserts:
+                context.session.execute(stats_table.insert(), inserts)
+
+    def _get_loadbalancer_stats_values(self, data):
+        return {
+            'bytes_in': int(data.get(lb_const.STATS_IN_BYTES) or 0),
+            'bytes_out': int(data.get(lb_const.STATS_OUT_BYTES) or 0),
+            'active_connections': int(
+                data.get(lb_const.STATS_ACTIVE_CONNECTIONS) or 0),
+            'total_connections': int(
+                data.get(lb_const.STATS_TOTAL_CONNECTIONS) or 0)
+        }
+
     def stats(self, context, loadbalancer_id):
         loadbalancer = self._get_resource(context, models.LoadBalancer,
                                           loadbalancer_id)
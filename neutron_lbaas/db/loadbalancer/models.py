@@ -173,6 +173,10 @@ class LoadBalancer(model_base.BASEV2, models_v2.HasId, models_v2.HasTenant):
     provisioning_status = sa.Column(sa.String(16), nullable=False)
     operating_status = sa.Column(sa.String(16), nullable=False)
     admin_state_up = sa.Column(sa.Boolean(), nullable=False)
+    # bumped on every change to the load balancer or any of its children so
+    # agents can tell which graphs moved since they last deployed them
+    revision = sa.Column(sa.Integer, nullable=False, default=0,
+                         server_default='0')
     vip_port = orm.relationship(models_v2.Port)
     stats = orm.relationship(
         LoadBalancerStatistics,
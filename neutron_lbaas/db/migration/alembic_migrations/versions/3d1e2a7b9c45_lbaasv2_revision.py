@@ -0,0 +1,39 @@
+# Copyright 2015
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+#
+
+"""add revision to lbaas_loadbalancers
+
+Revision ID: 3d1e2a7b9c45
+Revises: kilo
+Create Date: 2015-05-12 14:02:31.227519
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '3d1e2a7b9c45'
+down_revision = 'kilo'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.add_column('lbaas_loadbalancers',
+                  sa.Column(u'revision', sa.Integer(), nullable=False,
+                            server_default='0'))
+
+
+def downgrade():
+    op.drop_column('lbaas_loadbalancers', 'revision')
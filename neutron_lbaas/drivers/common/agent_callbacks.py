@@ -23,6 +23,7 @@ import oslo_messaging as messaging
 
 from neutron_lbaas.db.loadbalancer import loadbalancer_dbv2
 from neutron_lbaas.db.loadbalancer import models as db_models
+from neutron_lbaas.services.loadbalancer import constants as lb_const
 from neutron_lbaas.services.loadbalancer import data_models
 
 LOG = logging.getLogger(__name__)
@@ -32,87 +33,101 @@ class LoadBalancerCallbacks(object):
 
     # history
     #   1.0 Initial version
-    target = messaging.Target(version='1.0')
+    #   1.1 Add get_loadbalancers
+    #   1.2 Add get_loadbalancer_revisions
+    #   1.3 Add update_loadbalancers_stats
+    target = messaging.Target(version='1.3')
 
     def __init__(self, plugin):
         super(LoadBalancerCallbacks, self).__init__()
         self.plugin = plugin
 
+    def _get_ready_devices(self, context, host, *columns):
+        agents = self.plugin.db.get_lbaas_agents(
+            context, filters={'host': [host]})
+        if not agents:
+            return []
+        elif len(agents) > 1:
+            LOG.warning(_LW('Multiple lbaas agents found on host %s'),
+                        host)
+        loadbalancers = self.plugin.db.list_loadbalancers_on_lbaas_agent(
+            context, agents[0].id)
+        loadbalancer_ids = [
+            l.id for l in loadbalancers]
+
+        qry = context.session.query(*columns)
+        qry = qry.filter(
+            loadbalancer_dbv2.models.LoadBalancer.id.in_(
+                loadbalancer_ids))
+        qry = qry.filter(
+            loadbalancer_dbv2.models.LoadBalancer.provisioning_status.in_(
+                constants.ACTIVE_PENDING_STATUSES))
+        up = True  # makes pep8 and sqlalchemy happy
+        qry = qry.filter(
+            loadbalancer_dbv2.models.LoadBalancer.admin_state_up == up)
+        return qry.all()
+
     def get_ready_devices(self, context, host=None):
         with context.session.begin(subtransactions=True):
-            agents = self.plugin.db.get_lbaas_agents(
-                context, filters={'host': [host]})
-            if not agents:
-                return []
-            elif len(agents) > 1:
-                LOG.warning(_LW('Multiple lbaas agents found on host %s'),
-                            host)
-            loadbalancers = self.plugin.db.list_loadbalancers_on_lbaas_agent(
-                context, agents[0].id)
-            loadbalancer_ids = [
-                l.id for l in loadbalancers]
-
-            qry = context.session.query(
-                loadbalancer_dbv2.models.LoadBalancer.id)
-            qry = qry.filter(
-                loadbalancer_dbv2.models.LoadBalancer.id.in_(
-                    loadbalancer_ids))
-            qry = qry.filter(
-                loadbalancer_dbv2.models.LoadBalancer.provisioning_status.in_(
-                    constants.ACTIVE_PENDING_STATUSES))
-            up = True  # makes pep8 and sqlalchemy happy
-            qry = qry.filter(
-                loadbalancer_dbv2.models.LoadBalancer.admin_state_up == up)
-            return [id for id, in qry]
+            return [id for id, in self._get_ready_devices(
+                context, host, loadbalancer_dbv2.models.LoadBalancer.id)]
+
+    def get_loadbalancer_revisions(self, context, host=None):
+        """Returns a mapping of ready load balancer ids to their revisions.
+
+        Agents compare these with the revisions they last deployed so that
+        a resync only reloads the load balancers that changed.
+        """
+        with context.session.begin(subtransactions=True):
+            return dict(self._get_ready_devices(
+                context, host, loadbalancer_dbv2.models.LoadBalancer.id,
+                loadbalancer_dbv2.models.LoadBalancer.revision))
 
     def get_loadbalancer(self, context, loadbalancer_id=None):
         lb_model = self.plugin.db.get_loadbalancer(context, loadbalancer_id)
-        if lb_model.vip_port and lb_model.vip_port.fixed_ips:
-            for fixed_ip in lb_model.vip_port.fixed_ips:
-                subnet_dict = self.plugin.db._core_plugin.get_subnet(
-                    context, fixed_ip.subnet_id
-                )
-                setattr(fixed_ip, 'subnet', data_models.Subnet.from_dict(
-                    subnet_dict))
-        if lb_model.provider:
-            device_driver = self.plugin.drivers[
-                lb_model.provider.provider_name].device_driver
-            setattr(lb_model.provider, 'device_driver', device_driver)
-        lb_dict = lb_model.to_dict(stats=False)
-
-        return lb_dict
+        return self._make_loadbalancer_dicts(context, [lb_model])[0]
+
+    def get_loadbalancers(self, context, loadbalancer_ids=None):
+        """Returns the graphs of several load balancers in a single call.
+
+        Load balancers that no longer exist are left out of the result.
+        """
+        if not loadbalancer_ids:
+            return []
+        lb_models = self.plugin.db.get_loadbalancers(
+            context, filters={'id': loadbalancer_ids})
+        return self._make_loadbalancer_dicts(context, lb_models)
+
+    def _make_loadbalancer_dicts(self, context, lb_models):
+        # look up each distinct vip subnet only once for the whole batch
+        subnet_ids = set(fixed_ip.subnet_id
+                         for lb_model in lb_models if lb_model.vip_port
+                         for fixed_ip in lb_model.vip_port.fixed_ips)
+        subnets = {}
+        if subnet_ids:
+            subnet_dicts = self.plugin.db._core_plugin.get_subnets(
+                context, filters={'id': list(subnet_ids)})
+            subnets = dict((subnet_dict['id'], subnet_dict)
+                           for subnet_dict in subnet_dicts)
+
+        lb_dicts = []
+        for lb_model in lb_models:
+            if lb_model.vip_port and lb_model.vip_port.fixed_ips:
+                for fixed_ip in lb_model.vip_port.fixed_ips:
+                    if fixed_ip.subnet_id in subnets:
+                        setattr(fixed_ip, 'subnet',
+                                data_models.Subnet.from_dict(
+                                    dict(subnets[fixed_ip.subnet_id])))
+            if lb_model.provider:
+                device_driver = self.plugin.drivers[
+                    lb_model.provider.provider_name].device_driver
+                setattr(lb_model.provider, 'device_driver', device_driver)
+            lb_dicts.append(lb_model.to_dict(stats=False))
+        return lb_dicts
 
     def loadbalancer_deployed(self, context, loadbalancer_id):
-        with context.session.begin(subtransactions=True):
-            qry = context.session.query(db_models.LoadBalancer)
-            qry = qry.filter_by(id=loadbalancer_id)
-            loadbalancer = qry.one()
-
-            # set all resources to active
-            if (loadbalancer.provisioning_status in
-                    constants.ACTIVE_PENDING_STATUSES):
-                loadbalancer.provisioning_status = constants.ACTIVE
-
-            if loadbalancer.listeners:
-                for l in loadbalancer.listeners:
-                    if (l.provisioning_status in
-                            constants.ACTIVE_PENDING_STATUSES):
-                        l.provisioning_status = constants.ACTIVE
-                    if (l.default_pool
-                        and l.default_pool.provisioning_status in
-                            constants.ACTIVE_PENDING_STATUSES):
-                        l.default_pool.provisioning_status = constants.ACTIVE
-                        if l.default_pool.members:
-                            for m in l.default_pool.members:
-                                if (m.provisioning_status in
-                                        constants.ACTIVE_PENDING_STATUSES):
-                                    m.provisioning_status = constants.ACTIVE
-                        if l.default_pool.healthmonitor:
-                            hm = l.default_pool.healthmonitor
-                            ps = hm.provisioning_status
-                            if ps in constants.ACTIVE_PENDING_STATUSES:
-                                (l.default_pool.healthmonitor
-                                 .provisioning_status) = constants.ACTIVE
+        # set all resources to active
+        self.plugin.db.activate_loadbalancer_graph(context, loadbalancer_id)
 
     def update_status(self, context, obj_type, obj_id,
                       provisioning_status=None, operating_status=None):
@@ -190,9 +205,22 @@ class LoadBalancerCallbacks(object):
                       port_id)
             return
 
-        port['admin_state_up'] = False
-        port['device_owner'] = ''
-        port['device_id'] = ''
+        bound_host = port.get(portbindings.HOST_ID)
+        if host and bound_host and bound_host != host:
+            # the load balancer was moved and the port is plugged on its
+            # new agent already
+            LOG.debug('Not unplugging port %(port_id)s of host %(host)s, it '
+                      'is bound to %(bound_host)s.',
+                      {'port_id': port_id, 'host': host,
+                       'bound_host': bound_host})
+            return
+
+        # only the changed attributes are sent, the port may be plugged on
+        # the new agent of a moved load balancer in the meantime and its
+        # binding must not be overwritten with the one read above
+        port = {'admin_state_up': False,
+                'device_owner': '',
+                'device_id': ''}
 
         try:
             self.plugin.db._core_plugin.update_port(
@@ -211,3 +239,26 @@ class LoadBalancerCallbacks(object):
                                   stats=None):
         self.plugin.db.update_loadbalancer_stats(context, loadbalancer_id,
                                                  stats)
+        self._update_members_operating_status(context,
+                                              {loadbalancer_id: stats})
+
+    def update_loadbalancers_stats(self, context, stats=None):
+        """Stores the statistics an agent collected in one periodic run.
+
+        :param stats: mapping of load balancer ids to their statistics
+        """
+        self.plugin.db.update_loadbalancers_stats(context, stats or {})
+        self._update_members_operating_status(context, stats or {})
+
+    def _update_members_operating_status(self, context, stats):
+        # haproxy reports the members it marked as down as INACTIVE
+        operating_statuses = {}
+        for lb_stats in stats.values():
+            members_stats = (lb_stats or {}).get('members') or {}
+            for member_id, member_stats in members_stats.items():
+                operating_statuses[member_id] = (
+                    lb_const.ONLINE if member_stats.get(
+                        lb_const.STATS_STATUS) == constants.ACTIVE
+                    else lb_const.OFFLINE)
+        self.plugin.db.update_members_operating_status(context,
+                                                       operating_statuses)
@@ -14,7 +14,12 @@
 
 from neutron.common import exceptions as n_exc
 from neutron.common import rpc as n_rpc
+from neutron import context as ncontext
 from neutron.db import agents_db
+from neutron.i18n import _LE
+from neutron.i18n import _LI
+from neutron.i18n import _LW
+from neutron.openstack.common import loopingcall
 from neutron.services import provider_configuration as provconf
 from oslo_config import cfg
 from oslo_log import log as logging
@@ -36,6 +41,18 @@ AGENT_SCHEDULER_OPTS = [
                default='neutron_lbaas.agent_scheduler.ChanceScheduler',
                help=_('Driver to use for scheduling '
                       'to a default loadbalancer agent')),
+    cfg.IntOpt('loadbalancer_rebalance_interval', default=0,
+               help=_('Seconds between runs moving load balancers off dead, '
+                      'disabled and overloaded agents. 0 disables '
+                      'rebalancing')),
+    cfg.IntOpt('loadbalancer_agent_max_load', default=0,
+               help=_('Load, in load balancers plus members, above which an '
+                      'agent is considered overloaded when rebalancing. '
+                      '0 only moves load balancers off dead and disabled '
+                      'agents')),
+    cfg.IntOpt('loadbalancer_rebalance_batch_size', default=10,
+               help=_('Maximum number of load balancers moved in one '
+                      'rebalancing run')),
 ]
 
 cfg.CONF.register_opts(AGENT_SCHEDULER_OPTS)
@@ -60,6 +77,7 @@ class LoadBalancerAgentApi(object):
 
     # history
     #   1.0 Initial version
+    #   1.1 Added batch_members
     #
 
     def __init__(self, topic):
@@ -127,6 +145,11 @@ class LoadBalancerAgentApi(object):
         cctxt = self.client.prepare(server=host)
         cctxt.cast(context, 'delete_member', member=member)
 
+    def batch_members(self, context, pool, member_ids, host):
+        cctxt = self.client.prepare(server=host, version='1.1')
+        cctxt.cast(context, 'batch_members', pool=pool,
+                   member_ids=member_ids)
+
     def create_healthmonitor(self, context, healthmonitor, host):
         cctxt = self.client.prepare(server=host)
         cctxt.cast(context, 'create_healthmonitor',
@@ -267,6 +290,20 @@ class MemberManager(driver_base.BaseMemberManager):
             context, member.pool.listener.loadbalancer.id)
         self.driver.agent_rpc.delete_member(context, member, agent['host'])
 
+    def batch(self, context, batch):
+        agent = self.driver.get_loadbalancer_agent(
+            context, batch.root_loadbalancer.id)
+        for member in batch.deleted:
+            self.driver.plugin.db.delete_pool_member(context, member.id)
+        member_ids = ([member.id for member in batch.created] +
+                      [member.id for _old, member in batch.updated])
+        if not member_ids:
+            # the agent only reports statuses of created and updated members
+            self.driver.plugin.db.update_loadbalancer_provisioning_status(
+                context, batch.root_loadbalancer.id)
+        self.driver.agent_rpc.batch_members(context, batch.pool, member_ids,
+                                            agent['host'])
+
 
 class HealthMonitorManager(driver_base.BaseHealthMonitorManager):
 
@@ -299,6 +336,130 @@ class HealthMonitorManager(driver_base.BaseHealthMonitorManager):
             context, healthmonitor, agent['host'])
 
 
+class LoadBalancerRebalancer(object):
+    """Moves a driver's load balancers off dead and overloaded agents.
+
+    Load balancers bound to agents which are down or administratively
+    disabled are moved to the least loaded live agent supporting the
+    driver's device driver. When max_load is set, agents whose load, in
+    load balancers plus members, exceeds it shed their lightest load
+    balancers to agents which stay below it. At most batch_size load
+    balancers are moved per run, each being undeployed from its old agent,
+    if that one is still alive, and deployed on the new one.
+    """
+
+    def __init__(self, driver, max_load=0, batch_size=10):
+        self.driver = driver
+        self.max_load = max_load
+        self.batch_size = batch_size
+
+    def start(self, interval):
+        rebalance_loop = loopingcall.FixedIntervalLoopingCall(self.rebalance)
+        rebalance_loop.start(interval=interval, initial_delay=interval)
+        return rebalance_loop
+
+    def rebalance(self):
+        context = ncontext.get_admin_context()
+        try:
+            moved = self.rebalance_agents(context)
+        except Exception:
+            LOG.exception(_LE('Error rebalancing load balancer agents'))
+        else:
+            if moved:
+                LOG.info(_LI('Moved %d load balancers to other agents'),
+                         moved)
+
+    def rebalance_agents(self, context):
+        """Runs one rebalancing pass.
+
+        :return: the number of load balancers which were moved
+        """
+        db = self.driver.plugin.db
+        agents = db.get_lbaas_agent_candidates(self.driver.device_driver,
+                                               db.get_lbaas_agents(context))
+        live_agents = [agent for agent in agents
+                       if agent['admin_state_up'] and
+                       not db.is_agent_down(agent['heartbeat_timestamp'])]
+        if not agents or (len(live_agents) == len(agents) and
+                          not self.max_load):
+            return 0
+        if not live_agents:
+            LOG.warn(_LW('No live lbaas agent supporting device driver %s '
+                         'to move load balancers to'),
+                     self.driver.device_driver)
+            return 0
+
+        loads = dict((agent_id, sum(load)) for agent_id, load in
+                     db.get_lbaas_agent_loads(
+                         context, [agent['id'] for agent in agents]).items())
+        moved = 0
+        for loadbalancer_id, weight, source in self._get_moves(
+                context, agents, live_agents, loads):
+            if moved >= self.batch_size:
+                break
+            is_live = source in live_agents
+            targets = [agent for agent in live_agents
+                       if agent['id'] != source['id']]
+            if is_live:
+                # only move to agents that end up less loaded than the
+                # source and not overloaded themselves
+                targets = [agent for agent in targets
+                           if loads[agent['id']] + weight <= self.max_load
+                           and loads[agent['id']] + weight <
+                           loads[source['id']]]
+            if not targets:
+                continue
+            target = min(targets, key=lambda agent: loads[agent['id']])
+            if self._move(context, loadbalancer_id, source, target, is_live):
+                loads[source['id']] -= weight
+                loads[target['id']] += weight
+                moved += 1
+        return moved
+
+    def _get_moves(self, context, agents, live_agents, loads):
+        """Yields (load balancer id, weight, source agent) tuples."""
+        db = self.driver.plugin.db
+        for agent in agents:
+            if not loads[agent['id']]:
+                continue
+            is_live = agent in live_agents
+            if is_live and (not self.max_load or
+                            loads[agent['id']] <= self.max_load):
+                continue
+            lb_loads = db.get_loadbalancer_loads_on_lbaas_agent(
+                context, agent['id'])
+            excess = loads[agent['id']] - self.max_load
+            # the lightest load balancers are the cheapest to move
+            for loadbalancer_id, member_count in sorted(
+                    lb_loads.items(), key=lambda lb_load: lb_load[1]):
+                if is_live and excess <= 0:
+                    break
+                excess -= member_count + 1
+                yield loadbalancer_id, member_count + 1, agent
+
+    def _move(self, context, loadbalancer_id, source, target, undeploy):
+        db = self.driver.plugin.db
+        loadbalancer = db.get_loadbalancer(context, loadbalancer_id)
+        provider = loadbalancer.provider
+        if (provider and self.driver.plugin.drivers.get(
+                provider.provider_name) is not self.driver):
+            # hosted by the same agents but managed by another driver
+            return False
+        if not db.rebind_loadbalancer(context, loadbalancer_id,
+                                      source['id'], target['id']):
+            return False
+        LOG.info(_LI('Moving load balancer %(loadbalancer_id)s from lbaas '
+                     'agent %(source)s to %(target)s'),
+                 {'loadbalancer_id': loadbalancer_id,
+                  'source': source['id'], 'target': target['id']})
+        if undeploy:
+            self.driver.agent_rpc.delete_loadbalancer(
+                context, loadbalancer, source['host'])
+        self.driver.agent_rpc.create_loadbalancer(
+            context, loadbalancer, target['host'], self.driver.device_driver)
+        return True
+
+
 class AgentDriverBase(driver_base.LoadBalancerBaseDriver):
 
     # name of device driver that should be used by the agent;
@@ -329,6 +490,12 @@ class AgentDriverBase(driver_base.LoadBalancerBaseDriver):
         self.loadbalancer_scheduler = importutils.import_object(
             lb_sched_driver)
 
+        self.rebalancer = LoadBalancerRebalancer(
+            self, cfg.CONF.loadbalancer_agent_max_load,
+            cfg.CONF.loadbalancer_rebalance_batch_size)
+        if cfg.CONF.loadbalancer_rebalance_interval:
+            self.rebalancer.start(cfg.CONF.loadbalancer_rebalance_interval)
+
     def _set_callbacks_on_plugin(self):
         # other agent based plugin driver might already set callbacks on plugin
         if hasattr(self.plugin, 'agent_callbacks'):
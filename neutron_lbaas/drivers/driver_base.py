@@ -80,6 +80,19 @@ class BaseMemberManager(driver_mixins.BaseManagerMixin):
     def db_delete_method(self):
         return self.driver.plugin.db.delete_member
 
+    def batch(self, context, batch):
+        """Applies a data_models.MemberBatch of changes to one pool.
+
+        Drivers able to apply several member changes at once should override
+        this; by default every change goes through delete, update or create.
+        """
+        for member in batch.deleted:
+            self.delete(context, member)
+        for old_member, member in batch.updated:
+            self.update(context, old_member, member)
+        for member in batch.created:
+            self.create(context, member)
+
 
 class BaseHealthMonitorManager(driver_mixins.BaseManagerMixin):
     model_class = models.HealthMonitorV2
@@ -13,6 +13,7 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import hashlib
 import os
 import shutil
 import socket
@@ -42,7 +43,15 @@ STATS_TYPE_BACKEND_REQUEST = 2
 STATS_TYPE_BACKEND_RESPONSE = '1'
 STATS_TYPE_SERVER_REQUEST = 4
 STATS_TYPE_SERVER_RESPONSE = '2'
+STATS_READ_SIZE = 65536
+STATS_SOCKET_TIMEOUT = 10
+# only these columns of haproxy's csv stats are kept when parsing
+STATS_COLUMNS = (('type', 'svname', 'status', 'check_status', 'chkfail') +
+                 tuple(sorted(set(jinja_cfg.STATS_MAP.values()))))
+STATS_COLUMN_INDEX = dict((name, i) for i, name in enumerate(STATS_COLUMNS))
 DRIVER_NAME = 'haproxy_ns'
+# files stored along the configuration which haproxy reads when reloaded
+TLS_FILE_EXTENSIONS = ('.pem', '.crt-list')
 
 STATE_PATH_V2_APPEND = 'v2'
 
@@ -53,6 +62,40 @@ def get_ns_name(namespace_id):
     return NS_PREFIX + namespace_id
 
 
+def _read_lines(sock, read_size=STATS_READ_SIZE):
+    """Yields the lines received on sock until the peer closes it."""
+    pending = ''
+    while True:
+        chunk = sock.recv(read_size)
+        if not chunk:
+            break
+        lines = (pending + chunk).split('\n')
+        pending = lines.pop()
+        for line in lines:
+            yield line
+    if pending:
+        yield pending
+
+
+def _parse_stats(lines, columns=STATS_COLUMNS):
+    """Incrementally parses the csv output of haproxy's show stat.
+
+    A tuple holding the values of the requested columns is yielded for each
+    proxy or server line; columns missing from the output are left empty.
+    """
+    lines = iter(lines)
+    header = next(lines, '')
+    names = [name.strip('# ') for name in header.split(',')]
+    indexes = [names.index(column) if column in names else None
+               for column in columns]
+    for line in lines:
+        if not line:
+            continue
+        values = line.split(',')
+        yield tuple(values[i].strip() if i is not None and i < len(values)
+                    else '' for i in indexes)
+
+
 class HaproxyNSDriver(agent_device_driver.AgentDeviceDriver):
 
     def __init__(self, conf, plugin_rpc):
@@ -70,6 +113,8 @@ class HaproxyNSDriver(agent_device_driver.AgentDeviceDriver):
 
         self.vif_driver = vif_driver
         self.deployed_loadbalancers = {}
+        self.reloads_performed = 0
+        self.reloads_avoided = 0
         self._loadbalancer = LoadBalancerManager(self)
         self._listener = ListenerManager(self)
         self._pool = PoolManager(self)
@@ -99,6 +144,10 @@ class HaproxyNSDriver(agent_device_driver.AgentDeviceDriver):
     def get_name(self):
         return DRIVER_NAME
 
+    def get_metrics(self):
+        return {'reloads_performed': self.reloads_performed,
+                'reloads_avoided': self.reloads_avoided}
+
     @n_utils.synchronized('haproxy-driver')
     def undeploy_instance(self, loadbalancer_id, **kwargs):
         cleanup_namespace = kwargs.get('cleanup_namespace', False)
@@ -145,13 +194,10 @@ class HaproxyNSDriver(agent_device_driver.AgentDeviceDriver):
         socket_path = self._get_state_file_path(loadbalancer_id,
                                                 'haproxy_stats.sock', False)
         if os.path.exists(socket_path):
-            parsed_stats = self._get_stats_from_socket(
+            return self._get_stats_from_socket(
                 socket_path,
                 entity_type=(STATS_TYPE_BACKEND_REQUEST |
                              STATS_TYPE_SERVER_REQUEST))
-            lb_stats = self._get_backend_stats(parsed_stats)
-            lb_stats['members'] = self._get_servers_stats(parsed_stats)
-            return lb_stats
         else:
             LOG.warn(_LW('Stats socket not found for loadbalancer %s') %
                      loadbalancer_id)
@@ -175,10 +221,23 @@ class HaproxyNSDriver(agent_device_driver.AgentDeviceDriver):
         return True
 
     def update(self, loadbalancer):
+        conf_path = self._get_state_file_path(loadbalancer.id, 'haproxy.conf')
+        tls_digest = self._get_tls_digest(loadbalancer.id)
+        # rendering also stores the listeners' TLS certificates
+        config_str = self._render_config(loadbalancer)
+        if (config_str == self._read_config(conf_path) and
+                tls_digest == self._get_tls_digest(loadbalancer.id)):
+            LOG.debug('Configuration of loadbalancer %s is unchanged, '
+                      'skipping haproxy reload', loadbalancer.id)
+            self.reloads_avoided += 1
+            self.deployed_loadbalancers[loadbalancer.id] = loadbalancer
+            return
+
         pid_path = self._get_state_file_path(loadbalancer.id, 'haproxy.pid')
         extra_args = ['-sf']
         extra_args.extend(p.strip() for p in open(pid_path, 'r'))
-        self._spawn(loadbalancer, extra_args)
+        self._spawn(loadbalancer, extra_args, config_str=config_str)
+        self.reloads_performed += 1
 
     def exists(self, loadbalancer_id):
         namespace = get_ns_name(loadbalancer_id)
@@ -213,58 +272,44 @@ class HaproxyNSDriver(agent_device_driver.AgentDeviceDriver):
                 loadbalancer.provisioning_status != constants.PENDING_DELETE)
 
     def _get_stats_from_socket(self, socket_path, entity_type):
+        s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        s.settimeout(STATS_SOCKET_TIMEOUT)
         try:
-            s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
             s.connect(socket_path)
-            s.send('show stat -1 %s -1\n' % entity_type)
-            raw_stats = ''
-            chunk_size = 1024
-            while True:
-                chunk = s.recv(chunk_size)
-                raw_stats += chunk
-                if len(chunk) < chunk_size:
-                    break
-
-            return self._parse_stats(raw_stats)
+            s.sendall('show stat -1 %s -1\n' % entity_type)
+            # haproxy closes the connection once the whole output is sent
+            return self._collect_stats(_parse_stats(_read_lines(s)))
         except socket.error as e:
             LOG.warn(_LW('Error while connecting to stats socket: %s'), e)
-            return {}
-
-    def _parse_stats(self, raw_stats):
-        stat_lines = raw_stats.splitlines()
-        if len(stat_lines) < 2:
-            return []
-        stat_names = [name.strip('# ') for name in stat_lines[0].split(',')]
-        res_stats = []
-        for raw_values in stat_lines[1:]:
-            if not raw_values:
-                continue
-            stat_values = [value.strip() for value in raw_values.split(',')]
-            res_stats.append(dict(zip(stat_names, stat_values)))
-
-        return res_stats
-
-    def _get_backend_stats(self, parsed_stats):
+            return {'members': {}}
+        finally:
+            s.close()
+
+    def _collect_stats(self, parsed_stats):
+        """Builds the load balancer stats from parsed stats in one pass."""
+        lb_stats = None
+        members = {}
         for stats in parsed_stats:
-            if stats.get('type') == STATS_TYPE_BACKEND_RESPONSE:
-                unified_stats = dict((k, stats.get(v, ''))
-                                     for k, v in jinja_cfg.STATS_MAP.items())
-                return unified_stats
-
-        return {}
-
-    def _get_servers_stats(self, parsed_stats):
-        res = {}
-        for stats in parsed_stats:
-            if stats.get('type') == STATS_TYPE_SERVER_RESPONSE:
-                res[stats['svname']] = {
-                    lb_const.STATS_STATUS: (constants.INACTIVE
-                                            if stats['status'] == 'DOWN'
-                                            else constants.ACTIVE),
-                    lb_const.STATS_HEALTH: stats['check_status'],
-                    lb_const.STATS_FAILED_CHECKS: stats['chkfail']
+            stats_type = stats[STATS_COLUMN_INDEX['type']]
+            if stats_type == STATS_TYPE_SERVER_RESPONSE:
+                members[stats[STATS_COLUMN_INDEX['svname']]] = {
+                    lb_const.STATS_STATUS: (
+                        constants.INACTIVE
+                        if stats[STATS_COLUMN_INDEX['status']] == 'DOWN'
+                        else constants.ACTIVE),
+                    lb_const.STATS_HEALTH: stats[
+                        STATS_COLUMN_INDEX['check_status']],
+                    lb_const.STATS_FAILED_CHECKS: stats[
+                        STATS_COLUMN_INDEX['chkfail']]
                 }
-        return res
+            elif (stats_type == STATS_TYPE_BACKEND_RESPONSE and
+                    lb_stats is None):
+                lb_stats = dict((k, stats[STATS_COLUMN_INDEX[v]])
+                                for k, v in jinja_cfg.STATS_MAP.items())
+
+        lb_stats = lb_stats or {}
+        lb_stats['members'] = members
+        return lb_stats
 
     def _get_state_file_path(self, loadbalancer_id, kind,
                              ensure_state_dir=True):
@@ -331,20 +376,51 @@ class HaproxyNSDriver(agent_device_driver.AgentDeviceDriver):
         interface_name = self.vif_driver.get_device_name(port)
         self.vif_driver.unplug(interface_name, namespace=namespace)
 
-    def _spawn(self, loadbalancer, extra_cmd_args=()):
-        namespace = get_ns_name(loadbalancer.id)
-        conf_path = self._get_state_file_path(loadbalancer.id, 'haproxy.conf')
-        pid_path = self._get_state_file_path(loadbalancer.id,
-                                             'haproxy.pid')
+    def _render_config(self, loadbalancer):
         sock_path = self._get_state_file_path(loadbalancer.id,
                                               'haproxy_stats.sock')
         user_group = self.conf.haproxy.user_group
         haproxy_base_dir = self._get_state_file_path(loadbalancer.id, '')
-        jinja_cfg.save_config(conf_path,
-                              loadbalancer,
-                              sock_path,
-                              user_group,
-                              haproxy_base_dir)
+        return jinja_cfg.render_loadbalancer_obj(loadbalancer,
+                                                 user_group,
+                                                 sock_path,
+                                                 haproxy_base_dir)
+
+    def _read_config(self, conf_path):
+        try:
+            with open(conf_path, 'r') as conf_file:
+                return conf_file.read()
+        except IOError:
+            return None
+
+    def _get_tls_digest(self, loadbalancer_id):
+        """Returns a digest of the TLS files stored for a loadbalancer.
+
+        Those are the PEM files of the certificates and the crt-lists of
+        the SNI certificates, which the configuration only refers to.
+        """
+        conf_dir = os.path.dirname(
+            self._get_state_file_path(loadbalancer_id, '', False))
+        digest = hashlib.sha1()
+        for root, dirs, files in os.walk(conf_dir):
+            dirs.sort()
+            for name in sorted(files):
+                if not name.endswith(TLS_FILE_EXTENSIONS):
+                    continue
+                tls_path = os.path.join(root, name)
+                digest.update(tls_path)
+                with open(tls_path, 'r') as tls_file:
+                    digest.update(tls_file.read())
+        return digest.hexdigest()
+
+    def _spawn(self, loadbalancer, extra_cmd_args=(), config_str=None):
+        namespace = get_ns_name(loadbalancer.id)
+        conf_path = self._get_state_file_path(loadbalancer.id, 'haproxy.conf')
+        pid_path = self._get_state_file_path(loadbalancer.id,
+                                             'haproxy.pid')
+        if config_str is None:
+            config_str = self._render_config(loadbalancer)
+        linux_utils.replace_file(conf_path, config_str)
         cmd = ['haproxy', '-f', conf_path, '-p', pid_path]
         cmd.extend(extra_cmd_args)
 
@@ -321,17 +321,15 @@ class HaproxyNSDriver(driver_base.LoadBalancerBaseDriver):
                     yield member
 
     def _set_member_status(self, context, loadbalancer, members_stats):
-        for member in self._get_members(loadbalancer):
-            if member.id in members_stats:
-                status = members_stats[member.id].get('status')
-                if status and status == constants.ACTIVE:
-                    self.plugin.db.update_status(
-                        context, self.member.model_class, member.id,
-                        operating_status=lb_const.ONLINE)
-                else:
-                    self.plugin.db.update_status(
-                        context, self.member.model_class, member.id,
-                        operating_status=lb_const.OFFLINE)
+        operating_statuses = dict(
+            (member.id, lb_const.ONLINE
+             if members_stats[member.id].get('status') == constants.ACTIVE
+             else lb_const.OFFLINE)
+            for member in self._get_members(loadbalancer)
+            if member.id in members_stats)
+        # only members whose status flipped are written
+        self.plugin.db.update_members_operating_status(context,
+                                                       operating_statuses)
 
     def _remove_config_directory(self, loadbalancer_id):
         conf_dir = os.path.dirname(
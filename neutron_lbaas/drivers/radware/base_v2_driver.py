@@ -31,6 +31,11 @@ driver_opts = [
     cfg.StrOpt('vdirect_password',
                default='radware',
                help=_('vDirect user password.')),
+    cfg.IntOpt('vdirect_connection_pool_size',
+               default=5,
+               help=_('Maximum number of idle connections to a vDirect '
+                      'server kept alive for the next requests. '
+                      'Default: 5.')),
     cfg.StrOpt('service_adc_type',
                default="VA",
                help=_('Service ADC type. Default: VA.')),
@@ -14,6 +14,8 @@
 
 import base64
 import httplib
+import socket
+import threading
 
 from neutron.i18n import _LE, _LW
 from oslo_log import helpers as log_helpers
@@ -29,9 +31,18 @@ RESP_REASON = 1
 RESP_STR = 2
 RESP_DATA = 3
 
+# raised when sending a request on a kept alive connection the server
+# already closed
+STALE_CONNECTION_ERRORS = (httplib.BadStatusLine, httplib.CannotSendRequest,
+                           socket.error)
+
 
 class vDirectRESTClient(object):
-    """REST server proxy to Radware vDirect."""
+    """REST server proxy to Radware vDirect.
+
+    Connections are kept alive between requests, up to pool_size idle ones
+    per server, and shared by all the threads using the client.
+    """
     @log_helpers.log_method_call
     def __init__(self,
                  server='localhost',
@@ -41,13 +52,18 @@ class vDirectRESTClient(object):
                  port=2189,
                  ssl=True,
                  timeout=5000,
-                 base_uri=''):
+                 base_uri='',
+                 pool_size=5):
         self.server = server
         self.secondary_server = secondary_server
         self.port = port
         self.ssl = ssl
         self.base_uri = base_uri
         self.timeout = timeout
+        self.pool_size = pool_size
+        # server -> idle connections, the most recently used last
+        self._idle_connections = {}
+        self._lock = threading.Lock()
         if user and password:
             self.auth = base64.encodestring('%s:%s' % (user, password))
             self.auth = self.auth.replace('\n', '')
@@ -112,25 +128,24 @@ class vDirectRESTClient(object):
             headers = {'Authorization': 'Basic %s' % self.auth}
         else:
             headers['Authorization'] = 'Basic %s' % self.auth
-        conn = None
-        if self.ssl:
-            conn = httplib.HTTPSConnection(
-                self.server, self.port, timeout=self.timeout)
-            if conn is None:
-                LOG.error(_LE('vdirectRESTClient: Could not establish HTTPS '
-                          'connection'))
-                return 0, None, None, None
-        else:
-            conn = httplib.HTTPConnection(
-                self.server, self.port, timeout=self.timeout)
-            if conn is None:
-                LOG.error(_LE('vdirectRESTClient: Could not establish HTTP '
-                          'connection'))
-                return 0, None, None, None
-
+        server = self.server
+        conn, reused = self._get_connection(server)
         try:
-            conn.request(action, uri, body, headers)
-            response = conn.getresponse()
+            try:
+                response = self._send(conn, action, uri, body, headers)
+            except socket.timeout:
+                # the server may still be processing the request
+                raise
+            except STALE_CONNECTION_ERRORS:
+                if not reused:
+                    raise
+                # the server closed the connection while it was idle
+                LOG.debug('vdirectRESTClient: retrying %(action)s on a new '
+                          'connection to %(server)s',
+                          {'action': action, 'server': server})
+                conn.close()
+                conn = self._new_connection(server)
+                response = self._send(conn, action, uri, body, headers)
             respstr = response.read()
             respdata = respstr
             try:
@@ -143,6 +158,51 @@ class vDirectRESTClient(object):
             log_dict = {'action': action, 'e': e}
             LOG.error(_LE('vdirectRESTClient: %(action)s failure, %(e)r'),
                       log_dict)
-            ret = -1, None, None, None
-        conn.close()
+            conn.close()
+            return -1, None, None, None
+        if response.will_close:
+            conn.close()
+        else:
+            self._release_connection(server, conn)
         return ret
+
+    @staticmethod
+    def _send(conn, action, uri, body, headers):
+        conn.request(action, uri, body, headers)
+        return conn.getresponse()
+
+    def _new_connection(self, server):
+        if self.ssl:
+            return httplib.HTTPSConnection(
+                server, self.port, timeout=self.timeout)
+        return httplib.HTTPConnection(
+            server, self.port, timeout=self.timeout)
+
+    def _get_connection(self, server):
+        """Returns an idle connection to server, or a new one.
+
+        :return: the connection and whether it was used before
+        """
+        with self._lock:
+            idle = self._idle_connections.get(server)
+            if idle:
+                return idle.pop(), True
+        return self._new_connection(server), False
+
+    def _release_connection(self, server, conn):
+        """Keeps a connection alive for the next requests to server."""
+        with self._lock:
+            idle = self._idle_connections.setdefault(server, [])
+            if len(idle) < self.pool_size:
+                idle.append(conn)
+                return
+        conn.close()
+
+    def close(self):
+        """Closes the idle connections."""
+        with self._lock:
+            idle_connections = self._idle_connections
+            self._idle_connections = {}
+        for idle in idle_connections.values():
+            for conn in idle:
+                conn.close()
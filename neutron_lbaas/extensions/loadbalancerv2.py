@@ -106,6 +106,10 @@ class SessionPersistenceConfigurationInvalid(nexception.BadRequest):
     message = _("Session Persistence Invalid: %(msg)s")
 
 
+class MemberBatchInvalid(nexception.BadRequest):
+    message = _("Member batch invalid: %(msg)s")
+
+
 class TLSDefaultContainerNotSpecified(nexception.BadRequest):
     message = _("Default TLS container was not specified")
 
@@ -350,6 +354,66 @@ SUB_RESOURCE_ATTRIBUTE_MAP = {
 }
 
 
+MEMBER_BATCH_OPERATIONS = ('create', 'update', 'delete')
+
+
+def prepare_member_batch(context, body):
+    """Validates the body of a batch_members request.
+
+    The body holds up to three lists: 'create' with the members to create,
+    'update' with the attributes to update, each along with the id of its
+    member, and 'delete' with the ids of the members to delete. Members are
+    validated like the bodies of the single member requests.
+
+    :return: (list of member dicts to create, mapping of member ids to the
+             attributes to update, list of ids of the members to delete)
+    """
+    if (not isinstance(body, dict) or not body or
+            set(body) - set(MEMBER_BATCH_OPERATIONS)):
+        raise MemberBatchInvalid(
+            msg=_("the body may only hold %s lists") %
+            ', '.join(MEMBER_BATCH_OPERATIONS))
+    for operation in MEMBER_BATCH_OPERATIONS:
+        if not isinstance(body.get(operation, []), list):
+            raise MemberBatchInvalid(msg=_("%s is not a list") % operation)
+    params = SUB_RESOURCE_ATTRIBUTE_MAP['members']['parameters']
+
+    created = []
+    for member in body.get('create', []):
+        if not isinstance(member, dict):
+            raise MemberBatchInvalid(msg=_("members to create must be "
+                                           "dictionaries"))
+        created.append(base.Controller.prepare_request_body(
+            context, {'member': member}, True, 'member', params)['member'])
+
+    updated = {}
+    for member in body.get('update', []):
+        if (not isinstance(member, dict) or
+                not isinstance(member.get('id'), six.string_types)):
+            raise MemberBatchInvalid(msg=_("members to update must be "
+                                           "dictionaries with an id"))
+        member = dict(member)
+        member_id = member.pop('id')
+        if member_id in updated:
+            raise MemberBatchInvalid(msg=_("member %s is updated more than "
+                                           "once") % member_id)
+        updated[member_id] = base.Controller.prepare_request_body(
+            context, {'member': member}, False, 'member', params)['member']
+
+    deleted_ids = body.get('delete', [])
+    if not all(isinstance(member_id, six.string_types)
+               for member_id in deleted_ids):
+        raise MemberBatchInvalid(msg=_("members to delete must be given by "
+                                       "id"))
+    if len(set(deleted_ids)) != len(deleted_ids):
+        raise MemberBatchInvalid(msg=_("a member is deleted more than once"))
+    both = set(deleted_ids) & set(updated)
+    if both:
+        raise MemberBatchInvalid(msg=_("member %s is both updated and "
+                                       "deleted") % sorted(both)[0])
+    return created, updated, deleted_ids
+
+
 lbaasv2_quota_opts = [
     cfg.IntOpt('quota_loadbalancer',
                default=10,
@@ -401,7 +465,8 @@ class Loadbalancerv2(extensions.ExtensionDescriptor):
     def get_resources(cls):
         plural_mappings = resource_helper.build_plural_mappings(
             {}, RESOURCE_ATTRIBUTE_MAP)
-        action_map = {'loadbalancer': {'stats': 'GET', 'statuses': 'GET'}}
+        action_map = {'loadbalancer': {'stats': 'GET', 'statuses': 'GET'},
+                      'pool': {'batch_members': 'PUT'}}
         plural_mappings['members'] = 'member'
         plural_mappings['sni_container_ids'] = 'sni_container_id'
         attr.PLURALS.update(plural_mappings)
@@ -552,6 +617,9 @@ class LoadBalancerPluginBaseV2(service_base.ServicePluginBase):
     def delete_pool_member(self, context, id, pool_id):
         pass
 
+    def batch_members(self, context, id, body):
+        raise NotImplementedError()
+
     @abc.abstractmethod
     def get_healthmonitors(self, context, filters=None, fields=None):
         pass
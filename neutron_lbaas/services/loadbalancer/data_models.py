@@ -25,35 +25,63 @@ These data models do provide methods for instantiation from SQLAlchemy models
 and also converting to dictionaries.
 """
 
+import operator
+
 from neutron.db import model_base
 from neutron.db import models_v2
 from neutron.db import servicetype_db
+import sqlalchemy as sa
 from sqlalchemy.ext import orderinglist
 from sqlalchemy.orm import collections
 
 from neutron_lbaas.db.loadbalancer import models
 
 
+_UNSET = object()
+
+
 class BaseDataModel(object):
 
+    # Every subclass lists the attributes set by its __init__ in fields, and
+    # uses them, along with any attribute only set by from_dict, as its
+    # __slots__.  Instances then have no __dict__, which matters for the
+    # graphs of thousands of members held by agents.
+    __slots__ = ()
+    fields = ()
+
     def to_dict(self, **kwargs):
+        """Converts the graph starting at this instance into dictionaries.
+
+        Keyword arguments set to False leave out attributes of this instance
+        only.  The graph is walked with a stack rather than by recursing
+        into every related instance.
+        """
         ret = {}
-        for attr in self.__dict__:
-            if attr.startswith('_') or not kwargs.get(attr, True):
-                continue
-            if isinstance(getattr(self, attr), list):
-                ret[attr] = []
-                for item in self.__dict__[attr]:
-                    if isinstance(item, BaseDataModel):
-                        ret[attr].append(item.to_dict())
-                    else:
-                        ret[attr] = item
-            elif isinstance(getattr(self, attr), BaseDataModel):
-                ret[attr] = self.__dict__[attr].to_dict()
-            elif isinstance(self.__dict__[attr], unicode):
-                ret[attr.encode('utf8')] = self.__dict__[attr].encode('utf8')
-            else:
-                ret[attr] = self.__dict__[attr]
+        stack = [(self, ret, kwargs)]
+        while stack:
+            obj, obj_dict, excluded = stack.pop()
+            for attr in _get_dict_fields(obj.__class__):
+                if excluded and not excluded.get(attr, True):
+                    continue
+                value = getattr(obj, attr, _UNSET)
+                if value is _UNSET:
+                    continue
+                if isinstance(value, list):
+                    obj_dict[attr] = []
+                    for item in value:
+                        if isinstance(item, BaseDataModel):
+                            item_dict = {}
+                            obj_dict[attr].append(item_dict)
+                            stack.append((item, item_dict, None))
+                        else:
+                            obj_dict[attr] = item
+                elif isinstance(value, BaseDataModel):
+                    obj_dict[attr] = {}
+                    stack.append((value, obj_dict[attr], None))
+                elif isinstance(value, unicode):
+                    obj_dict[attr] = value.encode('utf8')
+                else:
+                    obj_dict[attr] = value
         return ret
 
     def to_api_dict(self, **kwargs):
@@ -65,33 +93,18 @@ class BaseDataModel(object):
 
     @classmethod
     def from_sqlalchemy_model(cls, sa_model, calling_class=None):
-        instance = cls()
-        for attr_name in vars(instance):
-            if attr_name.startswith('_'):
-                continue
-            attr = getattr(sa_model, attr_name)
-            # Handles M:1 or 1:1 relationships
-            if isinstance(attr, model_base.BASEV2):
-                if hasattr(instance, attr_name):
-                    data_class = SA_MODEL_TO_DATA_MODEL_MAP[attr.__class__]
-                    if calling_class != data_class and data_class:
-                        setattr(instance, attr_name,
-                                data_class.from_sqlalchemy_model(
-                                    attr, calling_class=cls))
-            # Handles 1:M or M:M relationships
-            elif (isinstance(attr, collections.InstrumentedList) or
-                 isinstance(attr, orderinglist.OrderingList)):
-                for item in attr:
-                    if hasattr(instance, attr_name):
-                        data_class = SA_MODEL_TO_DATA_MODEL_MAP[item.__class__]
-                        attr_list = getattr(instance, attr_name) or []
-                        attr_list.append(data_class.from_sqlalchemy_model(
-                            item, calling_class=cls))
-                        setattr(instance, attr_name, attr_list)
-            # This isn't a relationship so it must be a "primitive"
-            else:
-                setattr(instance, attr_name, attr)
-        return instance
+        converter = _get_converter(cls, sa_model.__class__)
+        return converter.convert(sa_model, calling_class=calling_class)
+
+    @classmethod
+    def from_sqlalchemy_row(cls, row):
+        """Builds an instance from a row of a query for columns.
+
+        The columns are matched with the attributes by the names they were
+        queried with, and relationships are left unset.
+        """
+        converter = _get_converter(cls, DATA_MODEL_TO_SA_MODEL_MAP[cls])
+        return converter.convert_row(row)
 
     @property
     def root_loadbalancer(self):
@@ -110,6 +123,121 @@ class BaseDataModel(object):
         return lb
 
 
+def _set_attribute(instance, attr_name, attr, calling_class):
+    # Handles M:1 or 1:1 relationships
+    if isinstance(attr, model_base.BASEV2):
+        data_class = SA_MODEL_TO_DATA_MODEL_MAP[attr.__class__]
+        if calling_class != data_class and data_class:
+            setattr(instance, attr_name, data_class.from_sqlalchemy_model(
+                attr, calling_class=instance.__class__))
+    # Handles 1:M or M:M relationships
+    elif (isinstance(attr, collections.InstrumentedList) or
+          isinstance(attr, orderinglist.OrderingList)):
+        for item in attr:
+            data_class = SA_MODEL_TO_DATA_MODEL_MAP[item.__class__]
+            attr_list = getattr(instance, attr_name) or []
+            attr_list.append(data_class.from_sqlalchemy_model(
+                item, calling_class=instance.__class__))
+            setattr(instance, attr_name, attr_list)
+    # This isn't a relationship so it must be a "primitive"
+    else:
+        setattr(instance, attr_name, attr)
+
+
+class _ModelConverter(object):
+    """Builds instances of a data model class from a SQLAlchemy model.
+
+    Whether an attribute holds a column value, a related model or a list of
+    them only depends on the mapping of the SQLAlchemy model, so it is
+    worked out once per pair of classes instead of for every attribute of
+    every converted model.
+    """
+
+    def __init__(self, data_class, sa_class):
+        mapper = sa.inspect(sa_class)
+        self.data_class = data_class
+        self.columns = []
+        self.scalars = []
+        self.collections = []
+        # anything else, e.g. plain properties, is converted the slow way
+        self.others = []
+        for attr_name in data_class.fields:
+            relationship = mapper.relationships.get(attr_name)
+            if attr_name in mapper.column_attrs:
+                self.columns.append(attr_name)
+            elif relationship is None or relationship.lazy == 'dynamic':
+                self.others.append(attr_name)
+            elif relationship.uselist:
+                self.collections.append(attr_name)
+            else:
+                self.scalars.append(attr_name)
+        self.column_names = frozenset(self.columns)
+        if len(self.columns) > 1:
+            self.get_columns = operator.attrgetter(*self.columns)
+        else:
+            self.get_columns = lambda sa_model: tuple(
+                getattr(sa_model, attr_name) for attr_name in self.columns)
+
+    def convert(self, sa_model, calling_class=None):
+        data_class = self.data_class
+        instance = data_class()
+        for attr_name, value in zip(self.columns,
+                                    self.get_columns(sa_model)):
+            setattr(instance, attr_name, value)
+        for attr_name in self.scalars:
+            related = getattr(sa_model, attr_name)
+            if related is None:
+                setattr(instance, attr_name, None)
+                continue
+            related_class = SA_MODEL_TO_DATA_MODEL_MAP[related.__class__]
+            if related_class and related_class != calling_class:
+                setattr(instance, attr_name, _get_converter(
+                    related_class, related.__class__).convert(
+                        related, calling_class=data_class))
+        for attr_name in self.collections:
+            items = getattr(sa_model, attr_name)
+            if items:
+                setattr(instance, attr_name, [
+                    _get_converter(SA_MODEL_TO_DATA_MODEL_MAP[item.__class__],
+                                   item.__class__).convert(
+                        item, calling_class=data_class)
+                    for item in items])
+        for attr_name in self.others:
+            _set_attribute(instance, attr_name,
+                           getattr(sa_model, attr_name), calling_class)
+        return instance
+
+    def convert_row(self, row):
+        instance = self.data_class()
+        for attr_name, value in zip(row.keys(), row):
+            if attr_name in self.column_names:
+                setattr(instance, attr_name, value)
+        return instance
+
+
+_CONVERTERS = {}
+_DICT_FIELDS = {}
+
+
+def _get_dict_fields(data_class):
+    try:
+        return _DICT_FIELDS[data_class]
+    except KeyError:
+        fields = tuple(attr for attr in data_class.__slots__
+                       if not attr.startswith('_'))
+        _DICT_FIELDS[data_class] = fields
+        return fields
+
+
+def _get_converter(data_class, sa_class):
+    try:
+        return _CONVERTERS[data_class, sa_class]
+    except KeyError:
+        converter = _ModelConverter(data_class, sa_class)
+        _CONVERTERS[data_class, sa_class] = converter
+        return converter
+
+
 # NOTE(brandon-logan) AllocationPool, HostRoute, Subnet, IPAllocation, Port,
 # and ProviderResourceAssociation are defined here because there aren't any
 # data_models defined in core neutron or neutron services.  Instead of jumping
@@ -118,6 +246,9 @@ class BaseDataModel(object):
 # instead of these.
 class AllocationPool(BaseDataModel):
 
+    fields = ('start', 'end')
+    __slots__ = fields
+
     def __init__(self, start=None, end=None):
         self.start = start
         self.end = end
@@ -125,6 +256,9 @@ class AllocationPool(BaseDataModel):
 
 class HostRoute(BaseDataModel):
 
+    fields = ('destination', 'nexthop')
+    __slots__ = fields
+
     def __init__(self, destination=None, nexthop=None):
         self.destination = destination
         self.nexthop = nexthop
@@ -132,6 +266,13 @@ class HostRoute(BaseDataModel):
 
 class Subnet(BaseDataModel):
 
+    fields = ('id', 'name', 'tenant_id', 'network_id', 'ip_version', 'cidr',
+              'gateway_ip', 'enable_dhcp', 'ipv6_ra_mode',
+              'ipv6_address_mode', 'shared', 'dns_nameservers',
+              'host_routes', 'allocation_pools', 'subnetpool_id',
+              'ipv6_pd_enabled')
+    __slots__ = fields
+
     def __init__(self, id=None, name=None, tenant_id=None, network_id=None,
                  ip_version=None, cidr=None, gateway_ip=None, enable_dhcp=None,
                  ipv6_ra_mode=None, ipv6_address_mode=None, shared=None,
@@ -167,6 +308,9 @@ class Subnet(BaseDataModel):
 
 class IPAllocation(BaseDataModel):
 
+    fields = ('port_id', 'ip_address', 'subnet_id', 'network_id')
+    __slots__ = fields + ('subnet',)
+
     def __init__(self, port_id=None, ip_address=None, subnet_id=None,
                  network_id=None):
         self.port_id = port_id
@@ -188,6 +332,11 @@ class IPAllocation(BaseDataModel):
 
 class Port(BaseDataModel):
 
+    fields = ('id', 'tenant_id', 'name', 'network_id', 'mac_address',
+              'admin_state_up', 'status', 'device_id', 'device_owner',
+              'fixed_ips')
+    __slots__ = fields
+
     def __init__(self, id=None, tenant_id=None, name=None, network_id=None,
                  mac_address=None, admin_state_up=None, status=None,
                  device_id=None, device_owner=None, fixed_ips=None):
@@ -212,6 +361,9 @@ class Port(BaseDataModel):
 
 class ProviderResourceAssociation(BaseDataModel):
 
+    fields = ('provider_name', 'resource_id')
+    __slots__ = fields + ('device_driver',)
+
     def __init__(self, provider_name=None, resource_id=None):
         self.provider_name = provider_name
         self.resource_id = resource_id
@@ -226,6 +378,9 @@ class ProviderResourceAssociation(BaseDataModel):
 
 class SessionPersistence(BaseDataModel):
 
+    fields = ('pool_id', 'type', 'cookie_name', 'pool')
+    __slots__ = fields
+
     def __init__(self, pool_id=None, type=None, cookie_name=None,
                  pool=None):
         self.pool_id = pool_id
@@ -248,6 +403,10 @@ class SessionPersistence(BaseDataModel):
 
 class LoadBalancerStatistics(BaseDataModel):
 
+    fields = ('loadbalancer_id', 'bytes_in', 'bytes_out', 'active_connections',
+              'total_connections', 'loadbalancer')
+    __slots__ = fields
+
     def __init__(self, loadbalancer_id=None, bytes_in=None, bytes_out=None,
                  active_connections=None, total_connections=None,
                  loadbalancer=None):
@@ -265,6 +424,11 @@ class LoadBalancerStatistics(BaseDataModel):
 
 class HealthMonitor(BaseDataModel):
 
+    fields = ('id', 'tenant_id', 'type', 'delay', 'timeout', 'max_retries',
+              'http_method', 'url_path', 'expected_codes',
+              'provisioning_status', 'admin_state_up', 'pool')
+    __slots__ = fields
+
     def __init__(self, id=None, tenant_id=None, type=None, delay=None,
                  timeout=None, max_retries=None, http_method=None,
                  url_path=None, expected_codes=None, provisioning_status=None,
@@ -305,6 +469,12 @@ class HealthMonitor(BaseDataModel):
 
 class Pool(BaseDataModel):
 
+    fields = ('id', 'tenant_id', 'name', 'description', 'healthmonitor_id',
+              'protocol', 'lb_algorithm', 'admin_state_up',
+              'operating_status', 'provisioning_status', 'members',
+              'healthmonitor', 'sessionpersistence', 'listener')
+    __slots__ = fields
+
     def __init__(self, id=None, tenant_id=None, name=None, description=None,
                  healthmonitor_id=None, protocol=None, lb_algorithm=None,
                  admin_state_up=None, operating_status=None,
@@ -365,6 +535,11 @@ class Pool(BaseDataModel):
 
 class Member(BaseDataModel):
 
+    fields = ('id', 'tenant_id', 'pool_id', 'address', 'protocol_port',
+              'weight', 'admin_state_up', 'subnet_id', 'operating_status',
+              'provisioning_status', 'pool')
+    __slots__ = fields
+
     def __init__(self, id=None, tenant_id=None, pool_id=None, address=None,
                  protocol_port=None, weight=None, admin_state_up=None,
                  subnet_id=None, operating_status=None,
@@ -398,7 +573,31 @@ class Member(BaseDataModel):
         return Member(**model_dict)
 
 
+class MemberBatch(object):
+    """Member changes of one pool which are applied together.
+
+    :param pool: the pool, as it is after the changes
+    :param created: the new members
+    :param updated: (old member, member) tuples of the updated members
+    :param deleted: the members to delete
+    """
+
+    def __init__(self, pool, created=None, updated=None, deleted=None):
+        self.pool = pool
+        self.created = created or []
+        self.updated = updated or []
+        self.deleted = deleted or []
+
+    @property
+    def root_loadbalancer(self):
+        return self.pool.root_loadbalancer
+
+
 class SNI(BaseDataModel):
+
+    fields = ('listener_id', 'tls_container_id', 'position', 'listener')
+    __slots__ = fields
+
     def __init__(self, listener_id=None, tls_container_id=None,
                  position=None, listener=None):
         self.listener_id = listener_id
@@ -419,18 +618,31 @@ class SNI(BaseDataModel):
 
 class TLSContainer(BaseDataModel):
 
+    fields = ('id', 'certificate', 'private_key', 'passphrase',
+              'intermediates', 'primary_cn', 'dns_names')
+    __slots__ = fields
+
     def __init__(self, id=None, certificate=None, private_key=None,
-                 passphrase=None, intermediates=None, primary_cn=None):
+                 passphrase=None, intermediates=None, primary_cn=None,
+                 dns_names=None):
         self.id = id
         self.certificate = certificate
         self.private_key = private_key
         self.passphrase = passphrase
         self.intermediates = intermediates
         self.primary_cn = primary_cn
+        self.dns_names = dns_names or []
 
 
 class Listener(BaseDataModel):
 
+    fields = ('id', 'tenant_id', 'name', 'description', 'default_pool_id',
+              'loadbalancer_id', 'protocol', 'default_tls_container_id',
+              'sni_containers', 'protocol_port', 'connection_limit',
+              'admin_state_up', 'operating_status', 'provisioning_status',
+              'default_pool', 'loadbalancer')
+    __slots__ = fields
+
     def __init__(self, id=None, tenant_id=None, name=None, description=None,
                  default_pool_id=None, loadbalancer_id=None, protocol=None,
                  default_tls_container_id=None, sni_containers=None,
@@ -487,6 +699,12 @@ class Listener(BaseDataModel):
 
 class LoadBalancer(BaseDataModel):
 
+    fields = ('id', 'tenant_id', 'name', 'description', 'vip_subnet_id',
+              'vip_port_id', 'vip_address', 'operating_status',
+              'provisioning_status', 'admin_state_up', 'vip_port', 'stats',
+              'provider', 'listeners')
+    __slots__ = fields
+
     def __init__(self, id=None, tenant_id=None, name=None, description=None,
                  vip_subnet_id=None, vip_port_id=None, vip_address=None,
                  provisioning_status=None, operating_status=None,
@@ -14,6 +14,7 @@
 
 import os
 
+import eventlet
 import jinja2
 import six
 
@@ -22,6 +23,7 @@ from neutron.plugins.common import constants as plugin_constants
 from oslo_config import cfg
 
 from neutron_lbaas.common import cert_manager
+from neutron_lbaas.common.tls_utils import cert_cache
 from neutron_lbaas.common.tls_utils import cert_parser
 from neutron_lbaas.services.loadbalancer import constants
 from neutron_lbaas.services.loadbalancer import data_models
@@ -60,6 +62,9 @@ MEMBER_STATUSES = plugin_constants.ACTIVE_PENDING_STATUSES + (
 TEMPLATES_DIR = os.path.abspath(
     os.path.join(os.path.dirname(__file__), 'templates/'))
 JINJA_ENV = None
+JINJA_TEMPLATE = None
+# parsed TLS containers, shared by every load balancer of the process
+TLS_CACHE = cert_cache.TLSMaterialCache()
 
 jinja_opts = [
     cfg.StrOpt(
@@ -67,7 +72,23 @@ jinja_opts = [
         default=os.path.join(
             TEMPLATES_DIR,
             'haproxy.loadbalancer.j2'),
-        help=_('Jinja template file for haproxy configuration'))
+        help=_('Jinja template file for haproxy configuration')),
+    cfg.StrOpt(
+        'jinja_bytecode_cache_dir',
+        help=_('Directory where compiled Jinja templates are cached so '
+               'they do not have to be recompiled when the agent '
+               'restarts. Disabled when not set')),
+    cfg.IntOpt(
+        'tls_workers',
+        default=8,
+        help=_('Number of TLS containers of a listener retrieved and '
+               'parsed concurrently')),
+    cfg.BoolOpt(
+        'use_crt_list',
+        default=False,
+        help=_('Reference the SNI certificates of a listener through a '
+               'single haproxy crt-list file instead of loading every '
+               'file of the certificate directory of the listener'))
 ]
 
 cfg.CONF.register_opts(jinja_opts, 'haproxy')
@@ -93,21 +114,34 @@ def save_config(conf_path, loadbalancer, socket_path, user_group,
 def _get_template():
     """Retrieve Jinja template
 
+    The template is compiled on first use and kept for the lifetime of the
+    process; changes to the template file require a restart.
+
     :return: Jinja template
     """
-    global JINJA_ENV
-    if not JINJA_ENV:
+    global JINJA_ENV, JINJA_TEMPLATE
+    if not JINJA_TEMPLATE:
+        template_path = cfg.CONF.haproxy.jinja_config_template
+        bytecode_cache = None
+        cache_dir = cfg.CONF.haproxy.jinja_bytecode_cache_dir
+        if cache_dir:
+            utils.ensure_dir(cache_dir)
+            bytecode_cache = jinja2.FileSystemBytecodeCache(cache_dir)
         template_loader = jinja2.FileSystemLoader(
-            searchpath=os.path.dirname(cfg.CONF.haproxy.jinja_config_template))
+            searchpath=os.path.dirname(template_path))
         JINJA_ENV = jinja2.Environment(
-            loader=template_loader, trim_blocks=True, lstrip_blocks=True)
-    return JINJA_ENV.get_template(os.path.basename(
-        cfg.CONF.haproxy.jinja_config_template))
+            loader=template_loader, trim_blocks=True, lstrip_blocks=True,
+            auto_reload=False, bytecode_cache=bytecode_cache)
+        JINJA_TEMPLATE = JINJA_ENV.get_template(
+            os.path.basename(template_path))
+    return JINJA_TEMPLATE
 
 
 def _store_listener_crt(haproxy_base_dir, listener, cert):
     """Store TLS certificate
 
+    The file is only written when its contents changed.
+
     :param haproxy_base_dir: location of the instances state data
     :param listener: the listener object
     :param cert: the TLS certificate
@@ -117,10 +151,43 @@ def _store_listener_crt(haproxy_base_dir, listener, cert):
                                    cert.primary_cn)
     # build a string that represents the pem file to be saved
     pem = _build_pem(cert)
-    utils.replace_file(cert_path, pem)
+    _replace_file_if_changed(cert_path, pem)
     return cert_path
 
 
+def _store_listener_crt_list(haproxy_base_dir, listener, cert_paths):
+    """Store the haproxy crt-list of the SNI certificates of a listener
+
+    :param haproxy_base_dir: location of the instances state data
+    :param listener: the listener object
+    :param cert_paths: locations of the stored SNI certificates
+    :return: location of the stored crt-list
+    """
+    crt_list_path = os.path.join(
+        os.path.abspath(os.path.normpath(haproxy_base_dir)),
+        '{0}.crt-list'.format(listener.id))
+    _replace_file_if_changed(crt_list_path,
+                             ''.join(path + '\n' for path in cert_paths))
+    return crt_list_path
+
+
+def _replace_file_if_changed(file_name, data):
+    """Replace the contents of a file unless it already holds data
+
+    :param file_name: location of the file
+    :param data: the new contents of the file
+    :return: True when the file was written
+    """
+    try:
+        with open(file_name) as f:
+            if f.read() == data:
+                return False
+    except (IOError, OSError):
+        pass
+    utils.replace_file(file_name, data)
+    return True
+
+
 def _retrieve_crt_path(haproxy_base_dir, listener, primary_cn):
     """Retrieve TLS certificate location
 
@@ -141,29 +208,35 @@ def _retrieve_crt_path(haproxy_base_dir, listener, primary_cn):
 def _process_tls_certificates(listener):
     """Processes TLS data from the listener.
 
-    Converts and uploads PEM data to the Amphora API
+    Converts and uploads PEM data to the Amphora API. Containers are only
+    retrieved and parsed when TLS_CACHE has no fresh entry for them, up to
+    tls_workers of them at a time.
 
     :param listener the listener object
     :return: TLS_CERT and SNI_CERTS
     """
     cert_mgr = CERT_MANAGER_PLUGIN.CertManager()
 
-    tls_cert = None
-    sni_certs = []
-    # Retrieve, map and store default TLS certificate
+    def fetch(cert_ref):
+        return cert_mgr.get_cert(cert_ref, check_only=True)
+
+    def get_tls_container(cert_ref):
+        return TLS_CACHE.get(cert_ref, fetch, _map_cert_tls_container)
+
+    cert_refs = []
     if listener.default_tls_container_id:
-        tls_cert = _map_cert_tls_container(
-            cert_mgr.get_cert(
-                listener.default_tls_container_id,
-                check_only=True))
+        cert_refs.append(listener.default_tls_container_id)
     if listener.sni_containers:
-        # Retrieve, map and store SNI certificates
-        for sni_cont in listener.sni_containers:
-            cert_container = _map_cert_tls_container(
-                cert_mgr.get_cert(sni_cont.tls_container_id, check_only=True))
-            sni_certs.append(cert_container)
+        cert_refs.extend(sni_cont.tls_container_id
+                         for sni_cont in listener.sni_containers)
+    # Retrieve and map the default TLS certificate and the SNI certificates
+    pool = eventlet.GreenPool(max(1, cfg.CONF.haproxy.tls_workers))
+    certs = list(pool.imap(get_tls_container, cert_refs))
+    tls_cert = None
+    if listener.default_tls_container_id:
+        tls_cert = certs.pop(0)
 
-    return {'tls_cert': tls_cert, 'sni_certs': sni_certs}
+    return {'tls_cert': tls_cert, 'sni_certs': certs}
 
 
 def _get_primary_cn(tls_cert):
@@ -184,11 +257,13 @@ def _map_cert_tls_container(cert):
     certificate = cert.get_certificate()
     pkey = cert_parser.dump_private_key(cert.get_private_key(),
                                         cert.get_private_key_passphrase())
+    host_names = cert_parser.get_host_names(certificate)
     return data_models.TLSContainer(
-        primary_cn=_get_primary_cn(certificate),
+        primary_cn=host_names['cn'],
         private_key=pkey,
         certificate=certificate,
-        intermediates=cert.get_intermediates())
+        intermediates=cert.get_intermediates(),
+        dns_names=host_names.get('dns_names', []))
 
 
 def _build_pem(tls_cert):
@@ -260,15 +335,22 @@ def _transform_listener(listener, haproxy_base_dir):
     if listener.default_pool:
         ret_value['default_pool'] = _transform_pool(listener.default_pool)
 
+    if not (listener.default_tls_container_id or listener.sni_containers):
+        return ret_value
+
     # Process and store certificates
     certs = _process_tls_certificates(listener)
     if listener.default_tls_container_id:
         ret_value['default_tls_path'] = _store_listener_crt(
             haproxy_base_dir, listener, certs['tls_cert'])
     if listener.sni_containers:
-        for c in certs['sni_certs']:
-            _store_listener_crt(haproxy_base_dir, listener, c)
-        ret_value['crt_dir'] = data_dir
+        cert_paths = [_store_listener_crt(haproxy_base_dir, listener, c)
+                      for c in certs['sni_certs']]
+        if cfg.CONF.haproxy.use_crt_list:
+            ret_value['crt_list'] = _store_listener_crt_list(
+                haproxy_base_dir, listener, cert_paths)
+        else:
+            ret_value['crt_dir'] = data_dir
     return ret_value
 
 
@@ -13,6 +13,9 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import collections
+
+import eventlet
 import six
 
 from neutron.api.v2 import attributes as attrs
@@ -21,6 +24,8 @@ from neutron import context as ncontext
 from neutron.db import servicetype_db as st_db
 from neutron.i18n import _LI, _LE
 from neutron.plugins.common import constants
+from neutron import policy
+from neutron import quota
 from neutron.services import provider_configuration as pconf
 from neutron.services import service_base
 from oslo_config import cfg
@@ -571,8 +576,12 @@ class LoadBalancerPluginv2(loadbalancerv2.LoadBalancerPluginBaseV2):
                     container_id=container_ref, reason=str(e))
 
         def validate_tls_containers(to_validate):
-            for container_ref in to_validate:
-                validate_tls_container(container_ref)
+            # the containers are retrieved and validated concurrently, the
+            # error of the first invalid one in to_validate is raised
+            pool = eventlet.GreenPool(
+                max(1, cfg.CONF.certificates.tls_validation_workers))
+            for _result in pool.imap(validate_tls_container, to_validate):
+                pass
 
         to_validate = []
         if not listener['default_tls_container_id']:
@@ -581,14 +590,14 @@ class LoadBalancerPluginv2(loadbalancerv2.LoadBalancerPluginBaseV2):
             to_validate.extend([listener['default_tls_container_id']])
             to_validate.extend(listener['sni_container_ids'])
         elif curr_listener['provisioning_status'] == constants.ERROR:
-            to_validate.extend(curr_listener['default_tls_container_id'])
+            to_validate.append(curr_listener['default_tls_container_id'])
             to_validate.extend([
-                    container.tls_container_id for container in (
+                    container['tls_container_id'] for container in (
                         curr_listener['sni_containers'])])
         else:
             if (curr_listener['default_tls_container_id'] !=
                     listener['default_tls_container_id']):
-                to_validate.extend(listener['default_tls_container_id'])
+                to_validate.append(listener['default_tls_container_id'])
 
             if (listener['sni_container_ids'] is not None and
                     [container['tls_container_id'] for container in (
@@ -597,7 +606,8 @@ class LoadBalancerPluginv2(loadbalancerv2.LoadBalancerPluginBaseV2):
                 to_validate.extend(listener['sni_container_ids'])
 
         if len(to_validate) > 0:
-            validate_tls_containers(to_validate)
+            validate_tls_containers(
+                sorted(set(to_validate), key=to_validate.index))
 
         return len(to_validate) > 0
 
@@ -822,6 +832,70 @@ class LoadBalancerPluginv2(loadbalancerv2.LoadBalancerPluginBaseV2):
                                     driver.member.delete,
                                     db_member)
 
+    def _enforce_member_batch_policy(self, context, db_pool, created,
+                                     updated, deleted_ids):
+        # the batch is only allowed as a whole, every change must be allowed
+        # as its single member request would be
+        for member in created:
+            policy.enforce(context, 'create_member',
+                           dict(member, pool_id=db_pool.id), plugin=self)
+        members = dict((member.id, member.to_api_dict())
+                       for member in db_pool.members)
+        for member_id, attributes in six.iteritems(updated):
+            if member_id in members:
+                policy.enforce(context, 'update_member',
+                               dict(members[member_id], **attributes),
+                               plugin=self)
+        for member_id in deleted_ids:
+            if member_id in members:
+                policy.enforce(context, 'delete_member', members[member_id],
+                               plugin=self)
+
+    def _check_member_batch_quota(self, context, created):
+        deltas = collections.defaultdict(int)
+        for member in created:
+            deltas[member['tenant_id']] += 1
+        for tenant_id, delta in six.iteritems(deltas):
+            count = self.db.get_pool_members_count(
+                context, filters={'tenant_id': [tenant_id]})
+            try:
+                quota.QUOTAS.limit_check(context, tenant_id,
+                                         member=count + delta)
+            except n_exc.QuotaResourceUnknown as e:
+                LOG.debug(e)
+
+    def batch_members(self, context, id, body):
+        """Creates, updates and deletes members of a pool in one request.
+
+        All the changes are stored in a single transaction and handed to
+        the driver in a single call, so the load balancer only goes through
+        PENDING_UPDATE once for the whole batch.
+        """
+        created, updated, deleted_ids = loadbalancerv2.prepare_member_batch(
+            context, body)
+        self._check_pool_exists(context, id)
+        db_pool = self.db.get_pool(context, id)
+        self._enforce_member_batch_policy(context, db_pool, created, updated,
+                                          deleted_ids)
+        self._check_member_batch_quota(context, created)
+        self.db.test_and_set_status(context, models.LoadBalancer,
+                                    db_pool.root_loadbalancer.id,
+                                    constants.PENDING_UPDATE)
+        try:
+            batch = self.db.batch_pool_members(context, id, created, updated,
+                                               deleted_ids)
+        except Exception as exc:
+            self.db.update_loadbalancer_provisioning_status(
+                context, db_pool.root_loadbalancer.id)
+            raise exc
+
+        driver = self._get_driver_for_loadbalancer(
+            context, db_pool.root_loadbalancer.id)
+        self._call_driver_operation(context, driver.member.batch, batch)
+
+        members = batch.created + [member for _old, member in batch.updated]
+        return {'members': [member.to_api_dict() for member in members]}
+
     def get_pool_members(self, context, pool_id, filters=None, fields=None):
         self._check_pool_exists(context, pool_id)
         return [mem.to_api_dict() for mem in self.db.get_pool_members(
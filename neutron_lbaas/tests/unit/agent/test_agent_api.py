@@ -31,8 +31,9 @@ class TestApiCache(base.BaseTestCase):
         self.assertEqual(self.api.host, 'host')
         self.assertEqual(self.api.context, mock.sentinel.context)
 
-    def _test_method(self, method, **kwargs):
-        add_host = ('get_ready_devices', 'plug_vip_port', 'unplug_vip_port')
+    def _test_method(self, method, version=None, **kwargs):
+        add_host = ('get_ready_devices', 'get_loadbalancer_revisions',
+                    'plug_vip_port', 'unplug_vip_port')
         expected_kwargs = copy.copy(kwargs)
         if method in add_host:
             expected_kwargs['host'] = self.api.host
@@ -50,6 +51,8 @@ class TestApiCache(base.BaseTestCase):
         self.assertEqual(rv, 'foo')
 
         prepare_args = {}
+        if version:
+            prepare_args['version'] = version
         prepare_mock.assert_called_once_with(**prepare_args)
 
         rpc_mock.assert_called_once_with(mock.sentinel.context, method,
@@ -62,6 +65,13 @@ class TestApiCache(base.BaseTestCase):
         self._test_method('get_loadbalancer',
                           loadbalancer_id='loadbalancer_id')
 
+    def test_get_loadbalancers(self):
+        self._test_method('get_loadbalancers', version='1.1',
+                          loadbalancer_ids=['id1', 'id2'])
+
+    def test_get_loadbalancer_revisions(self):
+        self._test_method('get_loadbalancer_revisions', version='1.2')
+
     def test_loadbalancer_destroyed(self):
         self._test_method('loadbalancer_destroyed',
                           loadbalancer_id='loadbalancer_id')
@@ -84,3 +94,7 @@ class TestApiCache(base.BaseTestCase):
     def test_update_loadbalancer_stats(self):
         self._test_method('update_loadbalancer_stats', loadbalancer_id='id',
                           stats='stats')
+
+    def test_update_loadbalancers_stats(self):
+        self._test_method('update_loadbalancers_stats', version='1.3',
+                          stats={'id': 'stats'})
@@ -15,6 +15,7 @@
 
 import contextlib
 
+import eventlet
 import mock
 from neutron.plugins.common import constants
 
@@ -30,6 +31,15 @@ class TestManager(base.BaseTestCase):
 
         mock_conf = mock.Mock()
         mock_conf.device_driver = ['devdriver']
+        mock_conf.resync_workers = 2
+        mock_conf.resync_chunk_size = 50
+        mock_conf.update_coalesce_window = 0
+        mock_conf.stats_interval = 0
+        mock_conf.stats_max_interval = 60
+        mock_conf.stats_workers = 2
+        mock_conf.stats_poll_timeout = 5
+        mock_conf.stats_change_threshold = 0
+        mock_conf.stats_full_report_interval = 10
 
         self.mock_importer = mock.patch.object(manager, 'importutils').start()
 
@@ -56,6 +66,17 @@ class TestManager(base.BaseTestCase):
             self.mgr.initialize_service_hook(mock.Mock())
             sync.assert_called_once_with()
 
+    def test_report_state(self):
+        self.driver_mock.get_metrics.return_value = {'reloads_avoided': 1}
+        self.mgr.state_rpc = mock.Mock()
+        self.mgr._report_state()
+        configurations = self.mgr.agent_state['configurations']
+        self.assertEqual(2, configurations['instances'])
+        self.assertEqual({'devdriver': {'reloads_avoided': 1}},
+                         configurations['driver_metrics'])
+        self.mgr.state_rpc.report_state.assert_called_once_with(
+            self.mgr.context, self.mgr.agent_state)
+
     def test_periodic_resync_needs_sync(self):
         with mock.patch.object(self.mgr, 'sync_state') as sync:
             self.mgr.needs_resync = True
@@ -69,36 +90,98 @@ class TestManager(base.BaseTestCase):
             self.assertFalse(sync.called)
 
     def test_collect_stats(self):
+        self.driver_mock.loadbalancer.get_stats.side_effect = (
+            lambda lb_id: {'bytes_in': lb_id})
+        self.mgr.collect_stats(mock.Mock())
+        self.rpc_mock.update_loadbalancers_stats.assert_called_once_with(
+            {'1': {'bytes_in': '1'}, '2': {'bytes_in': '2'}})
+        self.assertFalse(self.rpc_mock.update_loadbalancer_stats.called)
+
+    def test_collect_stats_timeout(self):
+        def get_stats(lb_id):
+            if lb_id == '1':
+                raise eventlet.Timeout()
+            return {'bytes_in': lb_id}
+        self.driver_mock.loadbalancer.get_stats.side_effect = get_stats
+        self.mgr.deployed_revisions = {'1': 1, '2': 1}
+
+        self.mgr.collect_stats(mock.Mock())
+
+        self.rpc_mock.update_loadbalancers_stats.assert_called_once_with(
+            {'2': {'bytes_in': '2'}})
+        self.assertEqual({'1': 1, '2': 1}, self.mgr.deployed_revisions)
+        self.assertFalse(self.mgr.needs_resync)
+        self.assertTrue(self.log.warning.called)
+
+    def test_collect_stats_tick(self):
+        with contextlib.nested(
+            mock.patch.object(self.mgr, 'collect_stats'),
+            mock.patch.object(self.mgr.stats_scheduler, 'tick_done')
+        ) as (collect_stats, tick_done):
+            collect_stats.side_effect = Exception
+            self.assertEqual(tick_done.return_value,
+                             self.mgr._collect_stats_tick())
+            collect_stats.assert_called_once_with(self.mgr.context)
+            self.assertTrue(self.log.exception.called)
+            self.assertEqual(1, tick_done.call_count)
+
+    def test_setup_stats_collection(self):
+        self.mgr.conf.stats_interval = 6
+        with mock.patch.object(manager.loopingcall,
+                               'DynamicLoopingCall') as looping_call:
+            self.mgr._setup_stats_collection()
+            looping_call.assert_called_once_with(
+                self.mgr._collect_stats_tick)
+            looping_call.return_value.start.assert_called_once_with(
+                initial_delay=6)
+        self.assertEqual(6, self.mgr.stats_scheduler.base_interval)
+
+    def test_collect_stats_unchanged(self):
+        self.driver_mock.loadbalancer.get_stats.side_effect = (
+            lambda lb_id: {'bytes_in': lb_id})
+        self.mgr.collect_stats(mock.Mock())
+        self.rpc_mock.reset_mock()
+
+        self.mgr.collect_stats(mock.Mock())
+
+        self.assertFalse(self.rpc_mock.update_loadbalancers_stats.called)
+
+    def test_collect_stats_rpc_exception(self):
+        self.rpc_mock.update_loadbalancers_stats.side_effect = Exception
+        self.mgr.deployed_revisions = {'1': 1, '2': 1}
+
         self.mgr.collect_stats(mock.Mock())
-        self.rpc_mock.update_loadbalancer_stats.assert_has_calls([
-            mock.call('1', mock.ANY),
-            mock.call('2', mock.ANY)
-        ], any_order=True)
+
+        self.assertEqual({'1': 1, '2': 1}, self.mgr.deployed_revisions)
+        self.assertFalse(self.mgr.needs_resync)
+        self.assertTrue(self.log.exception.called)
+        # nothing was recorded as reported, so it is sent again next time
+        self.assertEqual({}, self.mgr.stats_reporter.last_reported)
 
     def test_collect_stats_exception(self):
         self.driver_mock.loadbalancer.get_stats.side_effect = Exception
+        self.mgr.deployed_revisions = {'1': 1, '2': 1}
 
         self.mgr.collect_stats(mock.Mock())
 
+        self.assertEqual({}, self.mgr.deployed_revisions)
         self.assertFalse(self.rpc_mock.called)
         self.assertTrue(self.mgr.needs_resync)
         self.assertTrue(self.log.exception.called)
 
-    def _sync_state_helper(self, ready, reloaded, destroyed):
+    def _sync_state_helper(self, ready, reloaded, destroyed, revisions=None):
+        revisions = revisions or dict((lb_id, 1) for lb_id in ready)
         with contextlib.nested(
-            mock.patch.object(self.mgr, '_reload_loadbalancer'),
+            mock.patch.object(self.mgr, '_reload_loadbalancers'),
             mock.patch.object(self.mgr, '_destroy_loadbalancer')
         ) as (reload, destroy):
 
-            self.rpc_mock.get_ready_devices.return_value = ready
+            self.rpc_mock.get_loadbalancer_revisions.return_value = revisions
 
             self.mgr.sync_state()
 
-            self.assertEqual(len(reloaded), len(reload.mock_calls))
+            reload.assert_called_once_with(set(reloaded), revisions)
             self.assertEqual(len(destroyed), len(destroy.mock_calls))
-
-            reload.assert_has_calls([mock.call(i) for i in reloaded],
-                                    any_order=True)
             destroy.assert_has_calls([mock.call(i) for i in destroyed],
                                      any_order=True)
             self.assertFalse(self.mgr.needs_resync)
@@ -117,59 +200,122 @@ class TestManager(base.BaseTestCase):
         self.mgr.instance_mapping = {'1': 'devdriver'}
         self._sync_state_helper(['2'], ['2'], ['1'])
 
+    def test_sync_state_skips_unchanged(self):
+        self.mgr.deployed_revisions = {'1': 3, '2': 3}
+        self._sync_state_helper(['1', '2', '3'], ['2', '3'], [],
+                                revisions={'1': 3, '2': 4, '3': 1})
+
+    def test_sync_state_redeploys_unknown_with_same_revision(self):
+        self.mgr.instance_mapping = {'2': 'devdriver'}
+        self.mgr.deployed_revisions = {'1': 3, '2': 3}
+        self._sync_state_helper(['1', '2'], ['1'], [],
+                                revisions={'1': 3, '2': 3})
+
     def test_sync_state_exception(self):
-        self.rpc_mock.get_ready_devices.side_effect = Exception
+        self.rpc_mock.get_loadbalancer_revisions.side_effect = Exception
 
         self.mgr.sync_state()
 
         self.assertTrue(self.log.exception.called)
         self.assertTrue(self.mgr.needs_resync)
 
-    def test_reload_loadbalancer(self):
-        lb = data_models.LoadBalancer(id='1').to_dict()
+    def test_reload_loadbalancers_in_chunks(self):
+        self.mgr.conf.resync_chunk_size = 2
+        self.rpc_mock.get_loadbalancers.side_effect = lambda ids: [
+            {'id': lb_id} for lb_id in ids]
+        with mock.patch.object(self.mgr, '_deploy_loadbalancer') as deploy:
+            self.mgr._reload_loadbalancers(['1', '2', '3'])
+
+            self.rpc_mock.get_loadbalancers.assert_has_calls(
+                [mock.call(['1', '2']), mock.call(['3'])])
+            deploy.assert_has_calls([mock.call({'id': '1'}),
+                                     mock.call({'id': '2'}),
+                                     mock.call({'id': '3'})], any_order=True)
+        self.assertFalse(self.mgr.needs_resync)
+
+    def test_reload_loadbalancers_records_revisions(self):
+        self.rpc_mock.get_loadbalancers.return_value = [
+            {'id': '1'}, {'id': '2'}]
+        with mock.patch.object(self.mgr, '_deploy_loadbalancer') as deploy:
+            deploy.side_effect = lambda lb_dict: lb_dict['id'] != '2'
+
+            self.mgr._reload_loadbalancers(['1', '2'], {'1': 5, '2': 7})
+
+        self.assertEqual({'1': 5}, self.mgr.deployed_revisions)
+
+    def test_reload_loadbalancers_failure_isolated(self):
+        self.rpc_mock.get_loadbalancers.return_value = [
+            {'id': '1'}, {'id': '2'}, {'id': '3'}]
+        with mock.patch.object(self.mgr, '_deploy_loadbalancer') as deploy:
+            deploy.side_effect = lambda lb_dict: lb_dict['id'] != '2'
+
+            self.mgr._reload_loadbalancers(['1', '2', '3'])
+
+            self.assertEqual(3, deploy.call_count)
+            self.assertEqual(1, self.log.info.call_count)
+            report = self.log.info.call_args[0][1]
+            self.assertEqual(2, report['deployed'])
+            self.assertEqual(3, report['total'])
+            self.assertEqual(2, report['workers'])
+
+    def test_reload_loadbalancers_fetch_exception(self):
+        self.mgr.conf.resync_chunk_size = 1
+        self.rpc_mock.get_loadbalancers.side_effect = [
+            Exception, [{'id': '2'}]]
+        with mock.patch.object(self.mgr, '_deploy_loadbalancer') as deploy:
+            self.mgr._reload_loadbalancers(['1', '2'])
+
+            deploy.assert_called_once_with({'id': '2'})
+        self.assertTrue(self.log.exception.called)
+        self.assertTrue(self.mgr.needs_resync)
+
+    def test_reload_loadbalancers_empty(self):
+        self.mgr._reload_loadbalancers([])
+        self.assertFalse(self.rpc_mock.get_loadbalancers.called)
+        self.assertFalse(self.log.info.called)
+
+    def test_deploy_loadbalancer(self):
+        lb = data_models.LoadBalancer(id='new_id').to_dict()
         lb['provider'] = {'device_driver': 'devdriver'}
-        self.rpc_mock.get_loadbalancer.return_value = lb
-        lb_id = 'new_id'
+        lb_id = lb['id']
         self.assertNotIn(lb_id, self.mgr.instance_mapping)
 
-        self.mgr._reload_loadbalancer(lb_id)
+        self.assertTrue(self.mgr._deploy_loadbalancer(lb))
 
         calls = self.driver_mock.deploy_instance.call_args_list
         self.assertEqual(1, len(calls))
         called_lb = calls[0][0][0]
-        self.assertEqual(lb['id'], called_lb.id)
-        self.assertIn(lb['id'], self.mgr.instance_mapping)
+        self.assertEqual(lb_id, called_lb.id)
+        self.assertIn(lb_id, self.mgr.instance_mapping)
         self.rpc_mock.loadbalancer_deployed.assert_called_once_with(lb_id)
 
-    def test_reload_loadbalancer_driver_not_found(self):
-        lb = data_models.LoadBalancer(id='1').to_dict()
+    def test_deploy_loadbalancer_driver_not_found(self):
+        lb = data_models.LoadBalancer(id='new_id').to_dict()
         lb['provider'] = {'device_driver': 'unknowndriver'}
-        self.rpc_mock.get_loadbalancer.return_value = lb
-        lb_id = 'new_id'
+        lb_id = lb['id']
         self.assertNotIn(lb_id, self.mgr.instance_mapping)
 
-        self.mgr._reload_loadbalancer(lb_id)
+        self.assertFalse(self.mgr._deploy_loadbalancer(lb))
 
         self.assertTrue(self.log.error.called)
         self.assertFalse(self.driver_mock.deploy_instance.called)
         self.assertNotIn(lb_id, self.mgr.instance_mapping)
         self.assertFalse(self.rpc_mock.loadbalancer_deployed.called)
 
-    def test_reload_loadbalancer_exception_on_driver(self):
+    def test_deploy_loadbalancer_exception_on_driver(self):
         lb = data_models.LoadBalancer(id='3').to_dict()
         lb['provider'] = {'device_driver': 'devdriver'}
-        self.rpc_mock.get_loadbalancer.return_value = lb
+        lb_id = lb['id']
         self.driver_mock.deploy_instance.side_effect = Exception
-        lb_id = 'new_id'
         self.assertNotIn(lb_id, self.mgr.instance_mapping)
 
-        self.mgr._reload_loadbalancer(lb_id)
+        self.assertFalse(self.mgr._deploy_loadbalancer(lb))
 
         calls = self.driver_mock.deploy_instance.call_args_list
         self.assertEqual(1, len(calls))
         called_lb = calls[0][0][0]
-        self.assertEqual(lb['id'], called_lb.id)
-        self.assertNotIn(lb['id'], self.mgr.instance_mapping)
+        self.assertEqual(lb_id, called_lb.id)
+        self.assertNotIn(lb_id, self.mgr.instance_mapping)
         self.assertFalse(self.rpc_mock.loadbalancer_deployed.called)
         self.assertTrue(self.log.exception.called)
         self.assertTrue(self.mgr.needs_resync)
@@ -178,11 +324,14 @@ class TestManager(base.BaseTestCase):
         lb_id = '1'
         self.assertIn(lb_id, self.mgr.instance_mapping)
 
+        self.mgr.deployed_revisions = {lb_id: 1}
+
         self.mgr._destroy_loadbalancer(lb_id)
 
         self.driver_mock.undeploy_instance.assert_called_once_with(
             lb_id, delete_namespace=True)
         self.assertNotIn(lb_id, self.mgr.instance_mapping)
+        self.assertNotIn(lb_id, self.mgr.deployed_revisions)
         self.rpc_mock.loadbalancer_destroyed.assert_called_once_with(lb_id)
         self.assertFalse(self.mgr.needs_resync)
 
@@ -674,3 +823,93 @@ class TestManager(base.BaseTestCase):
         self.mgr.delete_healthmonitor(mock.Mock(), monitor.to_dict())
         self.driver_mock.healthmonitor.delete.assert_called_once_with(
             monitor)
+
+    def _coalesce_members(self, count):
+        self.mgr.conf.update_coalesce_window = 0.5
+        loadbalancer = data_models.LoadBalancer(id='1')
+        listener = data_models.Listener(id=1, loadbalancer_id='1',
+                                        loadbalancer=loadbalancer)
+        pool = data_models.Pool(id='1', listener=listener, protocol='HTTP')
+        members = [data_models.Member(id=str(i), pool=pool)
+                   for i in range(count)]
+        with contextlib.nested(
+            mock.patch.object(data_models.Member, 'from_dict'),
+            mock.patch.object(manager.eventlet, 'spawn_after')
+        ) as (mmember, spawn_after):
+            mmember.side_effect = members
+            for member in members:
+                self.mgr.create_member(mock.Mock(), member.to_dict())
+            spawn_after.assert_called_once_with(
+                0.5, self.mgr._flush_driver_calls, '1')
+        self.assertFalse(self.driver_mock.member.create.called)
+        self.mgr._flush_driver_calls('1')
+        self.assertNotIn('1', self.mgr.pending_calls)
+        return loadbalancer, members
+
+    def test_coalesce_driver_calls(self):
+        loadbalancer, members = self._coalesce_members(3)
+        self.driver_mock.loadbalancer.update.assert_called_once_with(
+            loadbalancer, loadbalancer)
+        self.assertFalse(self.driver_mock.member.create.called)
+        self.update_statuses.assert_has_calls(
+            [mock.call(member, error=False, update_loadbalancer=False)
+             for member in members])
+        self.rpc_mock.update_status.assert_called_once_with(
+            'loadbalancer', '1', provisioning_status=constants.ACTIVE,
+            operating_status=None)
+
+    def test_coalesce_driver_calls_failed(self):
+        self.driver_mock.loadbalancer.update.side_effect = Exception
+        loadbalancer, members = self._coalesce_members(2)
+        self.update_statuses.assert_has_calls(
+            [mock.call(member, error=True, update_loadbalancer=False)
+             for member in members])
+
+    def test_coalesce_single_driver_call(self):
+        loadbalancer, members = self._coalesce_members(1)
+        self.driver_mock.member.create.assert_called_once_with(members[0])
+        self.assertFalse(self.driver_mock.loadbalancer.update.called)
+        self.update_statuses.assert_called_once_with(members[0])
+
+    def test_flush_driver_calls_while_flushing(self):
+        self.mgr.conf.update_coalesce_window = 0.5
+        self.mgr.pending_calls['1'] = [mock.Mock()]
+        self.mgr.flushing_loadbalancers.add('1')
+        with mock.patch.object(manager.eventlet, 'spawn_after') as spawn:
+            self.mgr._flush_driver_calls('1')
+            spawn.assert_called_once_with(
+                0.5, self.mgr._flush_driver_calls, '1')
+        self.assertIn('1', self.mgr.pending_calls)
+
+    def test_batch_members(self):
+        loadbalancer = data_models.LoadBalancer(id='1')
+        listener = data_models.Listener(id=1, loadbalancer_id='1',
+                                        loadbalancer=loadbalancer)
+        members = [data_models.Member(id=str(i)) for i in range(3)]
+        pool = data_models.Pool(id='1', listener=listener, protocol='HTTP',
+                                members=members)
+        with mock.patch.object(data_models.Pool, 'from_dict') as mpool:
+            mpool.return_value = pool
+            self.mgr.batch_members(mock.Mock(), pool.to_dict(), ['0', '2'])
+        self.driver_mock.loadbalancer.update.assert_called_once_with(
+            loadbalancer, loadbalancer)
+        self.update_statuses.assert_has_calls(
+            [mock.call(members[0], error=False, update_loadbalancer=False),
+             mock.call(members[2], error=False, update_loadbalancer=False)])
+        self.assertEqual(2, self.update_statuses.call_count)
+        self.rpc_mock.update_status.assert_called_once_with(
+            'loadbalancer', '1', provisioning_status=constants.ACTIVE,
+            operating_status=None)
+
+    def test_batch_members_only_deleted(self):
+        loadbalancer = data_models.LoadBalancer(id='1')
+        listener = data_models.Listener(id=1, loadbalancer_id='1',
+                                        loadbalancer=loadbalancer)
+        pool = data_models.Pool(id='1', listener=listener, protocol='HTTP')
+        with mock.patch.object(data_models.Pool, 'from_dict') as mpool:
+            mpool.return_value = pool
+            self.mgr.batch_members(mock.Mock(), pool.to_dict(), [])
+        self.driver_mock.loadbalancer.update.assert_called_once_with(
+            loadbalancer, loadbalancer)
+        self.assertFalse(self.update_statuses.called)
+        self.assertFalse(self.rpc_mock.update_status.called)
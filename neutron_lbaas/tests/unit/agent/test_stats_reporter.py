@@ -0,0 +1,113 @@
+# Copyright 2015 OpenStack Foundation
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from neutron_lbaas.agent import stats_reporter
+from neutron_lbaas.tests import base
+
+
+class TestStatsReporter(base.BaseTestCase):
+    def setUp(self):
+        super(TestStatsReporter, self).setUp()
+        self.reporter = stats_reporter.StatsReporter(
+            threshold=10, full_report_interval=10)
+        self.stats = {
+            'lb1': {'bytes_in': '100',
+                    'members': {'m1': {'status': 'ACTIVE'}}},
+            'lb2': {'bytes_in': '100', 'members': {}}
+        }
+
+    def _report(self, stats):
+        changed = self.reporter.get_changed(stats)
+        self.reporter.reported(changed)
+        return changed
+
+    def test_first_report_sends_everything(self):
+        self.assertEqual(self.stats,
+                         self.reporter.get_changed(self.stats))
+
+    def test_only_changes_beyond_threshold_are_sent(self):
+        self._report(self.stats)
+        self.assertEqual({}, self._report({
+            'lb1': {'bytes_in': '105',
+                    'members': {'m1': {'status': 'ACTIVE'}}},
+            'lb2': {'bytes_in': '100', 'members': {}}
+        }))
+        changed = {'bytes_in': '111', 'members': {}}
+        self.assertEqual({'lb2': changed}, self._report({
+            'lb1': self.stats['lb1'], 'lb2': changed}))
+
+    def test_member_changes_are_sent(self):
+        self._report(self.stats)
+        changed = {'bytes_in': '100',
+                   'members': {'m1': {'status': 'INACTIVE'}}}
+        self.assertEqual({'lb1': changed}, self._report({
+            'lb1': changed, 'lb2': self.stats['lb2']}))
+        changed = {'bytes_in': '100',
+                   'members': {'m1': {'status': 'INACTIVE'},
+                               'm2': {'status': 'ACTIVE'}}}
+        self.assertEqual({'lb1': changed}, self._report({
+            'lb1': changed, 'lb2': self.stats['lb2']}))
+
+    def test_full_report_interval(self):
+        self.reporter.full_report_interval = 3
+        self._report(self.stats)
+        self.assertEqual({}, self._report(self.stats))
+        self.assertEqual(self.stats, self._report(self.stats))
+        self.assertEqual({}, self._report(self.stats))
+
+    def test_unreported_stats_are_sent_again(self):
+        self.reporter.get_changed(self.stats)
+        self.assertEqual(self.stats, self.reporter.get_changed(self.stats))
+
+    def test_undeployed_loadbalancers_are_forgotten(self):
+        self._report(self.stats)
+        self._report({'lb2': self.stats['lb2']})
+        self.assertEqual(['lb2'], list(self.reporter.last_reported))
+
+
+class TestStatsScheduler(base.BaseTestCase):
+    def setUp(self):
+        super(TestStatsScheduler, self).setUp()
+        self.scheduler = stats_reporter.StatsScheduler(6, 20)
+
+    def test_tick_within_interval(self):
+        self.assertEqual(4, self.scheduler.tick_done(2))
+        self.assertEqual(6, self.scheduler.interval)
+
+    def test_overrun_backs_off(self):
+        self.assertEqual(12, self.scheduler.tick_done(7))
+        self.assertEqual(20, self.scheduler.tick_done(13))
+        self.assertEqual(20, self.scheduler.tick_done(25))
+        self.assertEqual(3, self.scheduler.overruns)
+
+    def test_recovers_towards_base_interval(self):
+        self.scheduler.tick_done(7)
+        self.scheduler.tick_done(13)
+        self.assertEqual(9, self.scheduler.tick_done(1))
+        self.assertEqual(10, self.scheduler.interval)
+        self.assertEqual(5, self.scheduler.tick_done(1))
+        self.assertEqual(6, self.scheduler.interval)
+
+    def test_get_metrics(self):
+        self.scheduler.tick_done(0.05)
+        self.scheduler.tick_done(0.3)
+        self.scheduler.tick_done(100)
+        metrics = self.scheduler.get_metrics()
+        self.assertEqual(12, metrics['interval'])
+        self.assertEqual(1, metrics['overruns'])
+        histogram = metrics['tick_histogram']
+        self.assertEqual(1, histogram['0.1s'])
+        self.assertEqual(1, histogram['0.5s'])
+        self.assertEqual(1, histogram['+inf'])
+        self.assertEqual(3, sum(histogram.values()))
@@ -91,6 +91,19 @@ class TestBarbicanAuth(base.BaseTestCase):
         ks2 = bcm.BarbicanKeystoneAuth._get_keystone_session()
         self.assertIs(ks1, ks2)
 
+    def test_get_keystone_session_pooled(self):
+        bcm.v2_client = mock.MagicMock()
+
+        fixture.Config().config(group='keystone_authtoken', auth_version='v2')
+        fixture.Config().config(group='certificates', barbican_pool_size=4)
+
+        ks = bcm.BarbicanKeystoneAuth._get_keystone_session()
+
+        # Barbican and Keystone requests share the connections of the pool
+        adapter = ks.session.get_adapter('https://localhost:9311')
+        self.assertIs(adapter, ks.session.get_adapter('http://localhost'))
+        self.assertEqual(4, adapter._pool_maxsize)
+
     def test_get_barbican_client(self):
         # There should be no existing client
         self.assertIsNone(
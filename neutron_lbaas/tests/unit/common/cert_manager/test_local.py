@@ -13,12 +13,15 @@
 #    under the License.
 import os
 
+import fixtures
 import mock
 from oslo_config import cfg
 from oslo_config import fixture as oslo_fixture
 
 from neutron_lbaas.common.cert_manager import cert_manager
+from neutron_lbaas.common.cert_manager import local_bundle_cert_manager
 from neutron_lbaas.common.cert_manager import local_cert_manager
+from neutron_lbaas.common import exceptions
 from neutron_lbaas.tests import base
 
 
@@ -146,3 +149,92 @@ class TestLocalManager(base.BaseTestCase):
 
         # Delete the cert
         self._delete_cert(cert_id)
+
+    def test_delete_cert_without_optional_files(self):
+        cert_id = self._store_cert()
+        remove_mock = mock.Mock(side_effect=[None, None, OSError, OSError])
+        with mock.patch('os.remove', remove_mock):
+            local_cert_manager.CertManager.delete_cert(cert_id)
+        self.assertEqual(4, remove_mock.call_count)
+
+
+class TestLocalBundleManager(base.BaseTestCase):
+
+    def setUp(self):
+        super(TestLocalBundleManager, self).setUp()
+        self.storage_path = self.useFixture(fixtures.TempDir()).path
+        conf = self.useFixture(oslo_fixture.Config(cfg.CONF))
+        conf.config(group="certificates", storage_path=self.storage_path,
+                    local_cache_size=2)
+        self.manager = local_bundle_cert_manager.CertManager
+        self.addCleanup(self.manager._cache.clear)
+
+    def _store_cert(self, certificate="My Certificate"):
+        return self.manager.store_cert(
+            certificate=certificate,
+            private_key="My Private Key",
+            intermediates="My Intermediates",
+            private_key_passphrase="My Private Key Passphrase")
+
+    def test_store_cert_in_one_bundle(self):
+        cert_id = self._store_cert()
+        self.assertEqual(['{0}.bundle'.format(cert_id)],
+                         os.listdir(self.storage_path))
+
+    def test_store_same_cert_twice(self):
+        cert_ids = [self._store_cert(), self._store_cert()]
+        self.assertNotEqual(cert_ids[0], cert_ids[1])
+        self.manager.delete_cert(cert_ids[0])
+        self.manager._cache.clear()
+        self.assertEqual("My Certificate",
+                         self.manager.get_cert(cert_ids[1]).get_certificate())
+
+    def test_get_cert(self):
+        cert_id = self._store_cert()
+        self.manager._cache.clear()
+
+        with mock.patch('__builtin__.open', wraps=open) as open_mock:
+            cert = self.manager.get_cert(cert_id)
+            self.assertEqual(cert, self.manager.get_cert(cert_id))
+        open_mock.assert_called_once_with(
+            os.path.join(self.storage_path, '{0}.bundle'.format(cert_id)),
+            'rb')
+        self.assertIsInstance(cert, cert_manager.Cert)
+        self.assertEqual("My Certificate", cert.get_certificate())
+        self.assertEqual("My Private Key", cert.get_private_key())
+        self.assertEqual("My Intermediates", cert.get_intermediates())
+        self.assertEqual("My Private Key Passphrase",
+                         cert.get_private_key_passphrase())
+
+    def test_cache_is_bounded(self):
+        cert_ids = [self._store_cert("Certificate %d" % i) for i in range(3)]
+        self.assertEqual(cert_ids[1:], list(self.manager._cache))
+        self.manager.get_cert(cert_ids[0])
+        self.assertEqual([cert_ids[2], cert_ids[0]],
+                         list(self.manager._cache))
+
+    def test_get_cert_stored_in_separate_files(self):
+        with mock.patch('__builtin__.open', mock.mock_open(), create=True):
+            cert_id = local_cert_manager.CertManager.store_cert(
+                certificate="My Certificate", private_key="My Private Key")
+        with mock.patch.object(local_cert_manager.CertManager,
+                               'get_cert') as get_cert:
+            self.assertEqual(get_cert.return_value,
+                             self.manager.get_cert(cert_id))
+        get_cert.assert_called_once_with(cert_id)
+
+    def test_get_cert_deleted_by_another_process(self):
+        cert_id = self._store_cert()
+        os.remove(os.path.join(self.storage_path,
+                               '{0}.bundle'.format(cert_id)))
+        self.assertRaises(exceptions.CertificateStorageException,
+                          self.manager.get_cert, cert_id)
+        self.assertNotIn(cert_id, self.manager._cache)
+
+    def test_delete_cert(self):
+        cert_id = self._store_cert()
+        self.manager.delete_cert(cert_id)
+        self.assertEqual([], os.listdir(self.storage_path))
+        self.assertNotIn(cert_id, self.manager._cache)
+        self.assertRaises(exceptions.CertificateStorageException,
+                          self.manager.get_cert, cert_id)
@@ -0,0 +1,104 @@
+#
+# Copyright 2015 OpenStack Foundation.  All rights reserved
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import mock
+
+from neutron_lbaas.common.cert_manager import local_cert_manager
+import neutron_lbaas.common.tls_utils.cert_cache as cert_cache
+from neutron_lbaas.tests import base
+
+
+class TestTLSMaterialCache(base.BaseTestCase):
+
+    def setUp(self):
+        super(TestTLSMaterialCache, self).setUp()
+        self.now = 1000
+        self.certs = {}
+        self.fetch = mock.Mock(side_effect=lambda ref: self.certs[ref])
+        self.parse = mock.Mock(
+            side_effect=lambda cert: 'parsed ' + cert.get_certificate())
+        self.cache = cert_cache.TLSMaterialCache(
+            size=2, ttl=60, clock=lambda: self.now)
+
+    def _set_cert(self, cert_ref, certificate, private_key='key'):
+        self.certs[cert_ref] = local_cert_manager.Cert(
+            certificate=certificate, private_key=private_key,
+            intermediates=['inter1', 'inter2'])
+
+    def _get(self, cert_ref):
+        return self.cache.get(cert_ref, self.fetch, self.parse)
+
+    def test_fresh_entry_is_not_fetched(self):
+        self._set_cert('ref1', 'cert1')
+        self.assertEqual('parsed cert1', self._get('ref1'))
+        self.now += 59
+        self.assertEqual('parsed cert1', self._get('ref1'))
+        self.fetch.assert_called_once_with('ref1')
+        self.assertEqual(1, self.parse.call_count)
+
+    def test_expired_entry_is_parsed_only_when_changed(self):
+        self._set_cert('ref1', 'cert1')
+        self._get('ref1')
+        self.now += 60
+        self.assertEqual('parsed cert1', self._get('ref1'))
+        self.assertEqual(2, self.fetch.call_count)
+        self.assertEqual(1, self.parse.call_count)
+
+        self._set_cert('ref1', 'cert1', private_key='new key')
+        self.now += 60
+        self._get('ref1')
+        self.assertEqual(3, self.fetch.call_count)
+        self.assertEqual(2, self.parse.call_count)
+
+    def test_least_recently_used_entry_is_evicted(self):
+        for cert_ref in ('ref1', 'ref2', 'ref3'):
+            self._set_cert(cert_ref, cert_ref)
+        self._get('ref1')
+        self._get('ref2')
+        self._get('ref1')
+        self._get('ref3')
+        self.assertEqual(2, len(self.cache))
+        self.fetch.reset_mock()
+        self._get('ref1')
+        self._get('ref3')
+        self.assertFalse(self.fetch.called)
+        self._get('ref2')
+        self.fetch.assert_called_once_with('ref2')
+
+    def test_invalidate(self):
+        self._set_cert('ref1', 'cert1')
+        self._get('ref1')
+        self.cache.invalidate('ref1')
+        self._get('ref1')
+        self.cache.invalidate()
+        self.assertEqual(0, len(self.cache))
+        self.assertEqual(2, self.fetch.call_count)
+
+    def test_zero_ttl_disables_cache(self):
+        self.cache = cert_cache.TLSMaterialCache(size=2, ttl=0)
+        self._set_cert('ref1', 'cert1')
+        self._get('ref1')
+        self._get('ref1')
+        self.assertEqual(2, self.parse.call_count)
+        self.assertEqual(0, len(self.cache))
+
+    def test_get_cert_digest(self):
+        self._set_cert('ref1', 'cert1')
+        self._set_cert('ref2', 'cert1')
+        self._set_cert('ref3', 'cert', private_key='1key')
+        digests = [cert_cache.get_cert_digest(self.certs[cert_ref])
+                   for cert_ref in ('ref1', 'ref2', 'ref3')]
+        self.assertEqual(digests[0], digests[1])
+        self.assertNotEqual(digests[0], digests[2])
@@ -15,12 +15,14 @@
 
 import contextlib
 import copy
+import eventlet
 import mock
 import six
 
 from neutron.api import extensions
 from neutron.api.v2 import attributes
 from neutron.common import config
+from neutron.common import exceptions as n_exc
 from neutron import context
 import neutron.db.l3_db  # noqa
 from neutron.db import servicetype_db as sdb
@@ -28,6 +30,7 @@ from neutron.openstack.common import uuidutils
 from neutron.plugins.common import constants
 from neutron.tests.unit.db import test_db_base_plugin_v2
 from oslo_config import cfg
+import sqlalchemy as sa
 import testtools
 import webob.exc
 
@@ -37,6 +40,7 @@ from neutron_lbaas.db.loadbalancer import models
 import neutron_lbaas.extensions
 from neutron_lbaas.extensions import loadbalancerv2
 from neutron_lbaas.services.loadbalancer import constants as lb_const
+from neutron_lbaas.services.loadbalancer import data_models
 from neutron_lbaas.services.loadbalancer import plugin as loadbalancer_plugin
 from neutron_lbaas.tests import base
 
@@ -479,6 +483,17 @@ class LbaasLoadBalancerTests(LbaasPluginDbTestCase):
         with testtools.ExpectedException(webob.exc.HTTPClientError):
             self.test_create_loadbalancer(vip_address='9.9.9.9')
 
+    def test_loadbalancer_from_sqlalchemy_row(self):
+        with self.loadbalancer(name='lb1') as lb:
+            ctx = context.get_admin_context()
+            row = ctx.session.query(models.LoadBalancer.id,
+                                    models.LoadBalancer.name).one()
+            lb_model = data_models.LoadBalancer.from_sqlalchemy_row(row)
+            self.assertEqual(lb['loadbalancer']['id'], lb_model.id)
+            self.assertEqual('lb1', lb_model.name)
+            self.assertIsNone(lb_model.vip_address)
+            self.assertEqual([], lb_model.listeners)
+
     def test_update_loadbalancer(self):
         name = 'new_loadbalancer'
         description = 'a crazy loadbalancer'
@@ -857,6 +872,44 @@ class LbaasListenerTests(ListenerTestBase):
                     expected
                 )
 
+    def test_create_listener_with_tls_validates_containers_once(self):
+        default_tls_container_id = uuidutils.generate_uuid()
+        sni_tls_container_id = uuidutils.generate_uuid()
+        listener_data = {
+            'protocol': lb_const.PROTOCOL_TERMINATED_HTTPS,
+            'default_tls_container_id': default_tls_container_id,
+            'sni_container_ids': [sni_tls_container_id,
+                                  default_tls_container_id,
+                                  sni_tls_container_id],
+            'protocol_port': 443,
+            'admin_state_up': True,
+            'tenant_id': self._tenant_id,
+            'loadbalancer_id': self.lb_id
+        }
+
+        with contextlib.nested(
+            mock.patch('neutron_lbaas.services.loadbalancer.plugin.'
+                       'cert_parser.validate_cert'),
+            mock.patch('neutron_lbaas.services.loadbalancer.plugin.'
+                       'CERT_MANAGER_PLUGIN.CertManager.get_cert'),
+            mock.patch('eventlet.GreenPool', wraps=eventlet.GreenPool)
+        ) as (validate_cert_mock, get_cert_mock, green_pool):
+            cfg.CONF.set_override('tls_validation_workers', 4,
+                                  group='certificates')
+            get_cert_mock.return_value = CertMock('mock_cert')
+            validate_cert_mock.side_effect = [
+                None, exceptions.MisMatchedKey]
+
+            self.assertRaises(loadbalancerv2.TLSContainerInvalid,
+                              self.plugin.create_listener,
+                              context.get_admin_context(),
+                              {'listener': listener_data})
+            green_pool.assert_called_once_with(4)
+            self.assertEqual(
+                [mock.call(default_tls_container_id, check_only=True),
+                 mock.call(sni_tls_container_id, check_only=True)],
+                get_cert_mock.call_args_list)
+
     def test_create_listener_loadbalancer_id_does_not_exist(self):
         self._create_listener(self.fmt, 'HTTP', 80,
                               loadbalancer_id=uuidutils.generate_uuid(),
@@ -1501,6 +1554,163 @@ class LbaasMemberTests(MemberTestBase):
                 self.pool_id,
                 {'member': member_data})
 
+    def test_update_members_operating_status(self):
+        with contextlib.nested(
+            self.member(pool_id=self.pool_id, address='127.0.0.1'),
+            self.member(pool_id=self.pool_id, address='127.0.0.2')
+        ) as (member1, member2):
+            ctx = context.get_admin_context()
+            member1_id = member1['member']['id']
+            member2_id = member2['member']['id']
+            self.plugin.db.update_status(ctx, models.MemberV2, member2_id,
+                                         operating_status=lb_const.OFFLINE)
+            statuses = {member1_id: lb_const.ONLINE,
+                        member2_id: lb_const.OFFLINE}
+
+            changed = self.plugin.db.update_members_operating_status(
+                ctx, dict(statuses, deleted_member=lb_const.ONLINE))
+
+            self.assertEqual({member1_id: lb_const.ONLINE}, changed)
+            for member_id, status in statuses.items():
+                self.assertEqual(status, self.plugin.db.get_pool_member(
+                    ctx, member_id).operating_status)
+            # nothing is written once the statuses are stored
+            changed = self.plugin.db.update_members_operating_status(
+                ctx, statuses)
+            self.assertEqual({}, changed)
+
+    def test_batch_members(self):
+        with contextlib.nested(
+            self.member(pool_id=self.pool_id, address='127.0.0.1'),
+            self.member(pool_id=self.pool_id, address='127.0.0.2',
+                        no_delete=True)
+        ) as (member1, member2):
+            ctx = context.get_admin_context()
+            member1_id = member1['member']['id']
+            member2_id = member2['member']['id']
+            body = {'create': [{'address': '127.0.0.3',
+                                'protocol_port': 80,
+                                'subnet_id': self.test_subnet_id,
+                                'tenant_id': self._tenant_id}],
+                    'update': [{'id': member1_id, 'weight': 5}],
+                    'delete': [member2_id]}
+
+            result = self.plugin.batch_members(ctx, self.pool_id, body)
+
+            self.assertEqual(2, len(result['members']))
+            created, updated = result['members']
+            self.assertEqual('127.0.0.3', created['address'])
+            self.assertEqual(member1_id, updated['id'])
+            self.assertEqual(5, updated['weight'])
+            resp, pool = self._get_pool_api(self.pool_id)
+            self.assertEqual(
+                set([member1_id, created['id']]),
+                set(member['id'] for member in pool['pool']['members']))
+            self._validate_statuses(self.lb_id, self.listener_id,
+                                    self.pool_id, member1_id)
+            self._validate_statuses(self.lb_id, self.listener_id,
+                                    self.pool_id, created['id'])
+            self._delete_member_api(self.pool_id, created['id'])
+
+    def test_batch_members_is_all_or_nothing(self):
+        with self.member(pool_id=self.pool_id) as member:
+            ctx = context.get_admin_context()
+            member = member['member']
+            body = {'create': [{'address': '127.0.0.3',
+                                'protocol_port': 80,
+                                'subnet_id': self.test_subnet_id,
+                                'tenant_id': self._tenant_id},
+                               {'address': member['address'],
+                                'protocol_port': member['protocol_port'],
+                                'subnet_id': self.test_subnet_id,
+                                'tenant_id': self._tenant_id}]}
+            self.assertRaises(loadbalancerv2.MemberExists,
+                              self.plugin.batch_members,
+                              ctx, self.pool_id, body)
+            body = {'delete': [member['id'], 'WRONG_MEMBER_ID']}
+            self.assertRaises(loadbalancerv2.MemberNotFoundForPool,
+                              self.plugin.batch_members,
+                              ctx, self.pool_id, body)
+            resp, pool = self._get_pool_api(self.pool_id)
+            self.assertEqual([{'id': member['id']}],
+                             pool['pool']['members'])
+            self._validate_statuses(self.lb_id, self.listener_id,
+                                    self.pool_id, member['id'])
+
+    def test_batch_members_invalid_body(self):
+        ctx = context.get_admin_context()
+        for body in ({}, {'create': {}}, {'remove': []},
+                     {'delete': [{'id': 'member'}]},
+                     {'update': [{'weight': 1}]},
+                     {'update': [{'id': 'member'}], 'delete': ['member']}):
+            self.assertRaises(loadbalancerv2.MemberBatchInvalid,
+                              self.plugin.batch_members,
+                              ctx, self.pool_id, body)
+
+    def test_batch_members_checks_quota(self):
+        with self.member(pool_id=self.pool_id) as member:
+            ctx = context.get_admin_context()
+            member = member['member']
+            body = {'create': [{'address': '127.0.0.%d' % i,
+                                'protocol_port': 80,
+                                'subnet_id': self.test_subnet_id,
+                                'tenant_id': self._tenant_id}
+                               for i in (2, 3)]}
+            with mock.patch.object(loadbalancer_plugin.quota.QUOTAS,
+                                   'limit_check') as limit_check:
+                limit_check.side_effect = n_exc.OverQuota(overs=['member'])
+                self.assertRaises(n_exc.OverQuota,
+                                  self.plugin.batch_members,
+                                  ctx, self.pool_id, body)
+            limit_check.assert_called_once_with(ctx, self._tenant_id,
+                                                member=3)
+            resp, pool = self._get_pool_api(self.pool_id)
+            self.assertEqual([{'id': member['id']}],
+                             pool['pool']['members'])
+            self._validate_statuses(self.lb_id, self.listener_id,
+                                    self.pool_id, member['id'])
+
+    def test_batch_members_enforces_policy(self):
+        with contextlib.nested(
+            self.member(pool_id=self.pool_id, address='127.0.0.1'),
+            self.member(pool_id=self.pool_id, address='127.0.0.2'),
+            mock.patch.object(loadbalancer_plugin.policy, 'enforce')
+        ) as (member1, member2, enforce):
+            ctx = context.get_admin_context()
+            member1_id = member1['member']['id']
+            member2_id = member2['member']['id']
+            body = {'create': [{'address': '127.0.0.3',
+                                'protocol_port': 80,
+                                'subnet_id': self.test_subnet_id,
+                                'tenant_id': self._tenant_id}],
+                    'update': [{'id': member1_id, 'weight': 5}],
+                    'delete': [member2_id]}
+
+            def deny_delete(context, action, target, plugin=None):
+                if action == 'delete_member':
+                    raise n_exc.PolicyNotAuthorized(action=action)
+
+            enforce.side_effect = deny_delete
+            self.assertRaises(n_exc.PolicyNotAuthorized,
+                              self.plugin.batch_members,
+                              ctx, self.pool_id, body)
+
+            actions = [(call[0][1], call[0][2]) for call in
+                       enforce.call_args_list]
+            self.assertEqual(['create_member', 'update_member',
+                              'delete_member'],
+                             [action for action, _target in actions])
+            self.assertEqual(self.pool_id, actions[0][1]['pool_id'])
+            self.assertEqual((member1_id, 5),
+                             (actions[1][1]['id'], actions[1][1]['weight']))
+            self.assertEqual(member2_id, actions[2][1]['id'])
+            resp, pool = self._get_pool_api(self.pool_id)
+            self.assertEqual(
+                set([member1_id, member2_id]),
+                set(member['id'] for member in pool['pool']['members']))
+            self._validate_statuses(self.lb_id, self.listener_id,
+                                    self.pool_id, member2_id)
+
     def test_update_member(self):
         keys = [('address', "127.0.0.1"),
                 ('tenant_id', self._tenant_id),
@@ -1964,6 +2174,68 @@ class LbaasStatusesTest(MemberTestBase):
         n_disabled = self._countDisabledChildren(statuses, 0)
         self.assertEqual(11, n_disabled)
 
+    def _count_queries(self, ctx, func, *args):
+        statements = []
+
+        def count_statement(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        engine = ctx.session.get_bind()
+        sa.event.listen(engine, 'before_cursor_execute', count_statement)
+        try:
+            result = func(ctx, *args)
+        finally:
+            sa.event.remove(engine, 'before_cursor_execute', count_statement)
+        return result, len(statements)
+
+    def test_get_loadbalancer_query_count(self):
+        ctx = context.get_admin_context()
+        lb_id = self._create_new_populated_loadbalancer()['id']
+        small_lb, small_count = self._count_queries(
+            ctx, self.plugin.db.get_loadbalancer, self.lb_id)
+        lb, count = self._count_queries(
+            ctx, self.plugin.db.get_loadbalancer, lb_id)
+        # the whole graph is fetched with a fixed number of queries
+        self.assertEqual(2, small_count)
+        self.assertEqual(2, count)
+
+        self.assertTrue(lb.vip_port.fixed_ips)
+        self.assertEqual(2, len(lb.listeners))
+        for listener in lb.listeners:
+            self.assertIs(lb, listener.loadbalancer)
+            pool = listener.default_pool
+            self.assertIs(listener, pool.listener)
+            self.assertIs(pool, pool.healthmonitor.pool)
+            self.assertEqual(3, len(pool.members))
+            for member in pool.members:
+                self.assertIs(pool, member.pool)
+
+    def test_get_loadbalancers_query_count(self):
+        ctx = context.get_admin_context()
+        self._create_new_populated_loadbalancer()
+        lbs, count = self._count_queries(ctx, self.plugin.db.get_loadbalancers)
+        self.assertEqual(2, len(lbs))
+        self.assertEqual(2, count)
+
+    def test_get_loadbalancer_reloads_graph(self):
+        ctx = context.get_admin_context()
+        lb_dict = self._create_new_populated_loadbalancer()
+        member_id = lb_dict['listeners'][0]['pools'][0]['members'][0]['id']
+        self.plugin.db.get_loadbalancer(ctx, lb_dict['id'])
+        self.plugin.db.update_status(context.get_admin_context(),
+                                     models.MemberV2, member_id,
+                                     operating_status=lb_const.OFFLINE)
+        lb = self.plugin.db.get_loadbalancer(ctx, lb_dict['id'])
+        members = dict((member.id, member) for listener in lb.listeners
+                       for member in listener.default_pool.members)
+        self.assertEqual(lb_const.OFFLINE,
+                         members[member_id].operating_status)
+
+    def test_get_loadbalancer_not_found(self):
+        self.assertRaises(loadbalancerv2.EntityNotFound,
+                          self.plugin.db.get_loadbalancer,
+                          context.get_admin_context(), 'WRONG_LB_ID')
+
     def _countDisabledChildren(self, obj, count):
         if isinstance(obj, dict):
             for key, value in six.iteritems(obj):
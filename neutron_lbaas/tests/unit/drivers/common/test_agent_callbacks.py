@@ -13,6 +13,8 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import contextlib
+
 import mock
 
 from neutron import context
@@ -133,6 +135,26 @@ class TestLoadBalancerCallbacks(
                 self.assertEqual([loadbalancer['loadbalancer']['id']],
                                  ready)
 
+    def test_get_loadbalancer_revisions(self):
+        with self.loadbalancer() as loadbalancer:
+            lb_id = loadbalancer['loadbalancer']['id']
+            ctx = context.get_admin_context()
+            self.plugin_instance.db.update_loadbalancer_provisioning_status(
+                ctx, lb_id)
+            with mock.patch(
+                    'neutron_lbaas.agent_scheduler.LbaasAgentSchedulerDbMixin.'
+                    'list_loadbalancers_on_lbaas_agent') as mock_agent_lbs:
+                mock_agent_lbs.return_value = [
+                    data_models.LoadBalancer(id=lb_id)]
+                self.assertEqual(
+                    {lb_id: 0}, self.callbacks.get_loadbalancer_revisions(ctx))
+
+                self.plugin_instance.db.test_and_set_status(
+                    ctx, db_models.LoadBalancer, lb_id,
+                    constants.PENDING_UPDATE)
+                self.assertEqual(
+                    {lb_id: 1}, self.callbacks.get_loadbalancer_revisions(ctx))
+
     def test_get_loadbalancer_active(self):
         with self.loadbalancer() as loadbalancer:
             ctx = context.get_admin_context()
@@ -159,6 +181,39 @@ class TestLoadBalancerCallbacks(
             del expected_lb['stats']
             self.assertEqual(expected_lb, load_balancer)
 
+    def test_get_loadbalancers(self):
+        with self.subnet() as subnet:
+            with contextlib.nested(
+                self.loadbalancer(subnet=subnet),
+                self.loadbalancer(subnet=subnet)
+            ) as (lb1, lb2):
+                ctx = context.get_admin_context()
+                lb_ids = [lb1['loadbalancer']['id'],
+                          lb2['loadbalancer']['id']]
+                subnet_id = subnet['subnet']['id']
+                core = self.plugin_instance.db._core_plugin
+                with mock.patch.object(core, 'get_subnets',
+                                       wraps=core.get_subnets) as get_subnets:
+                    load_balancers = self.callbacks.get_loadbalancers(
+                        ctx, lb_ids + ['deleted_lb'])
+                    # both vips live on the same subnet
+                    get_subnets.assert_called_once_with(
+                        ctx, filters={'id': [subnet_id]})
+
+                self.assertEqual(sorted(lb_ids),
+                                 sorted(lb['id'] for lb in load_balancers))
+                for lb in load_balancers:
+                    self.assertEqual('dummy',
+                                     lb['provider']['device_driver'])
+                    self.assertEqual(
+                        subnet_id,
+                        lb['vip_port']['fixed_ips'][0]['subnet']['id'])
+                    self.assertNotIn('stats', lb)
+
+    def test_get_loadbalancers_no_ids(self):
+        self.assertEqual([], self.callbacks.get_loadbalancers(
+            context.get_admin_context(), []))
+
     def _update_port_test_helper(self, expected, func, **kwargs):
         core = self.plugin_instance.db._core_plugin
 
@@ -222,6 +277,33 @@ class TestLoadBalancerCallbacks(
             host='host'
         )
 
+    def test_unplug_vip_port_only_sends_changes(self):
+        with contextlib.nested(
+            mock.patch.object(self.plugin.db._core_plugin, 'get_port',
+                              return_value={portbindings.HOST_ID: 'host',
+                                            'name': 'vip'}),
+            mock.patch.object(self.plugin.db._core_plugin, 'update_port')
+        ) as (mock_get_port, mock_update_port):
+            ctx = context.get_admin_context()
+            self.callbacks.unplug_vip_port(ctx, port_id='port_id',
+                                           host='host')
+            mock_update_port.assert_called_once_with(
+                ctx, 'port_id', {'port': {'admin_state_up': False,
+                                          'device_owner': '',
+                                          'device_id': ''}})
+
+    def test_unplug_vip_port_bound_to_other_host(self):
+        with mock.patch.object(
+                self.plugin.db._core_plugin, 'get_port',
+                return_value={portbindings.HOST_ID: 'newhost'}):
+            with mock.patch.object(
+                    self.plugin.db._core_plugin,
+                    'update_port') as mock_update_port:
+                self.callbacks.unplug_vip_port(
+                    context.get_admin_context(), port_id='port_id',
+                    host='oldhost')
+                self.assertFalse(mock_update_port.called)
+
     def test_loadbalancer_deployed(self):
         with self.loadbalancer() as loadbalancer:
             ctx = context.get_admin_context()
@@ -237,6 +319,63 @@ class TestLoadBalancerCallbacks(
                 ctx, loadbalancer['loadbalancer']['id'])
             self.assertEqual('ACTIVE', l.provisioning_status)
 
+    def _loadbalancer_deployed_graph_helper(self, pool_status=None):
+        ctx = context.get_admin_context()
+        db = self.plugin_instance.db
+        with self.subnet() as subnet:
+            with self.loadbalancer(subnet=subnet, no_delete=True) as lb:
+                lb_id = lb['loadbalancer']['id']
+                db.update_loadbalancer_provisioning_status(ctx, lb_id)
+                with self.listener(loadbalancer_id=lb_id,
+                                   no_delete=True) as listener:
+                    listener_id = listener['listener']['id']
+                    db.update_loadbalancer_provisioning_status(ctx, lb_id)
+                    with self.pool(listener_id=listener_id,
+                                   no_delete=True) as pool:
+                        pool_id = pool['pool']['id']
+                        db.update_loadbalancer_provisioning_status(ctx,
+                                                                   lb_id)
+                        with contextlib.nested(
+                            self.member(pool_id=pool_id, subnet=subnet,
+                                        no_delete=True),
+                            self.healthmonitor(pool_id=pool_id,
+                                               no_delete=True)
+                        ) as (member, hm):
+                            if pool_status:
+                                db.update_status(
+                                    ctx, db_models.PoolV2, pool_id,
+                                    provisioning_status=pool_status)
+
+                            self.callbacks.loadbalancer_deployed(ctx, lb_id)
+
+                            return dict(
+                                loadbalancer=db.get_loadbalancer(
+                                    ctx, lb_id).provisioning_status,
+                                listener=db.get_listener(
+                                    ctx, listener_id).provisioning_status,
+                                pool=db.get_pool(
+                                    ctx, pool_id).provisioning_status,
+                                member=db.get_pool_member(
+                                    ctx, member['member']['id']
+                                ).provisioning_status,
+                                healthmonitor=db.get_healthmonitor(
+                                    ctx, hm['healthmonitor']['id']
+                                ).provisioning_status)
+
+    def test_loadbalancer_deployed_graph(self):
+        statuses = self._loadbalancer_deployed_graph_helper()
+        self.assertEqual(dict.fromkeys(statuses, constants.ACTIVE), statuses)
+
+    def test_loadbalancer_deployed_graph_pool_error(self):
+        statuses = self._loadbalancer_deployed_graph_helper(
+            pool_status=constants.ERROR)
+        self.assertEqual(constants.ACTIVE, statuses['loadbalancer'])
+        self.assertEqual(constants.ACTIVE, statuses['listener'])
+        self.assertEqual(constants.ERROR, statuses['pool'])
+        # children of a pool in error are left as they were
+        self.assertEqual(constants.PENDING_CREATE, statuses['member'])
+        self.assertEqual(constants.PENDING_CREATE, statuses['healthmonitor'])
+
     def test_listener_deployed(self):
         with self.loadbalancer(no_delete=True) as loadbalancer:
             self.plugin_instance.db.update_loadbalancer_provisioning_status(
@@ -265,6 +404,53 @@ class TestLoadBalancerCallbacks(
                     ctx, listener['listener']['id'])
                 self.assertEqual('ACTIVE', ll.provisioning_status)
 
+    def test_update_loadbalancers_stats(self):
+        with contextlib.nested(
+            self.loadbalancer(),
+            self.loadbalancer()
+        ) as (lb1, lb2):
+            lb1_id = lb1['loadbalancer']['id']
+            lb2_id = lb2['loadbalancer']['id']
+            ctx = context.get_admin_context()
+            # the second load balancer has no stats row yet
+            self.plugin_instance.db._delete_loadbalancer_stats(ctx, lb2_id)
+            self.callbacks.update_loadbalancers_stats(ctx, stats={
+                lb1_id: {lb_const.STATS_IN_BYTES: '7764',
+                         lb_const.STATS_TOTAL_CONNECTIONS: '10',
+                         'members': {}},
+                lb2_id: {lb_const.STATS_OUT_BYTES: '2365',
+                         lb_const.STATS_ACTIVE_CONNECTIONS: ''},
+                'deleted_lb': {lb_const.STATS_IN_BYTES: '1'}})
+
+            stats = self.plugin_instance.db.stats(ctx, lb1_id)
+            self.assertEqual(7764, stats.bytes_in)
+            self.assertEqual(0, stats.bytes_out)
+            self.assertEqual(10, stats.total_connections)
+            stats = self.plugin_instance.db.stats(ctx, lb2_id)
+            self.assertEqual(2365, stats.bytes_out)
+            self.assertEqual(0, stats.active_connections)
+            self.assertIsNone(ctx.session.query(
+                db_models.LoadBalancerStatistics).filter_by(
+                    loadbalancer_id='deleted_lb').first())
+
+    def test_update_loadbalancers_stats_member_statuses(self):
+        ctx = context.get_admin_context()
+        stats = {'lb1': {'members': {'m1': {'status': constants.ACTIVE},
+                                     'm2': {'status': constants.INACTIVE}}},
+                 'lb2': {'members': {'m3': {'status': constants.ACTIVE}}},
+                 'lb3': {}}
+        with contextlib.nested(
+            mock.patch.object(self.plugin_instance.db,
+                              'update_loadbalancers_stats'),
+            mock.patch.object(self.plugin_instance.db,
+                              'update_members_operating_status')
+        ) as (update_stats, update_statuses):
+            self.callbacks.update_loadbalancers_stats(ctx, stats=stats)
+            update_stats.assert_called_once_with(ctx, stats)
+            update_statuses.assert_called_once_with(
+                ctx, {'m1': lb_const.ONLINE, 'm2': lb_const.OFFLINE,
+                      'm3': lb_const.ONLINE})
+
     def test_update_status_loadbalancer(self):
         with self.loadbalancer() as loadbalancer:
             loadbalancer_id = loadbalancer['loadbalancer']['id']
@@ -22,6 +22,7 @@ from neutron.plugins.common import constants
 
 from neutron_lbaas.db.loadbalancer import models
 from neutron_lbaas.drivers.common import agent_driver_base
+from neutron_lbaas.drivers import driver_base
 from neutron_lbaas.extensions import loadbalancerv2
 from neutron_lbaas.tests import base
 from neutron_lbaas.tests.unit.db.loadbalancer import test_db_loadbalancerv2
@@ -60,7 +61,7 @@ class TestLoadBalancerAgentApi(base.BaseTestCase):
     def test_init(self):
         self.assertEqual(self.api.client.target.topic, 'topic')
 
-    def _call_test_helper(self, method_name, method_args):
+    def _call_test_helper(self, method_name, method_args, version=None):
         with contextlib.nested(
             mock.patch.object(self.api.client, 'cast'),
             mock.patch.object(self.api.client, 'prepare'),
@@ -73,6 +74,8 @@ class TestLoadBalancerAgentApi(base.BaseTestCase):
                                            **method_args)
 
         prepare_args = {'server': 'host'}
+        if version:
+            prepare_args['version'] = version
         prepare_mock.assert_called_once_with(**prepare_args)
 
         if method_name == 'agent_updated':
@@ -114,6 +117,11 @@ class TestLoadBalancerAgentApi(base.BaseTestCase):
     def test_delete_member(self):
         self._call_test_helper('delete_member', {'member': 'test'})
 
+    def test_batch_members(self):
+        self._call_test_helper('batch_members', {'pool': 'test',
+                                                 'member_ids': ['test']},
+                               version='1.1')
+
     def test_create_monitor(self):
         self._call_test_helper('create_healthmonitor',
                                {'healthmonitor': 'test'})
@@ -128,6 +136,71 @@ class TestLoadBalancerAgentApi(base.BaseTestCase):
                                {'healthmonitor': 'test'})
 
 
+class TestLoadBalancerRebalancer(base.BaseTestCase):
+    def setUp(self):
+        super(TestLoadBalancerRebalancer, self).setUp()
+        self.driver = mock.Mock(device_driver='dummy')
+        self.driver.plugin.drivers = {'lbaas': self.driver}
+        self.db = self.driver.plugin.db
+        self.db.get_loadbalancer.side_effect = lambda ctx, lb_id: mock.Mock(
+            id=lb_id, provider=mock.Mock(provider_name='lbaas'))
+        self.db.rebind_loadbalancer.return_value = True
+        self.db.is_agent_down.side_effect = lambda heartbeat: heartbeat
+        self.agents = [
+            {'id': 'dead', 'host': 'host1', 'admin_state_up': True,
+             'heartbeat_timestamp': True},
+            {'id': 'busy', 'host': 'host2', 'admin_state_up': True,
+             'heartbeat_timestamp': False},
+            {'id': 'idle', 'host': 'host3', 'admin_state_up': True,
+             'heartbeat_timestamp': False}]
+        self.db.get_lbaas_agent_candidates.return_value = self.agents
+        self.db.get_lbaas_agent_loads.return_value = {
+            'dead': (2, 2), 'busy': (2, 8), 'idle': (0, 0)}
+        self.db.get_loadbalancer_loads_on_lbaas_agent.side_effect = (
+            lambda ctx, agent_id: {
+                'dead': {'lb1': 2, 'lb2': 0},
+                'busy': {'lb3': 6, 'lb4': 2}}[agent_id])
+
+    def _moves(self):
+        return [(call[0][1].id, call[0][2])
+                for call in
+                self.driver.agent_rpc.create_loadbalancer.call_args_list]
+
+    def test_rebalance_dead_agent(self):
+        rebalancer = agent_driver_base.LoadBalancerRebalancer(self.driver)
+        self.assertEqual(2, rebalancer.rebalance_agents(mock.sentinel.ctx))
+        # the lightest load balancer first, each to the least loaded agent
+        self.assertEqual([('lb2', 'host3'), ('lb1', 'host3')], self._moves())
+        self.assertFalse(self.driver.agent_rpc.delete_loadbalancer.called)
+
+    def test_rebalance_overloaded_agent(self):
+        self.db.get_lbaas_agent_loads.return_value['dead'] = (0, 0)
+        rebalancer = agent_driver_base.LoadBalancerRebalancer(
+            self.driver, max_load=7)
+        self.assertEqual(1, rebalancer.rebalance_agents(mock.sentinel.ctx))
+        self.assertEqual([('lb4', 'host3')], self._moves())
+        self.driver.agent_rpc.delete_loadbalancer.assert_called_once_with(
+            mock.sentinel.ctx, mock.ANY, 'host2')
+
+    def test_rebalance_batch_size(self):
+        rebalancer = agent_driver_base.LoadBalancerRebalancer(
+            self.driver, batch_size=1)
+        self.assertEqual(1, rebalancer.rebalance_agents(mock.sentinel.ctx))
+        self.assertEqual([('lb2', 'host3')], self._moves())
+
+    def test_rebalance_other_provider(self):
+        self.driver.plugin.drivers = {'lbaas': mock.Mock()}
+        rebalancer = agent_driver_base.LoadBalancerRebalancer(self.driver)
+        self.assertEqual(0, rebalancer.rebalance_agents(mock.sentinel.ctx))
+        self.assertFalse(self.db.rebind_loadbalancer.called)
+
+    def test_rebalance_all_agents_alive(self):
+        self.agents[0]['heartbeat_timestamp'] = False
+        rebalancer = agent_driver_base.LoadBalancerRebalancer(self.driver)
+        self.assertEqual(0, rebalancer.rebalance_agents(mock.sentinel.ctx))
+        self.assertFalse(self.db.get_lbaas_agent_loads.called)
+
+
 class TestLoadBalancerPluginNotificationWrapper(TestLoadBalancerPluginBase):
     def setUp(self):
         self.log = mock.patch.object(agent_driver_base, 'LOG')
@@ -475,6 +548,127 @@ class TestLoadBalancerPluginNotificationWrapper(TestLoadBalancerPluginBase):
                                 self.plugin_instance.db.get_pool_member,
                                 ctx, member_id)
 
+    def test_batch_members(self):
+        with self.loadbalancer(no_delete=True) as loadbalancer:
+            lb_id = loadbalancer['loadbalancer']['id']
+            self._update_status(models.LoadBalancer, constants.ACTIVE, lb_id)
+            with self.listener(loadbalancer_id=lb_id,
+                               no_delete=True) as listener:
+                listener_id = listener['listener']['id']
+                self._update_status(models.LoadBalancer, constants.ACTIVE,
+                                    lb_id)
+                with self.pool(listener_id=listener_id,
+                               no_delete=True) as pool:
+                    pool_id = pool['pool']['id']
+                    self._update_status(models.LoadBalancer, constants.ACTIVE,
+                                        lb_id)
+                    with self.subnet(cidr='11.0.0.0/24') as subnet:
+                        with self.member(pool_id=pool_id, subnet=subnet,
+                                         no_delete=True) as member:
+                            member_id = member['member']['id']
+                            self._update_status(models.LoadBalancer,
+                                                constants.ACTIVE, lb_id)
+                            ctx = context.get_admin_context()
+                            body = {'create': [
+                                {'address': '11.0.0.20',
+                                 'protocol_port': 80,
+                                 'subnet_id': subnet['subnet']['id'],
+                                 'tenant_id': self._tenant_id}],
+                                'delete': [member_id]}
+                            result = self.plugin_instance.batch_members(
+                                ctx, pool_id, body)
+                            new_id = result['members'][0]['id']
+                            calls = self.mock_api.batch_members.call_args_list
+                            self.assertEqual(1, len(calls))
+                            (_, called_pool, called_member_ids,
+                             called_host) = calls[0][0]
+                            self.assertEqual(pool_id, called_pool.id)
+                            self.assertEqual([new_id], called_member_ids)
+                            serialized = (agent_driver_base.
+                                          DataModelSerializer().
+                                          serialize_entity(ctx, called_pool))
+                            self.assertEqual(
+                                [new_id], [member['id'] for member in
+                                           serialized['members']])
+                            self.assertEqual('host', called_host)
+                            self.assertFalse(
+                                self.mock_api.create_member.called)
+                            self.assertFalse(
+                                self.mock_api.delete_member.called)
+                            self.assertRaises(
+                                loadbalancerv2.EntityNotFound,
+                                self.plugin_instance.db.get_pool_member,
+                                ctx, member_id)
+                            lb = self.plugin_instance.db.get_loadbalancer(
+                                ctx, lb_id)
+                            self.assertEqual(constants.PENDING_UPDATE,
+                                             lb.provisioning_status)
+
+    def test_batch_members_fallback(self):
+        serializer = agent_driver_base.DataModelSerializer()
+
+        def serialize(ctx, *args):
+            for arg in args:
+                serializer.serialize_entity(ctx, arg)
+
+        for method in ('create_member', 'update_member', 'delete_member'):
+            getattr(self.mock_api, method).side_effect = serialize
+        with self.loadbalancer(no_delete=True) as loadbalancer:
+            lb_id = loadbalancer['loadbalancer']['id']
+            self._update_status(models.LoadBalancer, constants.ACTIVE, lb_id)
+            with self.listener(loadbalancer_id=lb_id,
+                               no_delete=True) as listener:
+                listener_id = listener['listener']['id']
+                self._update_status(models.LoadBalancer, constants.ACTIVE,
+                                    lb_id)
+                with self.pool(listener_id=listener_id,
+                               no_delete=True) as pool:
+                    pool_id = pool['pool']['id']
+                    self._update_status(models.LoadBalancer, constants.ACTIVE,
+                                        lb_id)
+                    with self.subnet(cidr='11.0.0.0/24') as subnet:
+                        with contextlib.nested(
+                            self.member(pool_id=pool_id, subnet=subnet,
+                                        address='11.0.0.10', no_delete=True),
+                            self.member(pool_id=pool_id, subnet=subnet,
+                                        address='11.0.0.11', no_delete=True),
+                            mock.patch.object(
+                                agent_driver_base.MemberManager, 'batch',
+                                driver_base.BaseMemberManager.__dict__[
+                                    'batch'])
+                        ) as (member1, member2, _batch):
+                            member1_id = member1['member']['id']
+                            member2_id = member2['member']['id']
+                            self._update_status(models.LoadBalancer,
+                                                constants.ACTIVE, lb_id)
+                            ctx = context.get_admin_context()
+                            body = {'create': [
+                                {'address': '11.0.0.20',
+                                 'protocol_port': 80,
+                                 'subnet_id': subnet['subnet']['id'],
+                                 'tenant_id': self._tenant_id}],
+                                'update': [{'id': member1_id, 'weight': 5}],
+                                'delete': [member2_id]}
+                            result = self.plugin_instance.batch_members(
+                                ctx, pool_id, body)
+                            new_id = result['members'][0]['id']
+                            self.assertFalse(
+                                self.mock_api.batch_members.called)
+                            calls = self.mock_api.create_member.call_args_list
+                            self.assertEqual(new_id, calls[0][0][1].id)
+                            self.assertEqual(pool_id,
+                                             calls[0][0][1].pool.id)
+                            created_pool = calls[0][0][1].pool
+                            calls = self.mock_api.update_member.call_args_list
+                            _, old_member, called_member, _ = calls[0][0]
+                            self.assertEqual(1, old_member.weight)
+                            self.assertEqual(5, called_member.weight)
+                            # the members share the graph of their pool
+                            self.assertIs(created_pool, called_member.pool)
+                            self.assertIs(created_pool, old_member.pool)
+                            calls = self.mock_api.delete_member.call_args_list
+                            self.assertEqual(member2_id, calls[0][0][1].id)
+
     def test_create_health_monitor(self):
         with self.loadbalancer(no_delete=True) as loadbalancer:
             lb_id = loadbalancer['loadbalancer']['id']
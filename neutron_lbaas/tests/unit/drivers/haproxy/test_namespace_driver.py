@@ -15,14 +15,17 @@
 
 import collections
 import contextlib
+import os
 import socket
 
+import fixtures
 import mock
 from neutron.common import exceptions
 from neutron.plugins.common import constants
 
 from neutron_lbaas.drivers.haproxy import namespace_driver
 from neutron_lbaas.services.loadbalancer import data_models
+from neutron_lbaas.services.loadbalancer.drivers.haproxy import jinja_cfg
 from neutron_lbaas.tests import base
 
 
@@ -167,7 +170,7 @@ class TestHaproxyNSDriver(base.BaseTestCase):
             gsp.side_effect = lambda x, y, z: '/pool/' + y
             path_exists.return_value = True
             mocket.return_value = mocket
-            mocket.recv.return_value = raw_stats
+            mocket.recv.side_effect = [raw_stats, '']
 
             exp_stats = {'connection_errors': '0',
                          'active_connections': '3',
@@ -195,15 +198,36 @@ class TestHaproxyNSDriver(base.BaseTestCase):
             stats = self.driver.get_stats(self.lb.id)
             self.assertEqual(exp_stats, stats)
 
-            mocket.recv.return_value = raw_stats_empty
+            mocket.recv.side_effect = [raw_stats_empty, '']
             self.assertEqual({'members': {}},
                              self.driver.get_stats(self.lb.id))
 
+            mocket.recv.side_effect = socket.error
+            self.assertEqual({'members': {}},
+                             self.driver.get_stats(self.lb.id))
+            mocket.close.assert_called_with()
+
             path_exists.return_value = False
             mocket.reset_mock()
             self.assertEqual({}, self.driver.get_stats(self.lb.id))
             self.assertFalse(mocket.called)
 
+    def test_read_lines(self):
+        sock = mock.Mock()
+        sock.recv.side_effect = ['# a,b\n1,', '2\n\n3,4', '']
+        self.assertEqual(['# a,b', '1,2', '', '3,4'],
+                         list(namespace_driver._read_lines(sock)))
+        sock.recv.assert_called_with(namespace_driver.STATS_READ_SIZE)
+
+    def test_parse_stats(self):
+        lines = ['# pxname,svname,status,type,', 'p1,BACKEND,UP,1,', '',
+                 'p1,s1,DOWN,2']
+        self.assertEqual(
+            [('1', 'UP', ''), ('2', 'DOWN', '')],
+            list(namespace_driver._parse_stats(
+                lines, columns=('type', 'status', 'chkfail'))))
+        self.assertEqual([], list(namespace_driver._parse_stats([])))
+
     def test_deploy_instance(self):
         self.driver.deployable = mock.Mock(return_value=False)
         self.driver.exists = mock.Mock(return_value=True)
@@ -240,6 +264,9 @@ class TestHaproxyNSDriver(base.BaseTestCase):
 
     def test_update(self):
         self.driver._get_state_file_path = mock.Mock(return_value='/path')
+        self.driver._get_tls_digest = mock.Mock(return_value='digest')
+        self.driver._render_config = mock.Mock(return_value='new config')
+        self.driver._read_config = mock.Mock(return_value='old config')
         self.driver._spawn = mock.Mock()
         with mock.patch('__builtin__.open') as m_open:
             file_mock = mock.MagicMock()
@@ -247,8 +274,93 @@ class TestHaproxyNSDriver(base.BaseTestCase):
             file_mock.__enter__.return_value = file_mock
             file_mock.__iter__.return_value = iter(['123'])
             self.driver.update(self.lb)
-            self.driver._spawn.assert_called_once_with(self.lb,
-                                                       ['-sf', '123'])
+            self.driver._spawn.assert_called_once_with(
+                self.lb, ['-sf', '123'], config_str='new config')
+        self.assertEqual({'reloads_performed': 1, 'reloads_avoided': 0},
+                         self.driver.get_metrics())
+
+    def test_update_tls_changed(self):
+        self.driver._get_state_file_path = mock.Mock(return_value='/path')
+        self.driver._get_tls_digest = mock.Mock(
+            side_effect=['old digest', 'new digest'])
+        self.driver._render_config = mock.Mock(return_value='config')
+        self.driver._read_config = mock.Mock(return_value='config')
+        self.driver._spawn = mock.Mock()
+        with mock.patch('__builtin__.open') as m_open:
+            file_mock = mock.MagicMock()
+            m_open.return_value = file_mock
+            file_mock.__iter__.return_value = iter(['123'])
+            self.driver.update(self.lb)
+        self.driver._spawn.assert_called_once_with(
+            self.lb, ['-sf', '123'], config_str='config')
+        self.assertEqual(1, self.driver.reloads_performed)
+
+    def test_update_unchanged(self):
+        self.driver._get_state_file_path = mock.Mock(return_value='/path')
+        self.driver._get_tls_digest = mock.Mock(return_value='digest')
+        self.driver._render_config = mock.Mock(return_value='config')
+        self.driver._read_config = mock.Mock(return_value='config')
+        self.driver._spawn = mock.Mock()
+
+        self.driver.update(self.lb)
+
+        self.assertFalse(self.driver._spawn.called)
+        self.assertEqual(self.lb,
+                         self.driver.deployed_loadbalancers[self.lb.id])
+        self.assertEqual({'reloads_performed': 0, 'reloads_avoided': 1},
+                         self.driver.get_metrics())
+
+    @mock.patch('os.walk')
+    def test_get_tls_digest(self, walk):
+        walk.return_value = [('/the/path/v2/lb1', ['listener1'],
+                              ['haproxy.conf', 'haproxy.pid',
+                               'listener1.crt-list']),
+                             ('/the/path/v2/lb1/listener1', [],
+                              ['b.pem', 'a.pem'])]
+        with mock.patch('__builtin__.open') as m_open:
+            file_mock = mock.MagicMock()
+            m_open.return_value = file_mock
+            file_mock.__enter__.return_value = file_mock
+            file_mock.read.side_effect = ['crt-list', 'pem a', 'pem b'] * 2
+            digest = self.driver._get_tls_digest(self.lb.id)
+            self.assertEqual(digest, self.driver._get_tls_digest(self.lb.id))
+        walk.assert_called_with('/the/path/v2/lb1')
+        m_open.assert_has_calls(
+            [mock.call('/the/path/v2/lb1/listener1.crt-list', 'r'),
+             mock.call('/the/path/v2/lb1/listener1/a.pem', 'r'),
+             mock.call('/the/path/v2/lb1/listener1/b.pem', 'r')],
+            any_order=True)
+        self.assertEqual(6, m_open.call_count)
+
+    def test_update_sni_container_removed_with_crt_list(self):
+        self.driver.state_path = self.useFixture(fixtures.TempDir()).path
+        lb_dir = os.path.join(self.driver.state_path, self.lb.id)
+        os.makedirs(lb_dir)
+        listener = data_models.Listener(id='listener1')
+        cert_paths = [os.path.join(lb_dir, 'listener1', name)
+                      for name in ('a.pem', 'b.pem')]
+
+        def render_config(loadbalancer):
+            # the configuration only refers to the crt-list by its path
+            jinja_cfg._store_listener_crt_list(lb_dir, listener, cert_paths)
+            return 'config'
+
+        self.driver._render_config = mock.Mock(side_effect=render_config)
+        self.driver._spawn = mock.Mock()
+        render_config(self.lb)
+        with open(os.path.join(lb_dir, 'haproxy.conf'), 'w') as conf_file:
+            conf_file.write('config')
+        with open(os.path.join(lb_dir, 'haproxy.pid'), 'w') as pid_file:
+            pid_file.write('123\n')
+
+        self.driver.update(self.lb)
+        self.assertFalse(self.driver._spawn.called)
+
+        # one SNI container is removed, its PEM file is left behind
+        cert_paths.pop()
+        self.driver.update(self.lb)
+        self.driver._spawn.assert_called_once_with(
+            self.lb, ['-sf', '123'], config_str='config')
 
     @mock.patch('socket.socket')
     @mock.patch('os.path.exists')
@@ -408,20 +520,22 @@ class TestHaproxyNSDriver(base.BaseTestCase):
         self.vif_driver.unplug.assert_called_once_with(interface_name,
                                                        namespace='ns1')
 
+    @mock.patch('neutron.agent.linux.utils.replace_file')
     @mock.patch('neutron.agent.linux.utils.ensure_dir')
     @mock.patch('neutron_lbaas.services.loadbalancer.drivers.haproxy.'
-                'jinja_cfg.save_config')
+                'jinja_cfg.render_loadbalancer_obj')
     @mock.patch('neutron.agent.linux.ip_lib.IPWrapper')
-    def test_spawn(self, ip_wrap, jinja_save, ensure_dir):
+    def test_spawn(self, ip_wrap, jinja_render, ensure_dir, replace_file):
         mock_ns = ip_wrap.return_value
         self.driver._spawn(self.lb)
         conf_dir = self.driver.state_path + '/' + self.lb.id + '/%s'
-        jinja_save.assert_called_once_with(
-            conf_dir % 'haproxy.conf',
+        jinja_render.assert_called_once_with(
             self.lb,
-            conf_dir % 'haproxy_stats.sock',
             'test_group',
+            conf_dir % 'haproxy_stats.sock',
             conf_dir % '')
+        replace_file.assert_called_once_with(conf_dir % 'haproxy.conf',
+                                             jinja_render.return_value)
         ip_wrap.assert_called_once_with(
             namespace=namespace_driver.get_ns_name(self.lb.id))
         mock_ns.netns.execute.assert_called_once_with(
@@ -431,6 +545,19 @@ class TestHaproxyNSDriver(base.BaseTestCase):
         self.assertEqual(self.lb,
                          self.driver.deployed_loadbalancers[self.lb.id])
 
+    @mock.patch('neutron.agent.linux.utils.replace_file')
+    @mock.patch('neutron.agent.linux.utils.ensure_dir')
+    @mock.patch('neutron_lbaas.services.loadbalancer.drivers.haproxy.'
+                'jinja_cfg.render_loadbalancer_obj')
+    @mock.patch('neutron.agent.linux.ip_lib.IPWrapper')
+    def test_spawn_rendered(self, ip_wrap, jinja_render, ensure_dir,
+                            replace_file):
+        self.driver._spawn(self.lb, config_str='config')
+        conf_dir = self.driver.state_path + '/' + self.lb.id + '/%s'
+        self.assertFalse(jinja_render.called)
+        replace_file.assert_called_once_with(conf_dir % 'haproxy.conf',
+                                             'config')
+
 
 class BaseTestManager(base.BaseTestCase):
 
@@ -418,13 +418,12 @@ class TestHaproxyNSDriver(base.BaseTestCase):
         self.driver.member.model_class = models.MemberV2
         member_stats = {members[0].id: {'status': constants.ACTIVE},
                         members[1].id: {'status': constants.ERROR}}
-        with mock.patch.object(self.driver.plugin.db, 'update_status') as us:
+        with mock.patch.object(self.driver.plugin.db,
+                               'update_members_operating_status') as umos:
             self.driver._set_member_status(self.context_mock, lb, member_stats)
-            call1 = mock.call(self.context_mock, models.MemberV2,
-                              members[0].id, operating_status=lb_const.ONLINE)
-            call2 = mock.call(self.context_mock, models.MemberV2,
-                              members[1].id, operating_status=lb_const.OFFLINE)
-            us.assert_has_calls([call1, call2])
+            umos.assert_called_once_with(
+                self.context_mock, {members[0].id: lb_const.ONLINE,
+                                    members[1].id: lb_const.OFFLINE})
 
     def test_remove_config_directory(self):
         with contextlib.nested(
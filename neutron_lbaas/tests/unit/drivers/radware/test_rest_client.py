@@ -0,0 +1,108 @@
+# Copyright 2015, Radware LTD. All rights reserved
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import httplib
+import socket
+
+import mock
+
+from neutron_lbaas.drivers.radware import rest_client as rest
+from neutron_lbaas.tests import base
+
+
+class TestVDirectRESTClient(base.BaseTestCase):
+
+    def setUp(self):
+        super(TestVDirectRESTClient, self).setUp()
+        connection_patcher = mock.patch.object(rest.httplib,
+                                               'HTTPSConnection')
+        self.connection = connection_patcher.start()
+        self.connection.side_effect = self._new_connection
+        self.addCleanup(connection_patcher.stop)
+        self.connections = []
+        self.client = rest.vDirectRESTClient(server='vdirect1',
+                                             secondary_server='vdirect2',
+                                             user='vDirect',
+                                             password='radware',
+                                             pool_size=1)
+
+    def _new_connection(self, server, port, timeout=None):
+        conn = mock.Mock()
+        response = conn.getresponse.return_value
+        response.status = 200
+        response.reason = 'OK'
+        response.read.return_value = '{"complete": true}'
+        response.will_close = False
+        self.connections.append(conn)
+        return conn
+
+    def _call(self):
+        return self.client.call('GET', '/api/workflow/', None, None)
+
+    def test_connection_kept_alive(self):
+        self.assertEqual((200, 'OK', '{"complete": true}',
+                          {'complete': True}), self._call())
+        self._call()
+        self.connection.assert_called_once_with('vdirect1', 2189,
+                                                timeout=5000)
+        conn = self.connections[0]
+        self.assertEqual(2, conn.request.call_count)
+        self.assertFalse(conn.close.called)
+
+    def test_idle_connections_bounded(self):
+        conn1, reused = self.client._get_connection('vdirect1')
+        conn2, reused = self.client._get_connection('vdirect1')
+        self.client._release_connection('vdirect1', conn1)
+        self.client._release_connection('vdirect1', conn2)
+        self.assertFalse(conn1.close.called)
+        conn2.close.assert_called_once_with()
+
+        self.client.close()
+        conn1.close.assert_called_once_with()
+
+    def test_connection_closed_by_server_not_kept(self):
+        self._call()
+        conn = self.connections[0]
+        conn.getresponse.return_value.will_close = True
+        self._call()
+        conn.close.assert_called_once_with()
+        self._call()
+        self.assertEqual(2, len(self.connections))
+
+    def test_stale_connection_retried(self):
+        self._call()
+        self.connections[0].request.side_effect = socket.error
+        self.assertEqual(200, self._call()[rest.RESP_STATUS])
+        self.connections[0].close.assert_called_once_with()
+        self.assertEqual(2, len(self.connections))
+        self.connections[1].request.assert_called_once_with(
+            'GET', '/api/workflow/', 'null', mock.ANY)
+
+    def test_new_connection_failure_not_retried(self):
+        self.connection.side_effect = None
+        conn = self.connection.return_value
+        conn.getresponse.side_effect = httplib.BadStatusLine('')
+        with mock.patch.object(self.client, '_recover') as recover:
+            recover.return_value = (-1, None, None, None)
+            self.assertEqual(-1, self._call()[rest.RESP_STATUS])
+        self.assertEqual(1, conn.request.call_count)
+        conn.close.assert_called_once_with()
+
+    def test_timeout_not_retried(self):
+        self._call()
+        self.connections[0].getresponse.side_effect = socket.timeout
+        with mock.patch.object(self.client, '_recover') as recover:
+            recover.return_value = (-1, None, None, None)
+            self.assertEqual(-1, self._call()[rest.RESP_STATUS])
+        self.assertEqual(1, len(self.connections))
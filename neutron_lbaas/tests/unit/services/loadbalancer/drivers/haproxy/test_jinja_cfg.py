@@ -14,11 +14,16 @@
 #    under the License.
 
 import contextlib
+import os
+
+import fixtures
 import mock
 
 from neutron.tests import base
+from oslo_config import cfg
 
 from neutron_lbaas.common.cert_manager import cert_manager
+from neutron_lbaas.common.tls_utils import cert_cache
 from neutron_lbaas.common.tls_utils import cert_parser
 from neutron_lbaas.services.loadbalancer import data_models
 from neutron_lbaas.services.loadbalancer.drivers.haproxy import jinja_cfg
@@ -49,6 +54,38 @@ class TestHaproxyCfg(base.BaseTestCase):
         template = jinja_cfg._get_template()
         self.assertEqual('haproxy.loadbalancer.j2', template.name)
 
+    def test_get_template_compiled_once(self):
+        with contextlib.nested(
+            mock.patch.object(jinja_cfg, 'JINJA_ENV', None),
+            mock.patch.object(jinja_cfg, 'JINJA_TEMPLATE', None),
+            mock.patch('jinja2.Environment')
+        ) as (env, template, environment):
+            first = jinja_cfg._get_template()
+            second = jinja_cfg._get_template()
+            self.assertIs(first, second)
+            self.assertEqual(1, environment.call_count)
+            environment.return_value.get_template.assert_called_once_with(
+                'haproxy.loadbalancer.j2')
+            kwargs = environment.call_args[1]
+            self.assertFalse(kwargs['auto_reload'])
+            self.assertIsNone(kwargs['bytecode_cache'])
+
+    def test_get_template_bytecode_cache(self):
+        cfg.CONF.set_override('jinja_bytecode_cache_dir', '/fake/cache',
+                              group='haproxy')
+        with contextlib.nested(
+            mock.patch.object(jinja_cfg, 'JINJA_ENV', None),
+            mock.patch.object(jinja_cfg, 'JINJA_TEMPLATE', None),
+            mock.patch('jinja2.Environment'),
+            mock.patch('jinja2.FileSystemBytecodeCache'),
+            mock.patch('neutron.agent.linux.utils.ensure_dir')
+        ) as (env, template, environment, bytecode_cache, ensure_dir):
+            jinja_cfg._get_template()
+            ensure_dir.assert_called_once_with('/fake/cache')
+            bytecode_cache.assert_called_once_with('/fake/cache')
+            self.assertEqual(bytecode_cache.return_value,
+                             environment.call_args[1]['bytecode_cache'])
+
     def test_render_template_tls_termination(self):
         lb = sample_configs.sample_loadbalancer_tuple(
             proto='TERMINATED_HTTPS', tls=True, sni=True)
@@ -139,6 +176,41 @@ class TestHaproxyCfg(base.BaseTestCase):
                                     frontend=fe, backend=be),
                                 rendered_obj)
 
+    def test_render_template_tls_termination_crt_list(self):
+        cfg.CONF.set_override('use_crt_list', True, group='haproxy')
+        lb = sample_configs.sample_loadbalancer_tuple(
+            proto='TERMINATED_HTTPS', tls=True, sni=True)
+        listener = lb.listeners[0]
+
+        fe = ("frontend sample_listener_id_1\n"
+              "    option tcplog\n"
+              "    maxconn 98\n"
+              "    option forwardfor\n"
+              "    bind 10.0.0.2:443"
+              " ssl crt /v2/sample_listener_id_1/fakeCNM.pem"
+              " crt-list /v2/sample_listener_id_1.crt-list\n"
+              "    mode http\n"
+              "    default_backend sample_pool_id_1\n\n")
+        with contextlib.nested(
+            mock.patch('os.makedirs'),
+            mock.patch.object(jinja_cfg, 'utils'),
+            mock.patch.object(jinja_cfg, '_process_tls_certificates')
+        ) as (makedirs, utils, crt):
+            crt.return_value = {
+                'tls_cert': listener.default_tls_container,
+                'sni_certs': [sni.tls_container
+                              for sni in listener.sni_containers]}
+            rendered_obj = jinja_cfg.render_loadbalancer_obj(
+                lb, 'nogroup', '/sock_path', '/v2')
+            self.assertEqual(fe, rendered_obj[rendered_obj.index(
+                'frontend'):rendered_obj.index('backend')])
+            sni_paths = ['/v2/sample_listener_id_1/%s.pem' %
+                         sni.tls_container.primary_cn
+                         for sni in listener.sni_containers]
+            utils.replace_file.assert_called_with(
+                '/v2/sample_listener_id_1.crt-list',
+                ''.join(path + '\n' for path in sni_paths))
+
     def test_render_template_http(self):
         be = ("backend sample_pool_id_1\n"
               "    mode http\n"
@@ -325,6 +397,23 @@ class TestHaproxyCfg(base.BaseTestCase):
                         '/v2/loadbalancers/sample_listener_id_1/fakeCNM.pem',
                         ret)
 
+    def test_replace_file_if_changed(self):
+        file_name = os.path.join(self.useFixture(fixtures.TempDir()).path,
+                                 'cert.pem')
+        with mock.patch.object(jinja_cfg.utils, 'replace_file') as replace:
+            self.assertTrue(
+                jinja_cfg._replace_file_if_changed(file_name, 'imapem'))
+            replace.assert_called_once_with(file_name, 'imapem')
+            with open(file_name, 'w') as f:
+                f.write('imapem')
+            replace.reset_mock()
+            self.assertFalse(
+                jinja_cfg._replace_file_if_changed(file_name, 'imapem'))
+            self.assertFalse(replace.called)
+            self.assertTrue(
+                jinja_cfg._replace_file_if_changed(file_name, 'imapem2'))
+            replace.assert_called_once_with(file_name, 'imapem2')
+
     def test_process_tls_certificates(self):
         sl = sample_configs.sample_listener_tuple(tls=True, sni=True)
         tls = data_models.TLSContainer(primary_cn='fakeCN',
@@ -336,13 +425,16 @@ class TestHaproxyCfg(base.BaseTestCase):
         cert.get_private_key.return_value = tls.private_key
         cert.get_certificate.return_value = tls.certificate
         cert.get_intermediates.return_value = tls.intermediates
+        cert.get_private_key_passphrase.return_value = None
 
         with contextlib.nested(
             mock.patch.object(jinja_cfg, '_map_cert_tls_container'),
             mock.patch.object(jinja_cfg, '_store_listener_crt'),
             mock.patch.object(cert_parser, 'get_host_names'),
-            mock.patch.object(jinja_cfg, 'CERT_MANAGER_PLUGIN')
-        ) as (map, store_cert, get_host_names, cert_mgr):
+            mock.patch.object(jinja_cfg, 'CERT_MANAGER_PLUGIN'),
+            mock.patch.object(jinja_cfg, 'TLS_CACHE',
+                              cert_cache.TLSMaterialCache())
+        ) as (map, store_cert, get_host_names, cert_mgr, tls_cache):
             map.return_value = tls
             cert_mgr_mock = mock.Mock(spec=cert_manager.CertManager)
             cert_mgr_mock.get_cert.return_value = cert
@@ -369,6 +461,60 @@ class TestHaproxyCfg(base.BaseTestCase):
                                   tls)]
             store_cert.call_args_list == calls_ac
 
+    def test_process_tls_certificates_cached(self):
+        sl = sample_configs.sample_listener_tuple(tls=True, sni=True)
+        cert = mock.Mock(spec=cert_manager.Cert)
+        cert.get_certificate.return_value = 'imaCert'
+        cert.get_intermediates.return_value = ['imainter1']
+        cert.get_private_key.return_value = 'imaPrivateKey'
+        cert.get_private_key_passphrase.return_value = None
+        tls = data_models.TLSContainer(primary_cn='fakeCN')
+
+        with contextlib.nested(
+            mock.patch.object(jinja_cfg, '_map_cert_tls_container'),
+            mock.patch.object(jinja_cfg, 'CERT_MANAGER_PLUGIN'),
+            mock.patch.object(jinja_cfg, 'TLS_CACHE',
+                              cert_cache.TLSMaterialCache(size=10, ttl=60))
+        ) as (map, cert_mgr, tls_cache):
+            map.return_value = tls
+            cert_mgr.CertManager.return_value.get_cert.return_value = cert
+            first = jinja_cfg._process_tls_certificates(sl)
+            second = jinja_cfg._process_tls_certificates(sl)
+
+            get_cert = cert_mgr.CertManager.return_value.get_cert
+            self.assertEqual(
+                [mock.call('cont_id_1', check_only=True),
+                 mock.call('cont_id_2', check_only=True),
+                 mock.call('cont_id_3', check_only=True)],
+                get_cert.call_args_list)
+            self.assertEqual(3, map.call_count)
+            self.assertEqual(first, second)
+            self.assertIs(tls, second['tls_cert'])
+
+    def test_process_tls_certificates_concurrently(self):
+        cfg.CONF.set_override('tls_workers', 2, group='haproxy')
+        sl = sample_configs.sample_listener_tuple(tls=True, sni=True)
+        tls_containers = {
+            'cont_id_1': data_models.TLSContainer(primary_cn='fakeCN1'),
+            'cont_id_2': data_models.TLSContainer(primary_cn='fakeCN2'),
+            'cont_id_3': data_models.TLSContainer(primary_cn='fakeCN3')}
+
+        with contextlib.nested(
+            mock.patch('eventlet.GreenPool'),
+            mock.patch.object(jinja_cfg, 'CERT_MANAGER_PLUGIN'),
+            mock.patch.object(jinja_cfg, 'TLS_CACHE')
+        ) as (green_pool, cert_mgr, tls_cache):
+            green_pool.return_value.imap.side_effect = map
+            tls_cache.get.side_effect = (
+                lambda cert_ref, fetch, parse: tls_containers[cert_ref])
+            ret = jinja_cfg._process_tls_certificates(sl)
+
+            green_pool.assert_called_once_with(2)
+            self.assertIs(tls_containers['cont_id_1'], ret['tls_cert'])
+            self.assertEqual([tls_containers['cont_id_2'],
+                              tls_containers['cont_id_3']],
+                             ret['sni_certs'])
+
     def test_get_primary_cn(self):
         cert = mock.MagicMock()
 
@@ -390,8 +536,11 @@ class TestHaproxyCfg(base.BaseTestCase):
         cert.get_private_key_passphrase.return_value = 'passphrase'
         with mock.patch.object(cert_parser, 'get_host_names') as cp:
             with mock.patch.object(cert_parser, 'dump_private_key') as dp:
-                cp.return_value = {'cn': 'fakeCN'}
+                cp.return_value = {'cn': 'fakeCN', 'dns_names': ['fakeDNS']}
                 dp.return_value = 'imaPrivateKey'
+                self.assertEqual(['fakeDNS'],
+                                 jinja_cfg._map_cert_tls_container(
+                                     cert).dns_names)
                 self.assertEqual(tls.primary_cn,
                                  jinja_cfg._map_cert_tls_container(
                                      cert).primary_cn)
@@ -0,0 +1,83 @@
+# Copyright 2015 OpenStack Foundation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import copy
+
+from neutron_lbaas.services.loadbalancer import data_models
+from neutron_lbaas.tests import base
+
+
+class TestDataModels(base.BaseTestCase):
+
+    def _build_graph(self):
+        member = data_models.Member(id='member1', address='10.0.0.1',
+                                    protocol_port=80)
+        pool = data_models.Pool(id='pool1', members=[member])
+        listener = data_models.Listener(id='listener1', default_pool=pool)
+        return data_models.LoadBalancer(id='lb1', listeners=[listener])
+
+    def test_no_instance_dict(self):
+        for data_class in (data_models.LoadBalancer, data_models.Listener,
+                           data_models.Pool, data_models.Member,
+                           data_models.HealthMonitor, data_models.SNI,
+                           data_models.IPAllocation, data_models.Port):
+            self.assertFalse(hasattr(data_class(), '__dict__'))
+            self.assertRaises(AttributeError, setattr, data_class(),
+                              'unknown', None)
+
+    def test_to_dict_from_dict(self):
+        lb_dict = self._build_graph().to_dict()
+        self.assertEqual(sorted(data_models.LoadBalancer.fields),
+                         sorted(lb_dict))
+        member_dict = lb_dict['listeners'][0]['default_pool']['members'][0]
+        self.assertEqual('10.0.0.1', member_dict['address'])
+
+        lb = data_models.LoadBalancer.from_dict(copy.deepcopy(lb_dict))
+        self.assertEqual(lb_dict, lb.to_dict())
+        member = lb.listeners[0].default_pool.members[0]
+        self.assertEqual('member1', member.id)
+
+    def test_to_dict_skips_unset_attributes(self):
+        fixed_ip = data_models.IPAllocation(port_id='port1')
+        self.assertNotIn('subnet', fixed_ip.to_dict())
+        fixed_ip = data_models.IPAllocation.from_dict(
+            {'port_id': 'port1', 'subnet': {'id': 'subnet1'}})
+        self.assertEqual('subnet1', fixed_ip.to_dict()['subnet']['id'])
+
+    def test_root_loadbalancer(self):
+        lb = data_models.LoadBalancer(id='lb1')
+        listener = data_models.Listener(id='listener1', loadbalancer=lb)
+        pool = data_models.Pool(id='pool1', listener=listener)
+        member = data_models.Member(id='member1', pool=pool)
+        self.assertIs(lb, member.root_loadbalancer)
+        self.assertIs(lb, pool.root_loadbalancer)
+        self.assertIs(lb, lb.root_loadbalancer)
+
+    def test_to_dict_excludes_top_level_attributes_only(self):
+        lb = self._build_graph()
+        lb.listeners[0].loadbalancer_id = 'lb1'
+        lb_dict = lb.to_dict(id=False, loadbalancer_id=False)
+        self.assertNotIn('id', lb_dict)
+        listener_dict = lb_dict['listeners'][0]
+        self.assertEqual('listener1', listener_dict['id'])
+        self.assertEqual('lb1', listener_dict['loadbalancer_id'])
+
+    def test_to_dict_large_graph(self):
+        members = [data_models.Member(id='member%d' % i)
+                   for i in range(5000)]
+        pool = data_models.Pool(id='pool1', members=members)
+        pool_dict = pool.to_dict()
+        self.assertEqual(['member%d' % i for i in range(5000)],
+                         [member['id'] for member in pool_dict['members']])
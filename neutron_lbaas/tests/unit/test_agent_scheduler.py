@@ -33,6 +33,8 @@ from oslo_config import cfg
 from oslo_utils import timeutils
 from webob import exc
 
+from neutron_lbaas import agent_scheduler
+from neutron_lbaas.db.loadbalancer import loadbalancer_dbv2
 from neutron_lbaas.drivers.haproxy import plugin_driver
 from neutron_lbaas.extensions import lbaas_agentschedulerv2
 from neutron_lbaas.services.loadbalancer import constants as lb_const
@@ -153,6 +155,138 @@ class LBaaSAgentSchedulerTestCase(test_agent.AgentDBTestMixIn,
                 self.adminContext, loadbalancer['loadbalancer']['id']
             )
 
+    def test_least_loaded_scheduler(self):
+        self._register_agent_states(lbaas_agents=True)
+        db = self.lbaas_plugin.db
+        agents = db.get_lbaas_agents(self.adminContext)
+        agent_ids = [lbaas_agent['id'] for lbaas_agent in agents]
+        with self.subnet() as subnet:
+            with self.loadbalancer(subnet=subnet, no_delete=True) as lb:
+                lb_id = lb['loadbalancer']['id']
+                db.update_loadbalancer_provisioning_status(self.adminContext,
+                                                           lb_id)
+                with self.listener(loadbalancer_id=lb_id,
+                                   no_delete=True) as listener:
+                    db.update_loadbalancer_provisioning_status(
+                        self.adminContext, lb_id)
+                    with self.pool(listener_id=listener['listener']['id'],
+                                   no_delete=True) as pool:
+                        db.update_loadbalancer_provisioning_status(
+                            self.adminContext, lb_id)
+                        with self.member(pool_id=pool['pool']['id'],
+                                         subnet=subnet, no_delete=True):
+                            hosting_id = (
+                                self._get_lbaas_agent_hosting_loadbalancer(
+                                    lb_id)['agent']['id'])
+                            expected = dict.fromkeys(agent_ids, (0, 0))
+                            expected[hosting_id] = (1, 1)
+                            self.assertEqual(
+                                expected, db.get_lbaas_agent_loads(
+                                    self.adminContext, agent_ids))
+
+                            scheduler = agent_scheduler.LeastLoadedScheduler()
+                            chosen_agent = scheduler._choose_agent(
+                                self.lbaas_plugin, self.adminContext, agents)
+                            self.assertNotEqual(hosting_id,
+                                                chosen_agent['id'])
+
+    def test_active_lbaas_agent_candidates_index(self):
+        self._register_agent_states(lbaas_agents=True)
+        db = self.lbaas_plugin.db
+        device_driver = plugin_driver.HaproxyOnHostPluginDriver.device_driver
+        candidates = db.get_active_lbaas_agent_candidates(self.adminContext,
+                                                          device_driver)
+        self.assertEqual(
+            set([test_agent.LBAAS_HOSTA, test_agent.LBAAS_HOSTB]),
+            set(lbaas_agent['host'] for lbaas_agent in candidates))
+        self.assertEqual([], db.get_active_lbaas_agent_candidates(
+            self.adminContext, 'other_driver'))
+
+        with mock.patch.object(db, 'get_configuration_dict') as conf_mock:
+            # unchanged heartbeats keep the index
+            callback = agents_db.AgentExtRpcCallback(db)
+            lbaas_hosta = {
+                'binary': 'neutron-loadbalancer-agent',
+                'host': test_agent.LBAAS_HOSTA,
+                'topic': 'LOADBALANCER_AGENT',
+                'configurations': {'device_drivers': [device_driver]},
+                'agent_type': lb_const.AGENT_TYPE_LOADBALANCERV2}
+            callback.report_state(self.adminContext,
+                                  agent_state={'agent_state': lbaas_hosta},
+                                  time=timeutils.strtime())
+            db.get_active_lbaas_agent_candidates(self.adminContext,
+                                                 device_driver)
+            self.assertFalse(conf_mock.called)
+
+        lbaas_hosta['configurations'] = {'device_drivers': ['other_driver']}
+        callback.report_state(self.adminContext,
+                              agent_state={'agent_state': lbaas_hosta},
+                              time=timeutils.strtime())
+        candidates = db.get_active_lbaas_agent_candidates(self.adminContext,
+                                                          'other_driver')
+        self.assertEqual([test_agent.LBAAS_HOSTA],
+                         [lbaas_agent['host'] for lbaas_agent in candidates])
+
+    def test_active_lbaas_agent_candidates_after_agent_registered(self):
+        device_driver = plugin_driver.HaproxyOnHostPluginDriver.device_driver
+        # e.g. an API worker, which never handles the agents' report_state
+        api_db = loadbalancer_dbv2.LoadBalancerPluginDbv2()
+        self.assertEqual([], api_db.get_active_lbaas_agent_candidates(
+            self.adminContext, device_driver))
+
+        self._register_agent_states(lbaas_agents=True)
+        candidates = api_db.get_active_lbaas_agent_candidates(
+            self.adminContext, device_driver)
+        self.assertEqual(
+            set([test_agent.LBAAS_HOSTA, test_agent.LBAAS_HOSTB]),
+            set(lbaas_agent['host'] for lbaas_agent in candidates))
+
+    def test_active_lbaas_agent_candidates_index_drops_deleted_agents(self):
+        self._register_agent_states(lbaas_agents=True)
+        db = self.lbaas_plugin.db
+        device_driver = plugin_driver.HaproxyOnHostPluginDriver.device_driver
+        lbaas_agents = db.get_lbaas_agents(self.adminContext)
+        db.get_active_lbaas_agent_candidates(self.adminContext,
+                                             device_driver)
+        self.assertEqual(set(lbaas_agent.id for lbaas_agent in lbaas_agents),
+                         set(db._device_drivers_cache))
+        # the index is held by the plugin, not shared by its class
+        self.assertIsNone(
+            agent_scheduler.LbaasAgentSchedulerDbMixin._device_drivers_cache)
+
+        db.delete_agent(self.adminContext, lbaas_agents[0].id)
+        db._candidate_hosts = None
+        candidates = db.get_active_lbaas_agent_candidates(self.adminContext,
+                                                          device_driver)
+        self.assertEqual([lbaas_agents[1].host],
+                         [lbaas_agent['host'] for lbaas_agent in candidates])
+        self.assertEqual([lbaas_agents[1].id], list(db._device_drivers_cache))
+
+    def test_rebind_loadbalancer(self):
+        self._register_agent_states(lbaas_agents=True)
+        db = self.lbaas_plugin.db
+        with self.loadbalancer() as loadbalancer:
+            lb_id = loadbalancer['loadbalancer']['id']
+            hosting_id = self._get_lbaas_agent_hosting_loadbalancer(
+                lb_id)['agent']['id']
+            self.assertEqual({lb_id: 0},
+                             db.get_loadbalancer_loads_on_lbaas_agent(
+                                 self.adminContext, hosting_id))
+            other_id = [lbaas_agent['id'] for lbaas_agent in
+                        db.get_lbaas_agents(self.adminContext)
+                        if lbaas_agent['id'] != hosting_id][0]
+            self.assertTrue(db.rebind_loadbalancer(
+                self.adminContext, lb_id, hosting_id, other_id))
+            # the binding does not point to hosting_id anymore
+            self.assertFalse(db.rebind_loadbalancer(
+                self.adminContext, lb_id, hosting_id, other_id))
+            self.assertEqual(
+                other_id,
+                self._get_lbaas_agent_hosting_loadbalancer(
+                    lb_id)['agent']['id'])
+            db.update_loadbalancer_provisioning_status(self.adminContext,
+                                                       lb_id)
+
     def test_schedule_loadbalancer_with_disabled_agent(self):
         lbaas_hosta = {
             'binary': 'neutron-loadbalancer-agent',
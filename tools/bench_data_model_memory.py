@@ -0,0 +1,165 @@
+#    Copyright 2015 OpenStack Foundation
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Report the memory taken by the data model graphs of a large fleet.
+
+Builds the graphs of a synthetic fleet of load balancers, each with one
+listener per pool, a health monitor per pool and the requested number of
+members, the way an agent holds them, and reports how much the RSS of the
+process grew and how long converting the fleet with to_dict takes. This is
+done in a fresh process for the data models with __slots__ and for copies
+of them keeping their attributes in a __dict__, as they used to.
+
+Usage: python tools/bench_data_model_memory.py [--loadbalancers N]
+           [--pools N] [--members N]
+"""
+
+from __future__ import print_function
+
+import argparse
+import subprocess
+import sys
+import time
+
+import six
+
+import neutron_lbaas  # noqa
+from neutron_lbaas.services.loadbalancer import data_models
+
+CLASSES = ('LoadBalancer', 'Listener', 'Pool', 'Member', 'HealthMonitor')
+
+
+def get_rss():
+    """Returns the resident set size of the process in bytes."""
+    with open('/proc/self/status') as status:
+        for line in status:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) * 1024
+
+
+class LegacyDataModel(object):
+
+    def to_dict(self, **kwargs):
+        """The to_dict of the data models keeping a __dict__."""
+        ret = {}
+        for attr in self.__dict__:
+            if attr.startswith('_') or not kwargs.get(attr, True):
+                continue
+            if isinstance(getattr(self, attr), list):
+                ret[attr] = []
+                for item in self.__dict__[attr]:
+                    if isinstance(item, LegacyDataModel):
+                        ret[attr].append(item.to_dict())
+                    else:
+                        ret[attr] = item
+            elif isinstance(getattr(self, attr), LegacyDataModel):
+                ret[attr] = self.__dict__[attr].to_dict()
+            elif isinstance(self.__dict__[attr], six.text_type):
+                ret[attr.encode('utf8')] = self.__dict__[attr].encode('utf8')
+            else:
+                ret[attr] = self.__dict__[attr]
+        return ret
+
+
+def get_classes(variant):
+    if variant == 'compact':
+        return dict((name, getattr(data_models, name)) for name in CLASSES)
+    # the same classes, but without __slots__ and so with a __dict__
+    return dict((name, type(name, (LegacyDataModel,), {
+        '__init__': getattr(data_models, name).__dict__['__init__']}))
+        for name in CLASSES)
+
+
+def build_fleet(classes, loadbalancer_count, pool_count, member_count):
+    fleet = []
+    for i in range(loadbalancer_count):
+        lb_id = 'lb-%08d-0000-0000-0000-000000000000' % i
+        listeners = []
+        for j in range(pool_count):
+            pool_id = 'pool-%08d-%04d-0000-0000-000000000000' % (i, j)
+            members = [classes['Member'](
+                id='member-%08d-%04d-%04d-0000-000000000000' % (i, j, k),
+                tenant_id='tenant', pool_id=pool_id,
+                address='10.%d.%d.%d' % (i & 255, k >> 8 & 255, k & 255),
+                protocol_port=80, weight=1, admin_state_up=True,
+                subnet_id='subnet', operating_status='ONLINE',
+                provisioning_status='ACTIVE')
+                for k in range(member_count // pool_count)]
+            healthmonitor = classes['HealthMonitor'](
+                id='hm-%08d-%04d-0000-0000-000000000000' % (i, j),
+                tenant_id='tenant', type='HTTP', delay=5, timeout=5,
+                max_retries=3, http_method='GET', url_path='/',
+                expected_codes='200', provisioning_status='ACTIVE',
+                admin_state_up=True)
+            pool = classes['Pool'](
+                id=pool_id, tenant_id='tenant', protocol='HTTP',
+                lb_algorithm='ROUND_ROBIN', admin_state_up=True,
+                operating_status='ONLINE', provisioning_status='ACTIVE',
+                members=members, healthmonitor=healthmonitor)
+            listeners.append(classes['Listener'](
+                id='listener-%08d-%04d-0000-0000-000000000000' % (i, j),
+                tenant_id='tenant', default_pool_id=pool_id,
+                loadbalancer_id=lb_id, protocol='HTTP', protocol_port=80 + j,
+                admin_state_up=True, operating_status='ONLINE',
+                provisioning_status='ACTIVE', default_pool=pool))
+        fleet.append(classes['LoadBalancer'](
+            id=lb_id, tenant_id='tenant', vip_subnet_id='subnet',
+            vip_address='10.0.0.%d' % (i & 255), admin_state_up=True,
+            operating_status='ONLINE', provisioning_status='ACTIVE',
+            listeners=listeners))
+    return fleet
+
+
+def measure(args):
+    classes = get_classes(args.variant)
+    before = get_rss()
+    fleet = build_fleet(classes, args.loadbalancers, args.pools,
+                        args.members)
+    after = get_rss()
+    start = time.time()
+    for loadbalancer in fleet:
+        loadbalancer.to_dict()
+    elapsed = time.time() - start
+    print('%-8s rss %8.1f MiB -> %8.1f MiB (+%7.1f MiB), '
+          'to_dict %8.2f ms' % (args.variant, before / 1048576.0,
+                                after / 1048576.0,
+                                (after - before) / 1048576.0,
+                                elapsed * 1000))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--loadbalancers', type=int, default=100)
+    parser.add_argument('--pools', type=int, default=4)
+    parser.add_argument('--members', type=int, default=400,
+                        help='members per load balancer')
+    parser.add_argument('--variant', choices=('legacy', 'compact'))
+    args = parser.parse_args()
+    if args.variant:
+        measure(args)
+        return
+
+    print('load balancers: %d, pools: %d, members: %d' % (
+        args.loadbalancers, args.pools, args.loadbalancers * args.members))
+    for variant in ('legacy', 'compact'):
+        # each variant gets a fresh process, freed memory is rarely given
+        # back to the system
+        sys.stdout.write(subprocess.check_output([
+            sys.executable, __file__, '--variant', variant,
+            '--loadbalancers', str(args.loadbalancers),
+            '--pools', str(args.pools), '--members', str(args.members)]))
+
+
+if __name__ == '__main__':
+    main()
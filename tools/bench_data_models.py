@@ -0,0 +1,156 @@
+#    Copyright 2015 OpenStack Foundation
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Benchmark building data models from SQLAlchemy models.
+
+Builds a synthetic load balancer in an in-memory sqlite database with one
+listener per pool and the requested number of members spread over the
+pools, loads its graph once, then compares converting it into data models
+with the per attribute introspection from_sqlalchemy_model used to do and
+with the converters compiled per class. Building the members from rows of
+a column query is measured as well.
+
+Usage: python tools/bench_data_models.py [--members N] [--pools N]
+           [--runs N]
+"""
+
+from __future__ import print_function
+
+import argparse
+import time
+
+from neutron.db import model_base
+import sqlalchemy as sa
+from sqlalchemy.ext import orderinglist
+from sqlalchemy import orm
+from sqlalchemy.orm import collections
+
+import neutron_lbaas  # noqa
+from neutron_lbaas.db.loadbalancer import models
+from neutron_lbaas.services.loadbalancer import data_models
+
+LB_ID = 'bench-lb'
+
+
+def build_graph(engine, member_count, pool_count):
+    def insert(model, rows):
+        engine.execute(model.__table__.insert(), rows)
+
+    common = {'tenant_id': 'bench', 'admin_state_up': True,
+              'provisioning_status': 'ACTIVE'}
+    insert(models.LoadBalancer, [dict(
+        common, id=LB_ID, vip_subnet_id='bench-subnet',
+        operating_status='ONLINE')])
+    insert(models.HealthMonitorV2, [dict(
+        common, id='bench-hm-%d' % i, type='HTTP', delay=5, timeout=5,
+        max_retries=3) for i in range(pool_count)])
+    insert(models.PoolV2, [dict(
+        common, id='bench-pool-%d' % i, protocol='HTTP',
+        lb_algorithm='ROUND_ROBIN', operating_status='ONLINE',
+        healthmonitor_id='bench-hm-%d' % i) for i in range(pool_count)])
+    insert(models.Listener, [dict(
+        common, id='bench-listener-%d' % i, protocol='HTTP',
+        protocol_port=80 + i, loadbalancer_id=LB_ID,
+        default_pool_id='bench-pool-%d' % i, operating_status='ONLINE')
+        for i in range(pool_count)])
+    insert(models.MemberV2, [dict(
+        common, id='bench-member-%d' % i,
+        pool_id='bench-pool-%d' % (i % pool_count),
+        address='10.%d.%d.%d' % (i >> 16 & 255, i >> 8 & 255, i & 255),
+        protocol_port=80, weight=1, operating_status='ONLINE')
+        for i in range(member_count)])
+
+
+def legacy_from_sqlalchemy_model(cls, sa_model, calling_class=None):
+    """The conversion BaseDataModel.from_sqlalchemy_model used to do."""
+    instance = cls()
+    # the attributes its __dict__ used to hold, the data models now keep
+    # them in __slots__
+    for attr_name in cls.fields:
+        if not hasattr(instance, attr_name):
+            continue
+        attr = getattr(sa_model, attr_name)
+        if isinstance(attr, model_base.BASEV2):
+            if hasattr(instance, attr_name):
+                data_class = data_models.SA_MODEL_TO_DATA_MODEL_MAP[
+                    attr.__class__]
+                if calling_class != data_class and data_class:
+                    setattr(instance, attr_name,
+                            legacy_from_sqlalchemy_model(
+                                data_class, attr, calling_class=cls))
+        elif (isinstance(attr, collections.InstrumentedList) or
+              isinstance(attr, orderinglist.OrderingList)):
+            for item in attr:
+                if hasattr(instance, attr_name):
+                    data_class = data_models.SA_MODEL_TO_DATA_MODEL_MAP[
+                        item.__class__]
+                    attr_list = getattr(instance, attr_name) or []
+                    attr_list.append(legacy_from_sqlalchemy_model(
+                        data_class, item, calling_class=cls))
+                    setattr(instance, attr_name, attr_list)
+        else:
+            setattr(instance, attr_name, attr)
+    return instance
+
+
+def measure(convert, runs):
+    """Returns the best and average times of converting the graph."""
+    elapsed = []
+    for _i in range(runs):
+        start = time.time()
+        convert()
+        elapsed.append(time.time() - start)
+    return min(elapsed), sum(elapsed) / len(elapsed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--members', type=int, default=5000)
+    parser.add_argument('--pools', type=int, default=4)
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    engine = sa.create_engine('sqlite://')
+    model_base.BASEV2.metadata.create_all(engine)
+    build_graph(engine, args.members, args.pools)
+    session = orm.sessionmaker(bind=engine)()
+    # everything is loaded up front so that only the conversion is timed
+    lb_db = session.query(models.LoadBalancer).options(
+        orm.subqueryload('listeners')).filter_by(id=LB_ID).one()
+    for listener_db in lb_db.listeners:
+        listener_db.default_pool.listener
+        listener_db.default_pool.healthmonitor.pool
+        for member_db in listener_db.default_pool.members:
+            member_db.pool
+    member_columns = [getattr(models.MemberV2, column.name)
+                      for column in models.MemberV2.__table__.columns]
+    member_rows = session.query(*member_columns).all()
+
+    print('members: %d, pools: %d, runs: %d' % (args.members, args.pools,
+                                                args.runs))
+    for name, convert in (
+            ('legacy graph', lambda: legacy_from_sqlalchemy_model(
+                data_models.LoadBalancer, lb_db)),
+            ('compiled graph', lambda: (
+                data_models.LoadBalancer.from_sqlalchemy_model(lb_db))),
+            ('member rows', lambda: [
+                data_models.Member.from_sqlalchemy_row(row)
+                for row in member_rows])):
+        best, average = measure(convert, args.runs)
+        print('%-15s min %8.2f ms, avg %8.2f ms' % (name, best * 1000,
+                                                     average * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+#    Copyright 2015 OpenStack Foundation
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Benchmark haproxy configuration rendering for large load balancers.
+
+Builds a load balancer with a single HTTP listener whose default pool has
+the requested number of members and renders it repeatedly through
+jinja_cfg.render_loadbalancer_obj, reporting the cost of the first render
+(template compilation included) and the per-render latency and allocations
+of the following ones.
+
+Usage: python tools/bench_haproxy_render.py [--members N] [--renders N]
+"""
+
+from __future__ import print_function
+
+import argparse
+import gc
+import time
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+import neutron_lbaas  # noqa
+from neutron_lbaas.services.loadbalancer import data_models
+from neutron_lbaas.services.loadbalancer.drivers.haproxy import jinja_cfg
+
+
+def build_loadbalancer(member_count):
+    monitor = data_models.HealthMonitor(
+        id='bench-monitor', type='HTTP', delay=5, timeout=5, max_retries=3,
+        http_method='GET', url_path='/', expected_codes='200-204',
+        admin_state_up=True)
+    members = [data_models.Member(
+        id='bench-member-%d' % i,
+        address='10.%d.%d.%d' % (i >> 16 & 255, i >> 8 & 255, i & 255),
+        protocol_port=80, weight=1, admin_state_up=True,
+        subnet_id='bench-subnet', provisioning_status='ACTIVE')
+        for i in range(member_count)]
+    pool = data_models.Pool(
+        id='bench-pool', protocol='HTTP', lb_algorithm='ROUND_ROBIN',
+        admin_state_up=True, provisioning_status='ACTIVE', members=members,
+        healthmonitor=monitor)
+    listener = data_models.Listener(
+        id='bench-listener', protocol='HTTP', protocol_port=80,
+        connection_limit=-1, admin_state_up=True, default_pool=pool)
+    return data_models.LoadBalancer(
+        id='bench-lb', name='bench-lb', vip_address='192.0.2.10',
+        listeners=[listener])
+
+
+def render(loadbalancer):
+    return jinja_cfg.render_loadbalancer_obj(
+        loadbalancer, 'nogroup', '/var/run/bench.sock', '/var/lib/bench')
+
+
+def measure(loadbalancer):
+    """Render once and return (seconds, allocated bytes, allocated objects).
+
+    Allocated bytes are only available when tracemalloc can be imported.
+    """
+    gc.collect()
+    objects_before = len(gc.get_objects())
+    if tracemalloc:
+        tracemalloc.start()
+    start = time.time()
+    render(loadbalancer)
+    elapsed = time.time() - start
+    allocated = None
+    if tracemalloc:
+        allocated = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return elapsed, allocated, len(gc.get_objects()) - objects_before
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--members', type=int, default=10000)
+    parser.add_argument('--renders', type=int, default=20)
+    args = parser.parse_args()
+
+    loadbalancer = build_loadbalancer(args.members)
+    first = measure(loadbalancer)
+    samples = sorted((measure(loadbalancer) for _i in range(args.renders)),
+                     key=lambda sample: sample[0])
+    latencies = [s[0] for s in samples]
+
+    print('members: %d, renders: %d' % (args.members, args.renders))
+    print('first render: %.2f ms' % (first[0] * 1000))
+    print('per render: min %.2f ms, avg %.2f ms, p95 %.2f ms, max %.2f ms' % (
+        latencies[0] * 1000,
+        sum(latencies) / len(latencies) * 1000,
+        latencies[int(len(latencies) * 0.95) - 1] * 1000,
+        latencies[-1] * 1000))
+    if tracemalloc:
+        print('peak allocated per render: %.1f KiB' % (
+            max(s[1] for s in samples) / 1024.0))
+    print('objects retained per render: %d' % max(s[2] for s in samples))
+
+
+if __name__ == '__main__':
+    main()
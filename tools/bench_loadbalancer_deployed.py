@@ -0,0 +1,158 @@
+#    Copyright 2015 OpenStack Foundation
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Benchmark the promotion of a deployed load balancer graph to ACTIVE.
+
+Builds a synthetic load balancer in an in-memory sqlite database with one
+listener per pool and the requested number of members spread over the
+pools, then compares walking the ORM graph in Python, as
+loadbalancer_deployed used to, with the set based
+LoadBalancerPluginDbv2.activate_loadbalancer_graph. Time and number of SQL
+statements are reported for both.
+
+Usage: python tools/bench_loadbalancer_deployed.py [--members N]
+           [--pools N] [--runs N]
+"""
+
+from __future__ import print_function
+
+import argparse
+import time
+
+from neutron.db import model_base
+from neutron.plugins.common import constants
+import sqlalchemy as sa
+from sqlalchemy import orm
+
+import neutron_lbaas  # noqa
+from neutron_lbaas.db.loadbalancer import loadbalancer_dbv2
+from neutron_lbaas.db.loadbalancer import models
+
+LB_ID = 'bench-lb'
+
+
+class Context(object):
+    def __init__(self, session):
+        self.session = session
+
+
+def build_graph(engine, member_count, pool_count):
+    def insert(model, rows):
+        engine.execute(model.__table__.insert(), rows)
+
+    common = {'tenant_id': 'bench', 'admin_state_up': True,
+              'provisioning_status': constants.PENDING_CREATE}
+    insert(models.LoadBalancer, [dict(
+        common, id=LB_ID, vip_subnet_id='bench-subnet',
+        operating_status='ONLINE')])
+    insert(models.HealthMonitorV2, [dict(
+        common, id='bench-hm-%d' % i, type='HTTP', delay=5, timeout=5,
+        max_retries=3) for i in range(pool_count)])
+    insert(models.PoolV2, [dict(
+        common, id='bench-pool-%d' % i, protocol='HTTP',
+        lb_algorithm='ROUND_ROBIN', operating_status='ONLINE',
+        healthmonitor_id='bench-hm-%d' % i) for i in range(pool_count)])
+    insert(models.Listener, [dict(
+        common, id='bench-listener-%d' % i, protocol='HTTP',
+        protocol_port=80 + i, loadbalancer_id=LB_ID,
+        default_pool_id='bench-pool-%d' % i, operating_status='ONLINE')
+        for i in range(pool_count)])
+    insert(models.MemberV2, [dict(
+        common, id='bench-member-%d' % i,
+        pool_id='bench-pool-%d' % (i % pool_count),
+        address='10.%d.%d.%d' % (i >> 16 & 255, i >> 8 & 255, i & 255),
+        protocol_port=80, weight=1, operating_status='ONLINE')
+        for i in range(member_count)])
+
+
+def reset_graph(engine):
+    for model in (models.LoadBalancer, models.Listener, models.PoolV2,
+                  models.MemberV2, models.HealthMonitorV2):
+        engine.execute(model.__table__.update().values(
+            provisioning_status=constants.PENDING_CREATE))
+
+
+def walk_graph(context, loadbalancer_id):
+    """The ORM graph walk loadbalancer_deployed used to do."""
+    with context.session.begin(subtransactions=True):
+        qry = context.session.query(models.LoadBalancer)
+        loadbalancer = qry.filter_by(id=loadbalancer_id).one()
+        if (loadbalancer.provisioning_status in
+                constants.ACTIVE_PENDING_STATUSES):
+            loadbalancer.provisioning_status = constants.ACTIVE
+        for l in loadbalancer.listeners:
+            if l.provisioning_status in constants.ACTIVE_PENDING_STATUSES:
+                l.provisioning_status = constants.ACTIVE
+            pool = l.default_pool
+            if (pool and pool.provisioning_status in
+                    constants.ACTIVE_PENDING_STATUSES):
+                pool.provisioning_status = constants.ACTIVE
+                for m in pool.members:
+                    if (m.provisioning_status in
+                            constants.ACTIVE_PENDING_STATUSES):
+                        m.provisioning_status = constants.ACTIVE
+                hm = pool.healthmonitor
+                if (hm and hm.provisioning_status in
+                        constants.ACTIVE_PENDING_STATUSES):
+                    hm.provisioning_status = constants.ACTIVE
+
+
+def measure(engine, session_maker, promote, runs):
+    """Returns the best and average times and the statements of a run."""
+    statements = []
+
+    def count_statement(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    sa.event.listen(engine, 'before_cursor_execute', count_statement)
+    elapsed = []
+    try:
+        for _i in range(runs):
+            reset_graph(engine)
+            del statements[:]
+            context = Context(session_maker())
+            start = time.time()
+            promote(context, LB_ID)
+            elapsed.append(time.time() - start)
+            context.session.close()
+    finally:
+        sa.event.remove(engine, 'before_cursor_execute', count_statement)
+    return min(elapsed), sum(elapsed) / len(elapsed), len(statements)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--members', type=int, default=5000)
+    parser.add_argument('--pools', type=int, default=4)
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    engine = sa.create_engine('sqlite://')
+    model_base.BASEV2.metadata.create_all(engine)
+    build_graph(engine, args.members, args.pools)
+    session_maker = orm.sessionmaker(bind=engine, autocommit=True)
+    db = loadbalancer_dbv2.LoadBalancerPluginDbv2()
+
+    print('members: %d, pools: %d, runs: %d' % (args.members, args.pools,
+                                                args.runs))
+    for name, promote in (('orm graph walk', walk_graph),
+                          ('set based', db.activate_loadbalancer_graph)):
+        best, average, count = measure(engine, session_maker, promote,
+                                       args.runs)
+        print('%-15s min %8.2f ms, avg %8.2f ms, %6d statements' % (
+            name, best * 1000, average * 1000, count))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+#    Copyright 2015 OpenStack Foundation
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Benchmark the Radware vDirect REST client against a local stub server.
+
+Starts a stub vDirect server on the loopback interface answering every
+request with a small JSON document, then reports the requests per second
+the REST client achieves when it opens a connection per request, as it
+used to, and when it keeps its connections alive. Requests are spread
+over several threads sharing the client, the way the driver and its
+operation completion thread do. With --certfile the stub server speaks
+HTTPS and the cost of the TLS handshakes is included.
+
+Usage: python tools/bench_vdirect_rest_client.py [--requests N]
+           [--threads N] [--pool-size N] [--certfile PEM]
+"""
+
+from __future__ import print_function
+
+import argparse
+import ssl
+import threading
+import time
+
+from six.moves import BaseHTTPServer
+from six.moves import socketserver
+
+import neutron_lbaas  # noqa
+from neutron_lbaas.drivers.radware import rest_client as rest
+
+RESPONSE = '{"complete": true, "success": true}'
+
+
+class StubHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # responses go out in a single write, small writes on a kept alive
+    # connection would wait for delayed acks
+    wbufsize = -1
+
+    def _respond(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if length:
+            self.rfile.read(length)
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(RESPONSE)))
+        self.end_headers()
+        self.wfile.write(RESPONSE)
+
+    do_GET = do_POST = do_PUT = do_DELETE = _respond
+
+    def log_message(self, *args):
+        pass
+
+
+class StubServer(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+
+def start_server(certfile):
+    server = StubServer(('127.0.0.1', 0), StubHandler)
+    if certfile:
+        server.socket = ssl.wrap_socket(server.socket, certfile=certfile,
+                                        server_side=True)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
+
+
+def measure(port, ssl_enabled, pool_size, request_count, thread_count):
+    client = rest.vDirectRESTClient(server='127.0.0.1', user='vDirect',
+                                    password='radware', port=port,
+                                    ssl=ssl_enabled, timeout=10,
+                                    pool_size=pool_size)
+    failures = []
+
+    def worker(count):
+        for _i in range(count):
+            if client.call('GET', '/api/status/', None,
+                           None)[rest.RESP_STATUS] != 200:
+                failures.append(1)
+
+    threads = [threading.Thread(target=worker,
+                                args=(request_count // thread_count,))
+               for _i in range(thread_count)]
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.time() - start
+    client.close()
+    done = request_count // thread_count * thread_count
+    return done / elapsed, len(failures)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--threads', type=int, default=2)
+    parser.add_argument('--pool-size', type=int, default=5)
+    parser.add_argument('--certfile',
+                        help='PEM file holding the certificate and key of '
+                             'the stub server, enables HTTPS')
+    args = parser.parse_args()
+
+    server = start_server(args.certfile)
+    port = server.server_address[1]
+    print('requests: %d, threads: %d, %s' % (
+        args.requests, args.threads, 'https' if args.certfile else 'http'))
+    for name, pool_size in (('per request', 0),
+                            ('kept alive', args.pool_size)):
+        rate, failures = measure(port, bool(args.certfile), pool_size,
+                                 args.requests, args.threads)
+        print('%-12s %10.1f requests/s, %d failures' % (name, rate,
+                                                        failures))
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()